@@ -0,0 +1,123 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A reproducible corpus of typical response bodies for benchmarking.
+
+The bodies are generated from a fixed seed, so that every run (and every
+machine) compresses exactly the same data.
+"""
+
+import json
+import random
+
+
+SEED = 20190101
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum "
+    "fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt "
+    "culpa qui officia deserunt mollit anim id est laborum"
+).split()
+
+
+def _sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(n // 2, n))).capitalize() + "."
+
+
+def html(rng, size):
+    parts = [
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+        "<title>%s</title>\n<link rel=\"stylesheet\" href=\"/static/site.css\">\n"
+        "</head>\n<body>\n<nav class=\"navbar navbar-expand\"><ul>" % _sentence(rng, 5)
+    ]
+    for i in range(8):
+        parts.append("<li class=\"nav-item\"><a class=\"nav-link\" href=\"/section/%d/\">%s</a></li>"
+                     % (i, rng.choice(WORDS)))
+    parts.append("</ul></nav>\n<main class=\"container\">\n")
+    length = sum(len(p) for p in parts)
+    while length < size:
+        row = (
+            "<div class=\"row\" id=\"item-%d\">\n  <h2 class=\"title\">%s</h2>\n"
+            "  <p class=\"text-muted\">%s %s</p>\n  <a class=\"btn btn-primary\" "
+            "href=\"/items/%d/\">Read more</a>\n</div>\n"
+            % (rng.randint(1, 99999), _sentence(rng, 6), _sentence(rng), _sentence(rng),
+               rng.randint(1, 99999))
+        )
+        parts.append(row)
+        length += len(row)
+    parts.append("</main>\n</body>\n</html>\n")
+    return "".join(parts).encode("utf-8")[:size]
+
+
+def json_api(rng, size):
+    items = []
+    length = 0
+    while length < size:
+        item = {
+            "id": rng.randint(1, 10 ** 7),
+            "name": _sentence(rng, 4),
+            "email": "%s.%s@example.com" % (rng.choice(WORDS), rng.choice(WORDS)),
+            "active": rng.random() < 0.8,
+            "score": round(rng.uniform(0, 100), 3),
+            "tags": [rng.choice(WORDS) for _ in range(rng.randint(0, 5))],
+            "created": "2024-%02d-%02dT%02d:%02d:%02dZ" % (
+                rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+                rng.randint(0, 59), rng.randint(0, 59)),
+        }
+        items.append(item)
+        length += len(json.dumps(item)) + 2
+    # The body stays valid JSON, so it is only approximately of the given size.
+    body = json.dumps({"count": len(items), "next": None, "results": items})
+    return body.encode("utf-8")
+
+
+def csv_export(rng, size):
+    lines = ["id,date,customer,product,quantity,unit_price,total"]
+    length = len(lines[0])
+    while length < size:
+        quantity = rng.randint(1, 50)
+        price = rng.randint(100, 100000) / 100
+        line = "%d,2024-%02d-%02d,%s %s,%s,%d,%.2f,%.2f" % (
+            rng.randint(1, 10 ** 6), rng.randint(1, 12), rng.randint(1, 28),
+            rng.choice(WORDS).title(), rng.choice(WORDS).title(), rng.choice(WORDS),
+            quantity, price, quantity * price,
+        )
+        lines.append(line)
+        length += len(line) + 1
+    return ("\n".join(lines) + "\n").encode("utf-8")[:size]
+
+
+def binaryish(rng, size):
+    # Mostly random bytes with some structure, like embedded images or
+    # encrypted blobs in an otherwise compressible payload.
+    out = bytearray()
+    while len(out) < size:
+        n = rng.randint(200, 2000)
+        out += rng.getrandbits(8 * n).to_bytes(n, "little")
+        out += b"\x00" * rng.randint(10, 200)
+    return bytes(out[:size])
+
+
+KINDS = {
+    "html": html,
+    "json": json_api,
+    "csv": csv_export,
+    "binary": binaryish,
+}
+
+SIZES = (1024, 16 * 1024, 256 * 1024, 4 * 1024 * 1024)
+
+
+def corpus(kinds=None, sizes=SIZES):
+    """Yield (kind, size, body) for every combination."""
+    for kind in kinds or sorted(KINDS):
+        for size in sizes:
+            rng = random.Random("%s-%s-%s" % (SEED, kind, size))
+            yield kind, size, KINDS[kind](rng, size)
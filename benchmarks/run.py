@@ -0,0 +1,197 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Benchmarks for the codecs and the middleware.
+
+Run from the project root:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --kinds json html --sizes 16384 --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Every codec in compression_middleware.registry is run directly at
+several levels, for bulk and streaming compression, and the whole middleware
+is run end to end. For each case the throughput (of uncompressed bytes), the
+latency percentiles, the compression ratio and the peak memory are reported.
+
+The peak memory is measured with tracemalloc, so it only includes memory
+allocated through Python (such as the output buffers), not the internal state
+of the compression libraries.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(DEBUG=False)
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+
+from compression_middleware import middleware
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.registry import registry
+
+from .corpus import KINDS, SIZES, corpus
+
+
+LEVELS = {
+    "zstd": (1, 3, 7, 12, 19),
+    "br": (0, 2, 4, 6, 9, 11),
+    "gzip": (1, 6, 9),
+}
+
+# Streaming responses are fed to the compressors in chunks of this size.
+CHUNK_SIZE = 8 * 1024
+
+
+def chunks(body):
+    return [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+
+
+def percentile(sorted_values, p):
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def measure(func, min_time, min_runs=3):
+    """Run func repeatedly and return (timings, result, peak_memory)."""
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = []
+    total = 0.0
+    while total < min_time or len(timings) < min_runs:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    return sorted(timings), result, peak
+
+
+def cases(kinds, sizes, encodings, paths):
+    request_factory = RequestFactory()
+    for kind, size, body in corpus(kinds, sizes):
+        for encoding, compress_func, stream_func, _ in registry.compressors():
+            if encoding not in encodings:
+                continue
+            for level in LEVELS[encoding]:
+                if "bulk" in paths:
+                    yield (kind, size, encoding, level, "bulk", body,
+                           lambda body=body, level=level: compress_func(body, level=level))
+                if "stream" in paths:
+                    yield (kind, size, encoding, level, "stream", body,
+                           lambda body=body, level=level: b"".join(
+                               stream_func(chunks(body), level=level)))
+            if "middleware" in paths:
+                request = request_factory.get("/", HTTP_ACCEPT_ENCODING=encoding)
+                bulk = CompressionMiddleware(lambda request, body=body: HttpResponse(body))
+                yield (kind, size, encoding, "-", "middleware", body,
+                       lambda: bulk(request).content)
+                streaming = CompressionMiddleware(
+                    lambda request, body=body: StreamingHttpResponse(chunks(body))
+                )
+                yield (kind, size, encoding, "-", "middleware-stream", body,
+                       lambda: b"".join(streaming(request)))
+
+
+def run(args):
+    results = []
+    for kind, size, encoding, level, path, body, func in cases(
+            args.kinds, args.sizes, args.encodings, args.paths):
+        timings, output, peak = measure(func, args.min_time)
+        median = percentile(timings, 50)
+        result = {
+            "kind": kind,
+            "size": size,
+            "encoding": encoding,
+            "level": level,
+            "path": path,
+            "runs": len(timings),
+            "mb_per_s": len(body) / median / 1e6,
+            "p50_ms": median * 1e3,
+            "p90_ms": percentile(timings, 90) * 1e3,
+            "p99_ms": percentile(timings, 99) * 1e3,
+            "ratio": len(output) / len(body),
+            "peak_kib": peak / 1024,
+        }
+        results.append(result)
+        print(
+            "%(kind)-7s %(size)8d %(encoding)-5s %(level)3s %(path)-17s "
+            "%(mb_per_s)9.1f MB/s  p50 %(p50_ms)9.3f ms  p90 %(p90_ms)9.3f ms  "
+            "p99 %(p99_ms)9.3f ms  ratio %(ratio)6.3f  peak %(peak_kib)9.1f KiB" % result
+        )
+        sys.stdout.flush()
+    return results
+
+
+def key(result):
+    return tuple(str(result[k]) for k in ("kind", "size", "encoding", "level", "path"))
+
+
+def compare(results, baseline, tolerance):
+    """Print cases that got slower or compress worse than the baseline."""
+    baseline = {key(r): r for r in baseline}
+    regressions = 0
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        if result["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            regressions += 1
+            print("SLOWER: %s  p50 %.3f ms -> %.3f ms" % (
+                " ".join(key(result)), old["p50_ms"], result["p50_ms"]))
+        if result["ratio"] > old["ratio"] * (1 + tolerance / 10):
+            regressions += 1
+            print("WORSE RATIO: %s  %.4f -> %.4f" % (
+                " ".join(key(result)), old["ratio"], result["ratio"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kinds", nargs="+", choices=sorted(KINDS), default=sorted(KINDS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--encodings", nargs="+", default=[c[0] for c in registry.compressors()])
+    parser.add_argument(
+        "--paths", nargs="+", default=["bulk", "stream", "middleware"],
+        choices=["bulk", "stream", "middleware"],
+    )
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum seconds to spend per case")
+    parser.add_argument("--save", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare with results saved earlier, and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown tolerated by --compare")
+    args = parser.parse_args(argv)
+
+    # Measure the compression itself, not the shortcuts around it.
+    middleware.CACHE_MAX_BYTES = 0
+    middleware.METRICS = None
+
+    results = run(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,32 +4,57 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-__all__ = ["brotli_compress", "brotli_compress_stream"]
+__all__ = ["brotli_compress", "brotli_compress_stream", "brotli_compress_stream_async"]
 
 
 from brotli import compress, Compressor
 
+from .flush import coalesce, coalesce_async
 
-DEFAULT_LEVEL = 4
 
+DEFAULT_LEVEL = 4
 
-def brotli_compress(content):
-    return compress(content, quality=DEFAULT_LEVEL)
 
+def brotli_compress(content, level=None):
+    return compress(content, quality=DEFAULT_LEVEL if level is None else level)
 
-def brotli_compress_stream(sequence):
-    yield b""
 
-    compressor = Compressor(quality=DEFAULT_LEVEL)
+def _process_method(compressor):
     try:
         # Brotli bindings
-        process = compressor.process
+        return compressor.process
     except AttributeError:
         # brotlipy
-        process = compressor.compress
+        return compressor.compress
+
+
+def brotli_compress_stream(sequence, level=None, flush=None):
+    yield b""
+
+    compressor = Compressor(quality=DEFAULT_LEVEL if level is None else level)
+    process = _process_method(compressor)
+
+    for data, flush_now in coalesce(sequence, flush):
+        out = process(data)
+        if flush_now:
+            out += compressor.flush()
+        if out:
+            yield out
+    out = compressor.finish()
+    if out:
+        yield out
+
+
+async def brotli_compress_stream_async(sequence, level=None, flush=None):
+    yield b""
+
+    compressor = Compressor(quality=DEFAULT_LEVEL if level is None else level)
+    process = _process_method(compressor)
 
-    for item in sequence:
-        out = process(item)
+    async for data, flush_now in coalesce_async(sequence, flush):
+        out = process(data)
+        if flush_now:
+            out += compressor.flush()
         if out:
             yield out
     out = compressor.finish()
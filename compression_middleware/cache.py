@@ -0,0 +1,155 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["CompressedContentCache", "SharedContentCache", "content_digest"]
+
+
+from collections import OrderedDict
+from hashlib import blake2b
+import logging
+import threading
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(*chunks):
+    """A short digest identifying the given content (in one or more chunks)."""
+    digest = blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.digest()
+
+
+class CompressedContentCache(object):
+    """
+    A bounded LRU cache of compressed content.
+
+    Entries are keyed by the digest of the uncompressed content and the
+    encoding. The total size of the stored compressed content is kept under
+    max_bytes by evicting the least recently used entries. The cache is safe to
+    share between threads.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        # Don't let a single entry flush out a big part of the cache:
+        self.max_entry_bytes = max_bytes // 8
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+
+class SharedContentCache(object):
+    """
+    Compressed content kept in one of Django's caches (see the CACHES
+    setting), so that worker processes using the same cache backend share it.
+
+    Entries are keyed by the encoding and either the strong ETag of the
+    response (with the URL, since an ETag is only unique per resource) or a
+    digest of the uncompressed content. Entries larger than max_entry_bytes
+    are not stored, and expire after timeout seconds (by default that of the
+    cache backend). Errors of the cache backend are logged and treated as
+    misses, so that an unavailable cache doesn't break responses.
+    """
+
+    key_prefix = "compression_middleware"
+
+    def __init__(self, alias, max_entry_bytes, timeout=DEFAULT_TIMEOUT):
+        self.alias = alias
+        self.max_entry_bytes = max_entry_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        # The cache objects aren't thread-safe, so Django keeps one per thread.
+        return caches[self.alias]
+
+    def key(self, chunks, encoding, etag=None, url="", dictionary_hash=None):
+        if etag and etag.startswith('"'):
+            digest = blake2b(digest_size=16)
+            for part in (url, "\n", etag):
+                digest.update(part.encode("utf-8"))
+            identity = "e" + digest.hexdigest()
+        else:
+            identity = "c" + content_digest(*chunks).hex()
+        if dictionary_hash is not None:
+            identity += "-" + dictionary_hash.hex()
+        return "%s:%s:%s" % (self.key_prefix, encoding, identity)
+
+    def get(self, key):
+        try:
+            value = self.cache.get(key)
+        except Exception:
+            logger.warning("Can't get compressed content from the cache", exc_info=True)
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if len(value) > self.max_entry_bytes:
+            return
+        try:
+            self.cache.set(key, value, self.timeout)
+        except Exception:
+            logger.warning("Can't store compressed content in the cache", exc_info=True)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
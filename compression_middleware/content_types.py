@@ -0,0 +1,43 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["ContentTypeFilter", "mime_type"]
+
+
+def mime_type(content_type):
+    """Obtain 'text/html' out of 'text/html; charset=utf-8' or similar."""
+    return content_type.split(";", 1)[0].strip().lower()
+
+
+class ContentTypeFilter(object):
+    """
+    Decides whether responses of a given content type should be compressed.
+
+    Both include and exclude are collections of MIME types such as "image/png"
+    or wildcards such as "image/*". An exact match is stronger than a wildcard,
+    and an include is stronger than an exclude of the same kind, so that
+    ("image/svg+xml",) can be included while ("image/*",) is excluded. Content
+    types that don't match anything are compressed.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = frozenset(t.lower() for t in include if not t.endswith("/*"))
+        self.exclude = frozenset(t.lower() for t in exclude if not t.endswith("/*"))
+        self.include_major = frozenset(t[:-2].lower() for t in include if t.endswith("/*"))
+        self.exclude_major = frozenset(t[:-2].lower() for t in exclude if t.endswith("/*"))
+
+    def __call__(self, content_type):
+        if not content_type:
+            return True
+        mime = mime_type(content_type)
+        if mime in self.include:
+            return True
+        if mime in self.exclude:
+            return False
+        major = mime.split("/", 1)[0]
+        if major in self.include_major:
+            return True
+        return major not in self.exclude_major
@@ -6,9 +6,23 @@ __all__ = ["compress_page"]
 
 
 from .middleware import CompressionMiddleware
-from django.utils.decorators import decorator_from_middleware
+from django.utils.decorators import (
+    decorator_from_middleware, decorator_from_middleware_with_args,
+)
 
 
-compress_page = decorator_from_middleware(CompressionMiddleware)
-compress_page.__doc__ = "Decorator to compress the view response if the client supports it."
+_compress_page = decorator_from_middleware(CompressionMiddleware)
+_compress_page_with_args = decorator_from_middleware_with_args(CompressionMiddleware)
 
+
+def compress_page(view_func=None, **options):
+    """
+    Decorator to compress the view response if the client supports it.
+
+    It can be used as @compress_page, or with options that override the
+    COMPRESSION_MIDDLEWARE settings for the view, such as
+    @compress_page(encodings=["br", "gzip"], levels={"br": 11}, min_len=1000).
+    """
+    if view_func is None:
+        return _compress_page_with_args(**options)
+    return _compress_page(view_func)
@@ -0,0 +1,146 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compression Dictionary Transport (RFC 9842).
+
+A client that has a dictionary from an earlier response advertises it with the
+Available-Dictionary header (the SHA-256 hash of the dictionary) and indicates
+support for the "dcz" encoding. Responses can then be compressed with zstd
+using the dictionary, which makes small, repetitive responses (such as JSON
+from an API) a lot smaller.
+
+Dictionaries can be trained offline from sample responses:
+
+    python -m compression_middleware.dictionary -o api.dict samples/*.json
+
+The "dcb" encoding (Brotli with a dictionary) is not supported, since the
+Brotli bindings don't support shared dictionaries.
+"""
+
+__all__ = ["Dictionary", "load_dictionary", "train_dictionary"]
+
+
+import argparse
+from base64 import b64encode
+from functools import lru_cache
+from hashlib import sha256
+import re
+import sys
+
+import zstandard as zstd
+
+from .pool import ContextPool
+from .zstd import DEFAULT_LEVEL, POOL_SIZE, pooled_stream, pooled_stream_async
+
+
+# the size of trained dictionaries
+DEFAULT_SIZE = 64 * 1024
+
+# A skippable zstd frame carrying the hash of the dictionary is prepended to
+# dcz content. This is its header.
+_DCZ_MAGIC = b"\x5e\x2a\x4d\x18\x20\x00\x00\x00"
+
+
+def _pattern_regex(match):
+    # Only "*" is special in the URL patterns that we support.
+    return re.compile("^" + ".*".join(re.escape(part) for part in match.split("*")) + "$")
+
+
+class Dictionary(object):
+    """
+    A compression dictionary for the responses of the URLs matching a pattern.
+
+    The match pattern is a path that may contain "*" wildcards, such as
+    "/api/*". If a URL is given, it is where clients can fetch the dictionary
+    (see compression_middleware.views.dictionary).
+    """
+
+    def __init__(self, data, match, id="", url=None):
+        self.data = data
+        self.match = match
+        self.id = id
+        self.url = url
+        self.hash = sha256(data).digest()
+        # as a structured field byte sequence, as in Available-Dictionary
+        self.available_dictionary = ":%s:" % b64encode(self.hash).decode("ascii")
+        self.hex_hash = self.hash.hex()
+        self._regex = _pattern_regex(match)
+        self._dict_data = zstd.ZstdCompressionDict(data, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+        self._header = _DCZ_MAGIC + self.hash
+        self.pool = ContextPool(self._compressor, POOL_SIZE)
+        # the tuple as used by compression_middleware.middleware.compressors_for()
+        self.compressors = (
+            "dcz", self.compress, self.compress_stream, self.compress_stream_async
+        )
+
+    def matches(self, path):
+        return bool(self._regex.match(path))
+
+    def use_as_dictionary(self):
+        """The value of the Use-As-Dictionary header when serving it."""
+        value = 'match="%s"' % self.match.replace("\\", "\\\\").replace('"', '\\"')
+        if self.id:
+            value += ', id="%s"' % self.id.replace("\\", "\\\\").replace('"', '\\"')
+        return value
+
+    def _compressor(self, level):
+        params = zstd.ZstdCompressionParameters.from_level(level)
+        # The window has to cover the dictionary, otherwise the start of the
+        # dictionary can't be referenced.
+        window_log = max(params.window_log, (len(self.data) * 5 // 4).bit_length())
+        params = zstd.ZstdCompressionParameters.from_level(
+            level, window_log=window_log, write_dict_id=False
+        )
+        return zstd.ZstdCompressor(dict_data=self._dict_data, compression_params=params)
+
+    def compress(self, content, level=None):
+        with self.pool.context(DEFAULT_LEVEL if level is None else level) as cctx:
+            return self._header + cctx.compress(content)
+
+    def compress_stream(self, sequence, level=None, flush=None):
+        return pooled_stream(self.pool, sequence, level, flush, self._header)
+
+    def compress_stream_async(self, sequence, level=None, flush=None):
+        return pooled_stream_async(self.pool, sequence, level, flush, self._header)
+
+
+@lru_cache(maxsize=None)
+def load_dictionary(path, match, id="", url=None):
+    """Load the dictionary from a file (only once)."""
+    with open(path, "rb") as f:
+        return Dictionary(f.read(), match, id=id, url=url)
+
+
+def train_dictionary(samples, size=DEFAULT_SIZE):
+    """Train a dictionary from a list of sample responses."""
+    return zstd.train_dictionary(size, samples).as_bytes()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Train a compression dictionary from sample responses."
+    )
+    parser.add_argument("samples", nargs="+", help="files with sample responses")
+    parser.add_argument("-o", "--output", required=True, help="the dictionary file to write")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help="the size of the dictionary in bytes")
+    args = parser.parse_args(argv)
+
+    samples = []
+    for name in args.samples:
+        with open(name, "rb") as f:
+            samples.append(f.read())
+    data = train_dictionary(samples, args.size)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print("Wrote %d bytes to %s (sha-256 %s)" % (
+        len(data), args.output, sha256(data).hexdigest()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Support for serving files (FileResponse) in compressed form without
+compressing them on every request.
+"""
+
+__all__ = ["CompressedFileCache", "file_path", "find_precompressed", "swap_file"]
+
+
+from hashlib import sha256
+import logging
+import os
+import tempfile
+import time
+
+
+# Files being written to the cache have names starting with this. Temporary
+# files older than STALE_SECONDS were left behind by a crashed worker or an
+# aborted download and are removed during eviction.
+TEMP_PREFIX = ".tmp-"
+STALE_SECONDS = 3600
+
+# file name extensions of the cached files, for the convenience of humans
+EXTENSIONS = {
+        "zstd": ".zst",
+        "br": ".br",
+        "gzip": ".gz",
+}
+
+
+logger = logging.getLogger(__name__)
+
+
+def file_path(response):
+    """The path of the file streamed by a FileResponse, or None."""
+    filelike = getattr(response, "file_to_stream", None)
+    name = getattr(filelike, "name", None)
+    if not isinstance(name, str) or not name:
+        return None
+    return name
+
+
+def find_precompressed(path, encodings, extensions):
+    """
+    Find a compressed sibling of the file at path, such as "report.csv.zst"
+    next to "report.csv".
+
+    The encodings are tried in order, and the first fresh sibling is returned
+    as (encoding, sibling_path, size). A sibling is considered fresh if it
+    isn't older than the file and is smaller than it. Returns None if there
+    is no usable sibling.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    for encoding in encodings:
+        extension = extensions.get(encoding)
+        if not extension:
+            continue
+        sibling = path + extension
+        try:
+            sibling_stat = os.stat(sibling)
+        except OSError:
+            continue
+        if (sibling_stat.st_mtime >= stat.st_mtime
+                and 0 < sibling_stat.st_size < stat.st_size):
+            return encoding, sibling, sibling_stat.st_size
+    return None
+
+
+def swap_file(response, filelike, size):
+    """
+    Make the FileResponse stream the given (open) file instead.
+
+    The file is still streamed as a file, so the server's wsgi.file_wrapper
+    (and sendfile) can be used. The headers that FileResponse derives from the
+    file name are left as they were for the original file.
+    """
+    content_type = response.get("Content-Type")
+    content_disposition = response.get("Content-Disposition")
+    response.streaming_content = filelike
+    if content_type is not None:
+        response["Content-Type"] = content_type
+    if content_disposition is not None:
+        response["Content-Disposition"] = content_disposition
+    elif response.has_header("Content-Disposition"):
+        del response["Content-Disposition"]
+    response["Content-Length"] = str(size)
+
+
+class CompressedFileCache(object):
+    """
+    A cache of compressed files in a directory on disk.
+
+    Entries are keyed by the path, modification time and size of the original
+    file, and the encoding, so a modified file is never served from the cache.
+    The cache is filled while the compressed file is streamed to the first
+    client, and later requests are served from the cached file directly.
+
+    Files are written under a temporary name and renamed into place when
+    complete, so the cache can be shared by several worker processes. The
+    total size of the directory is kept under max_bytes by removing the least
+    recently used files.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Don't let a single file flush out a big part of the cache:
+        self.max_entry_bytes = max_bytes // 8
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path, encoding):
+        """
+        The name of the cache file for the current version of the file at
+        path, or None if the file can't (or shouldn't) be cached.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size > self.max_entry_bytes:
+            return None
+        identity = "%s\0%d\0%d\0%s" % (
+            os.path.abspath(path), stat.st_mtime_ns, stat.st_size, encoding
+        )
+        digest = sha256(identity.encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, digest + EXTENSIONS.get(encoding, ""))
+
+    def get(self, key):
+        """The cached file opened for reading and its size, or None."""
+        try:
+            f = open(key, "rb")
+        except OSError:
+            return None
+        try:
+            size = os.fstat(f.fileno()).st_size
+            # mark it as recently used
+            os.utime(key)
+        except OSError:
+            pass
+        return f, size
+
+    def fill(self, key, path, encoding, sequence):
+        """
+        Pass through the compressed sequence while writing it to the cache.
+
+        The cache file is only put in place if the sequence was consumed
+        completely and the original file didn't change in the meantime.
+        Errors while writing don't affect the response.
+        """
+        try:
+            fd, temp = tempfile.mkstemp(dir=self.directory, prefix=TEMP_PREFIX)
+        except OSError:
+            logger.warning("Can't write to the file cache in %s", self.directory, exc_info=True)
+            yield from sequence
+            return
+        f = os.fdopen(fd, "wb")
+        complete = False
+        try:
+            for chunk in sequence:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                    except OSError:
+                        logger.warning("Can't write to the file cache", exc_info=True)
+                        f.close()
+                        f = None
+                yield chunk
+            complete = f is not None
+        finally:
+            if f is not None:
+                f.close()
+            if complete and self.key(path, encoding) == key:
+                os.replace(temp, key)
+                self.evict()
+            else:
+                try:
+                    os.unlink(temp)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits."""
+        entries = []
+        total = 0
+        stale = time.time() - STALE_SECONDS
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.startswith(TEMP_PREFIX):
+                    if stat.st_mtime < stale:
+                        self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(name)
+            total -= size
+
+    def _remove(self, name):
+        try:
+            os.unlink(name)
+        except OSError:
+            # probably removed by another worker
+            pass
@@ -0,0 +1,139 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+When to flush the compressor of a streaming response.
+
+Without flushing, output is only sent when the compressor produces it, which
+gives the best compression ratio. But for server-sent events, long polls or
+progressive HTML, the client should receive what was produced so far. Every
+flush costs a few bytes and limits the compression ratio.
+"""
+
+__all__ = ["FlushPolicy", "EVERY_CHUNK", "coalesce", "coalesce_async"]
+
+
+import asyncio
+import time
+
+
+# Small chunks are joined up to this size before compressing them, since
+# every call to the compressor has some overhead. Chunks are not held back
+# for a flush.
+COALESCE_SIZE = 16 * 1024
+
+
+class FlushPolicy(object):
+    """
+    Flush once size bytes were compressed since the previous flush (0 means
+    after every chunk), or once interval seconds have passed since the
+    previous flush, whichever comes first.
+
+    For streams with synchronous iterators, the interval can only be checked
+    when a chunk arrives. With asynchronous iterators, pending output is also
+    flushed if no chunk arrives in time.
+    """
+
+    def __init__(self, size=None, interval=None):
+        self.size = size
+        self.interval = interval
+
+    def __repr__(self):
+        return "FlushPolicy(size=%r, interval=%r)" % (self.size, self.interval)
+
+    def due(self, unflushed, elapsed):
+        if self.size is not None and unflushed >= self.size:
+            return True
+        return self.interval is not None and elapsed >= self.interval
+
+
+EVERY_CHUNK = FlushPolicy(size=0)
+
+
+class _Coalescer(object):
+
+    def __init__(self, flush):
+        self.flush = flush
+        self.pending = []
+        self.pending_size = 0
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, item):
+        """Add a chunk, and return (data, flush) if it's time to pass it on."""
+        self.pending.append(item)
+        self.pending_size += len(item)
+        self.unflushed += len(item)
+        flush = self.flush is not None and self.flush.due(
+            self.unflushed, time.monotonic() - self.last_flush
+        )
+        if flush or self.pending_size >= COALESCE_SIZE:
+            return self.take(flush)
+        return None
+
+    def take(self, flush):
+        data = b"".join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        if flush:
+            self.unflushed = 0
+            self.last_flush = time.monotonic()
+        return data, flush
+
+
+def coalesce(sequence, flush=None):
+    """
+    Yield (data, flush) for the chunks of the sequence, with small chunks
+    joined, where flush indicates whether the compressor should be flushed
+    after compressing the data.
+    """
+    coalescer = _Coalescer(flush)
+    for item in sequence:
+        if not item:
+            continue
+        out = coalescer.add(item)
+        if out is not None:
+            yield out
+    if coalescer.pending:
+        yield coalescer.take(False)
+
+
+async def coalesce_async(sequence, flush=None):
+    """Like coalesce(), but for asynchronous iterators."""
+    coalescer = _Coalescer(flush)
+    interval = flush.interval if flush is not None else None
+    iterator = sequence.__aiter__()
+    next_item = None
+    try:
+        while True:
+            if interval is not None and coalescer.unflushed:
+                # Wait for the next chunk only until the next flush is due.
+                if next_item is None:
+                    next_item = asyncio.ensure_future(iterator.__anext__())
+                remaining = interval - (time.monotonic() - coalescer.last_flush)
+                done, _ = await asyncio.wait((next_item,), timeout=max(remaining, 0))
+                if not done:
+                    yield coalescer.take(True)
+                    continue
+            try:
+                if next_item is not None:
+                    item = await next_item
+                else:
+                    item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                next_item = None
+            if not item:
+                continue
+            out = coalescer.add(item)
+            if out is not None:
+                yield out
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+    if coalescer.pending:
+        yield coalescer.take(False)
@@ -0,0 +1,136 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A process-wide governor that sheds compression work under overload.
+
+The time spent compressing is tracked over a sliding window. While it exceeds
+the budget, the governor degrades one stage at a time:
+
+ - normal: the usual levels
+ - low: the lowest level of each encoding
+ - fastest: gzip at level 1 if the client accepts it
+ - shed: responses that aren't critical are not compressed
+
+Once the load stays well below the budget, it recovers one stage at a time.
+"""
+
+__all__ = [
+        "Governor",
+        "process_governor",
+        "STAGE_NORMAL",
+        "STAGE_LOW",
+        "STAGE_FASTEST",
+        "STAGE_SHED",
+]
+
+
+from collections import deque
+import threading
+import time
+
+
+STAGE_NORMAL = 0
+STAGE_LOW = 1
+STAGE_FASTEST = 2
+STAGE_SHED = 3
+
+STAGE_NAMES = ("normal", "low", "fastest", "shed")
+
+# The length (in seconds) of the sliding window over which the load is
+# measured. A stage has to be kept this long before recovering from it.
+WINDOW = 5.0
+
+# A stage is kept at least this long (in seconds) before degrading further,
+# so that the effect of the previous stage can be measured.
+MIN_OBSERVATION = 1.0
+
+# The load has to drop below this fraction of the budget to recover.
+RECOVERY_RATIO = 0.5
+
+
+class Governor(object):
+    """
+    Tracks the time spent compressing in this process, and chooses the stage
+    of degradation.
+
+    The budget is the number of seconds spent compressing per second, so 0.5
+    is half a core.
+    """
+
+    def __init__(self, budget, window=WINDOW):
+        self.budget = budget
+        self.window = window
+        self.load = 0.0
+        self._stage = STAGE_NORMAL
+        self._changed = time.monotonic()
+        self._checked = self._changed
+        # [second, seconds spent compressing in that second]
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Record the time spent on compressing a response."""
+        now = time.monotonic()
+        second = int(now)
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += seconds
+            else:
+                self._buckets.append([second, seconds])
+        self._update(now)
+
+    def stage(self):
+        """The current stage of degradation."""
+        self._update(time.monotonic())
+        return self._stage
+
+    def _update(self, now):
+        if now - self._checked < 1.0:
+            return
+        with self._lock:
+            self._checked = now
+            while self._buckets and self._buckets[0][0] < now - self.window:
+                self._buckets.popleft()
+            # Only what happened since the last change of stage counts.
+            start = max(now - self.window, self._changed)
+            used = sum(seconds for second, seconds in self._buckets)
+            self.load = used / max(now - start, 1.0)
+            observed = now - self._changed
+            stage = self._stage
+            if self.load > self.budget:
+                if observed >= MIN_OBSERVATION and stage < STAGE_SHED:
+                    stage += 1
+            elif self.load < self.budget * RECOVERY_RATIO:
+                if observed >= self.window and stage > STAGE_NORMAL:
+                    stage -= 1
+            if stage != self._stage:
+                self._stage = stage
+                self._changed = now
+                self._buckets.clear()
+
+    def state(self):
+        """The current state, for monitoring."""
+        stage = self.stage()
+        return {
+            "stage": STAGE_NAMES[stage],
+            "load": self.load,
+            "budget": self.budget,
+            "since": time.monotonic() - self._changed,
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def process_governor(budget):
+    """The governor shared by all middleware instances in this process."""
+    global _governor
+    with _governor_lock:
+        if _governor is None or _governor.budget != budget:
+            _governor = Governor(budget)
+        return _governor
@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = [
+        "gzip_compress",
+        "gzip_compress_parallel",
+        "gzip_compress_stream",
+        "gzip_compress_stream_async",
+]
+
+
+from concurrent.futures import ThreadPoolExecutor
+import struct
+import threading
+import zlib
+
+from .flush import coalesce, coalesce_async
+
+
+DEFAULT_LEVEL = 6
+
+# zlib's memLevel (1-9): how much memory to use for the internal compression
+# state. 9 is slightly faster with a slightly better ratio than zlib's default
+# of 8, at the cost of 128 KiB more memory per stream.
+DEFAULT_MEM_LEVEL = 9
+
+# Size of the blocks that are deflated independently in parallel compression.
+PARALLEL_BLOCK_SIZE = 128 * 1024
+
+# Each block is primed with the preceding 32 KiB (the deflate window) so that
+# the compression ratio hardly suffers from the split.
+_WINDOW_SIZE = 32 * 1024
+
+# zlib produces a gzip header and trailer with this many window bits
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# magic, method, flags, mtime=0, extra flags, OS=unknown
+_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+# The modification time in the gzip header is 0, since anything else would
+# make the results non-deterministic (and would break ETags).
+
+def _compressobj(level, mem_level, wbits=_GZIP_WBITS, **kwargs):
+    return zlib.compressobj(
+        DEFAULT_LEVEL if level is None else level,
+        zlib.DEFLATED,
+        wbits,
+        DEFAULT_MEM_LEVEL if mem_level is None else mem_level,
+        **kwargs
+    )
+
+
+def gzip_compress(content, level=None, mem_level=None):
+    compressobj = _compressobj(level, mem_level)
+    return compressobj.compress(content) + compressobj.flush()
+
+
+def gzip_compress_stream(sequence, level=None, mem_level=None, flush=None):
+    yield b""
+
+    compressobj = _compressobj(level, mem_level)
+    for data, flush_now in coalesce(sequence, flush):
+        out = compressobj.compress(data)
+        if flush_now:
+            out += compressobj.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressobj.flush()
+
+
+async def gzip_compress_stream_async(sequence, level=None, mem_level=None, flush=None):
+    yield b""
+
+    compressobj = _compressobj(level, mem_level)
+    async for data, flush_now in coalesce_async(sequence, flush):
+        out = compressobj.compress(data)
+        if flush_now:
+            out += compressobj.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressobj.flush()
+
+
+def _executor(threads):
+    with _executors_lock:
+        executor = _executors.get(threads)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=threads)
+            _executors[threads] = executor
+        return executor
+
+
+def _deflate_block(view, start, end, level):
+    if start:
+        zdict = bytes(view[max(0, start - _WINDOW_SIZE):start])
+        cobj = _compressobj(level, None, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        cobj = _compressobj(level, None, -zlib.MAX_WBITS)
+    data = cobj.compress(view[start:end])
+    if end >= len(view):
+        return data + cobj.flush(zlib.Z_FINISH)
+    # A sync flush ends the block on a byte boundary without ending the deflate
+    # stream, so that the blocks can simply be concatenated.
+    return data + cobj.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_compress_parallel(content, threads, level=None):
+    """
+    Compress content in blocks on a pool of threads (like pigz).
+
+    The result is a single, standard gzip member.
+    """
+    view = memoryview(content)
+    starts = range(0, max(len(view), 1), PARALLEL_BLOCK_SIZE)
+    executor = _executor(threads)
+    futures = [
+        executor.submit(_deflate_block, view, start, start + PARALLEL_BLOCK_SIZE, level)
+        for start in starts
+    ]
+    # zlib releases the GIL, so we can checksum while the workers compress.
+    trailer = struct.pack("<II", zlib.crc32(view) & 0xffffffff, len(view) & 0xffffffff)
+    return b"".join([_HEADER] + [f.result() for f in futures] + [trailer])
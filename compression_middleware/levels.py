@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["LevelPolicy", "is_cacheable"]
+
+
+import re
+
+from .governor import STAGE_LOW
+
+
+# Responses up to this length are considered small. If they are also cacheable,
+# a higher level is worth it, since the result is reused.
+SMALL_LEN = 16 * 1024
+
+# Responses of at least this length are considered large, and are compressed at
+# a lower level to limit the time spent on them.
+LARGE_LEN = 1024 * 1024
+
+# compression levels per encoding:
+# (small and cacheable, normal, large, lowest)
+# The normal levels are the DEFAULT_LEVEL of each codec. The codecs aren't
+# imported here, so that they are only loaded when they are used.
+LEVELS = {
+        "zstd": (12, 7, 3, 1),
+        "dcz": (12, 7, 3, 1),
+        "br": (9, 4, 2, 0),
+        "gzip": (9, 6, 4, 1),
+}
+
+_max_age_re = re.compile(r"\bs?-?max-?age\s*=\s*(\d+)")
+
+
+def is_cacheable(response):
+    """Guess whether downstream caches will reuse the response."""
+    cache_control = response.get("Cache-Control")
+    if not cache_control:
+        return False
+    cache_control = cache_control.lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return False
+    if "private" in cache_control:
+        return False
+    return any(int(age) > 0 for age in _max_age_re.findall(cache_control))
+
+
+class LevelPolicy(object):
+    """
+    Chooses the compression level for each response.
+
+    The level is chosen based on the size of the content and whether the
+    response is cacheable. If a governor is given (see
+    compression_middleware.governor), the lowest levels are used while it is
+    degraded, and the compression time is recorded with it.
+    """
+
+    def __init__(self, levels=None, governor=None):
+        self.levels = LEVELS if levels is None else levels
+        self.governor = governor
+
+    def level(self, encoding, length=None, cacheable=False):
+        """
+        The level to compress content of the given length with.
+
+        The length is None for streaming responses. None is returned for
+        encodings without levels.
+        """
+        levels = self.levels.get(encoding)
+        if levels is None:
+            # The codec has no table of levels, so it uses its default level.
+            return None
+        small, normal, large, lowest = levels
+        if self.governor is not None and self.governor.stage() >= STAGE_LOW:
+            return lowest
+        if length is None:
+            return normal
+        if length <= SMALL_LEN and cacheable:
+            return small
+        if length >= LARGE_LEN:
+            return large
+        return normal
+
+    def record(self, seconds):
+        """Record the time spent on compressing a response."""
+        if self.governor is not None:
+            self.governor.record(seconds)
@@ -0,0 +1,235 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = [
+        "Metrics",
+        "default_metrics",
+        "metered_stream",
+        "metered_stream_async",
+        "server_timing",
+        "SKIP_ENCODED",
+        "SKIP_CONTENT_TYPE",
+        "SKIP_MIN_LEN",
+        "SKIP_NO_ENCODING",
+        "SKIP_PROBE",
+        "SKIP_IMPROVEMENT",
+        "SKIP_OVERLOAD",
+        "SKIP_ROUTE",
+]
+
+
+from collections import defaultdict
+import threading
+import time
+
+
+# Reasons for not compressing a response:
+# - the response already has a Content-Encoding
+SKIP_ENCODED = "encoded"
+# - the content type is excluded
+SKIP_CONTENT_TYPE = "content_type"
+# - the response is shorter than MIN_LEN
+SKIP_MIN_LEN = "min_len"
+# - no encoding in common with the client
+SKIP_NO_ENCODING = "no_encoding"
+# - the compressibility probe predicted too little improvement
+SKIP_PROBE = "probe"
+# - compression didn't improve the size by at least MIN_IMPROVEMENT
+SKIP_IMPROVEMENT = "improvement"
+# - the response isn't critical, and compression is shed under overload
+SKIP_OVERLOAD = "overload"
+# - responses of the route keep failing to compress by MIN_IMPROVEMENT
+SKIP_ROUTE = "route"
+
+
+class Metrics(object):
+    """
+    An in-process aggregator of compression metrics.
+
+    Per encoding it counts the compressed responses (also per level), the
+    bytes before and after compression and the time spent compressing.
+    Responses that weren't compressed are counted per reason, together with
+    the time wasted on compression that was thrown away.
+
+    Any object with the methods compressed() and skipped() can be used in its
+    place to send the measurements somewhere else.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.responses = defaultdict(int)   # (encoding, level) -> count
+            self.bytes_in = defaultdict(int)    # encoding -> bytes
+            self.bytes_out = defaultdict(int)   # encoding -> bytes
+            self.seconds = defaultdict(float)   # encoding -> seconds
+            self.skips = defaultdict(int)       # reason -> count
+            self.wasted_seconds = defaultdict(float)  # reason -> seconds
+
+    def compressed(self, encoding, level, bytes_in, bytes_out, seconds):
+        """Record a compressed response."""
+        with self._lock:
+            self.responses[(encoding, level)] += 1
+            self.bytes_in[encoding] += bytes_in
+            self.bytes_out[encoding] += bytes_out
+            self.seconds[encoding] += seconds
+
+    def skipped(self, reason, seconds=0.0):
+        """Record a response that wasn't compressed."""
+        with self._lock:
+            self.skips[reason] += 1
+            if seconds:
+                self.wasted_seconds[reason] += seconds
+
+    def samples(self):
+        """
+        A list of (name, labels, value) for every counter.
+
+        This is meant for exporting to monitoring systems.
+        """
+        samples = []
+        with self._lock:
+            for (encoding, level), count in sorted(self.responses.items()):
+                samples.append(("responses", {"encoding": encoding, "level": str(level)}, count))
+            for encoding in sorted(self.bytes_in):
+                labels = {"encoding": encoding}
+                samples.append(("bytes_in", labels, self.bytes_in[encoding]))
+                samples.append(("bytes_out", labels, self.bytes_out[encoding]))
+                samples.append(("seconds", labels, self.seconds[encoding]))
+            for reason, count in sorted(self.skips.items()):
+                samples.append(("skipped", {"reason": reason}, count))
+            for reason, seconds in sorted(self.wasted_seconds.items()):
+                samples.append(("wasted_seconds", {"reason": reason}, seconds))
+        return samples
+
+    def snapshot(self):
+        """A dictionary of the current values, keyed by name and labels."""
+        return {
+            (name, tuple(sorted(labels.items()))): value
+            for name, labels, value in self.samples()
+        }
+
+    def prometheus(self, prefix="compression_"):
+        """The counters in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for name, labels, value in self.samples():
+            name = prefix + name + "_total"
+            if name not in seen:
+                seen.add(name)
+                lines.append("# TYPE %s counter" % name)
+            labels = ",".join('%s="%s"' % item for item in sorted(labels.items()))
+            lines.append("%s{%s} %s" % (name, labels, value))
+        return "\n".join(lines) + "\n"
+
+
+default_metrics = Metrics()
+
+
+def server_timing(seconds, encoding=None, level=None, bytes_in=None, bytes_out=None,
+        reason=None):
+    """
+    A Server-Timing entry describing the compression of a response, such as
+    'compress;dur=1.2;desc="br q4 10000>6100 61%"', or
+    'compress;dur=0.0;desc="skip min_len"' if it wasn't compressed. The
+    duration is left out if seconds is None.
+    """
+    if reason is not None:
+        description = "skip " + reason
+    else:
+        parts = [encoding]
+        if isinstance(level, int):
+            parts.append("q%d" % level)
+        elif level is not None:
+            parts.append(str(level))
+        if bytes_in is not None and bytes_out is not None:
+            parts.append("%d>%d" % (bytes_in, bytes_out))
+            if bytes_in:
+                parts.append("%d%%" % round(100 * bytes_out / bytes_in))
+        description = " ".join(parts)
+    if seconds is None:
+        return 'compress;desc="%s"' % description
+    return 'compress;dur=%.1f;desc="%s"' % (seconds * 1000, description)
+
+
+class _StreamMeter(object):
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.upstream_seconds = 0.0
+        self.seconds = 0.0
+
+
+# The stream compressors pull chunks from the original iterator, so the time
+# it takes to produce them is measured separately and subtracted, leaving the
+# time spent compressing.
+
+def metered_stream(stream_func, sequence, done, **kwargs):
+    """
+    Compress with stream_func, and call done(bytes_in, bytes_out, seconds)
+    when the stream was fully consumed.
+    """
+    meter = _StreamMeter()
+
+    def source():
+        iterator = iter(sequence)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                meter.upstream_seconds += time.perf_counter() - start
+            meter.bytes_in += len(item)
+            yield item
+
+    compressed = stream_func(source(), **kwargs)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(compressed)
+        except StopIteration:
+            break
+        finally:
+            meter.seconds += time.perf_counter() - start
+        meter.bytes_out += len(chunk)
+        yield chunk
+    done(meter.bytes_in, meter.bytes_out, meter.seconds - meter.upstream_seconds)
+
+
+async def metered_stream_async(stream_func, sequence, done, **kwargs):
+    """Like metered_stream(), but for asynchronous iterators."""
+    meter = _StreamMeter()
+
+    async def source():
+        iterator = sequence.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                meter.upstream_seconds += time.perf_counter() - start
+            meter.bytes_in += len(item)
+            yield item
+
+    compressed = stream_func(source(), **kwargs).__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = await compressed.__anext__()
+        except StopAsyncIteration:
+            break
+        finally:
+            meter.seconds += time.perf_counter() - start
+        meter.bytes_out += len(chunk)
+        yield chunk
+    done(meter.bytes_in, meter.bytes_out, meter.seconds - meter.upstream_seconds)
@@ -15,20 +15,59 @@
 __all__ = ["CompressionMiddleware"]
 
 
-from .br import brotli_compress, brotli_compress_stream
-from .zstd import zstd_compress, zstd_compress_stream
+from functools import lru_cache, partial
+import logging
+import os
+import time
+import warnings
 
-from django.utils.text import (
-        compress_string as gzip_compress,
-        compress_sequence as gzip_compress_stream,
+from .cache import CompressedContentCache, SharedContentCache, content_digest
+from .content_types import ContentTypeFilter, mime_type
+from .files import CompressedFileCache, file_path, find_precompressed, swap_file
+from .governor import STAGE_FASTEST, STAGE_SHED, process_governor
+from .levels import LEVELS, LevelPolicy, is_cacheable
+from .metrics import (
+        SKIP_CONTENT_TYPE,
+        SKIP_ENCODED,
+        SKIP_IMPROVEMENT,
+        SKIP_MIN_LEN,
+        SKIP_NO_ENCODING,
+        SKIP_OVERLOAD,
+        SKIP_PROBE,
+        SKIP_ROUTE,
+        metered_stream,
+        metered_stream_async,
+        server_timing,
 )
+from .policy import Policy, compile_policy
+from .registry import registry
+from .routes import RouteStats, route_key
+from .probe import SAMPLE_SIZE as PROBE_SAMPLE_SIZE, CompressibilityProbe
+from .streaming import (
+        content_chunks,
+        content_length,
+        content_list,
+        content_prefix,
+        iterate_in_threads,
+        streaming_response,
+)
+import django
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
 
 try:
     from django.utils.deprecation import MiddlewareMixin
 except ImportError: # pragma: no cover
     MiddlewareMixin = object
 
+try:
+    from asgiref.sync import sync_to_async
+except ImportError: # pragma: no cover
+    # Django < 3.0 doesn't support async middleware anyway.
+    sync_to_async = None
+
 
 # Minimum response length before we'll consider compression. Small responses
 # won't necessarily be smaller after compression, and we want to save at least
@@ -47,46 +86,317 @@ MIN_LEN = 500
 # required for decompression. An improvement of a few bytes is unlikely to
 # actually reduce the network communication in terms of MTUs.
 MIN_IMPROVEMENT = 100
+# Responses with these content types are not compressed, since they are mostly
+# already compressed, and compressing them again just wastes CPU time.
+# Wildcards such as "image/*" match all subtypes.
+EXCLUDE_CONTENT_TYPES = (
+        "image/*",
+        "video/*",
+        "audio/*",
+        "font/woff",
+        "font/woff2",
+        "application/font-woff",
+        "application/gzip",
+        "application/x-gzip",
+        "application/zip",
+        "application/x-bzip2",
+        "application/x-xz",
+        "application/zstd",
+        "application/x-7z-compressed",
+        "application/x-rar-compressed",
+        "application/vnd.rar",
+        "application/pdf",
+)
 
-
-# supported encodings in order of preference
-# (encoding, bulk_compressor, stream_compressor)
-compressors = (
-        ("zstd", zstd_compress, zstd_compress_stream),
-        ("br", brotli_compress, brotli_compress_stream),
-        ("gzip", gzip_compress, gzip_compress_stream),
+# Exceptions to EXCLUDE_CONTENT_TYPES: these are compressed after all. An
+# exact match takes precedence over a wildcard.
+INCLUDE_CONTENT_TYPES = (
+        "image/svg+xml",
+        "image/bmp",
+        "image/x-icon",
+        "image/vnd.microsoft.icon",
 )
+# Bulk responses of at least this length are first probed by compressing a
+# small sample. If the sample hardly compresses, the full compression is
+# skipped. Set to None to disable probing.
+PROBE_MIN_LEN = 64 * 1024
+
+# When serving asynchronously, bulk responses of at least this length are
+# compressed in a worker thread so that the CPU-bound compression doesn't block
+# the event loop. Smaller responses are compressed inline, since the cost of
+# switching threads would be comparable to the compression itself.
+ASYNC_OFFLOAD_LEN = 64 * 1024
+
+# The maximum total size (in bytes) of compressed bulk content to keep in an
+# in-process cache, so that identical responses aren't compressed over and over
+# again. Set to 0 to disable the cache.
+CACHE_MAX_BYTES = 0
+
+# The alias of a Django cache (in the CACHES setting) where compressed bulk
+# content is stored, so that worker processes sharing the cache backend (such
+# as Redis or memcached) only compress a response once between them. Only
+# responses that downstream caches may reuse are stored, and only if the
+# compressed content is at most SHARED_CACHE_MAX_ENTRY_BYTES long. Set to None
+# to disable the shared cache. Compressed content expires after
+# SHARED_CACHE_TIMEOUT seconds; by default, the timeout of the cache backend is
+# used.
+#
+# These are the defaults of the "SHARED_CACHE", "SHARED_CACHE_MAX_ENTRY_BYTES"
+# and "SHARED_CACHE_TIMEOUT" settings (see compression_middleware.policy).
+SHARED_CACHE = None
+SHARED_CACHE_MAX_ENTRY_BYTES = 1024 * 1024
+SHARED_CACHE_TIMEOUT = DEFAULT_TIMEOUT
+
+# Bulk responses of at least this length are compressed on multiple threads
+# where the encoding supports it. This mostly helps the latency of big exports
+# on hosts with many cores. Set to None to disable parallel compression.
+PARALLEL_MIN_LEN = 4 * 1024 * 1024
+
+# Bulk responses of at least this length are turned into streaming responses
+# and compressed chunk by chunk (of STREAM_CHUNK_SIZE bytes), so that the
+# compressed content doesn't have to be held in memory next to the original,
+# and the client gets the first bytes sooner. Set to None to always compress
+# bulk responses in one go.
+STREAM_MIN_LEN = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Routes (URL patterns) whose bulk responses of a content type failed to
+# compress by MIN_IMPROVEMENT this many times in a row aren't compressed for a
+# while, and then re-probed (see compression_middleware.routes), for example 3.
+# This is the default of the "ROUTE_MAX_FAILURES" setting (see
+# compression_middleware.policy). None always compresses them.
+ROUTE_MAX_FAILURES = None
+
+# The number of threads used for parallel compression.
+PARALLEL_THREADS = min(4, os.cpu_count() or 1)
+
+# The time (in seconds per second) that compression in this process may use
+# before it is degraded, e.g. 0.5 for half a core. The load is measured over a
+# sliding window. While it's over budget, first the lowest levels are used,
+# then gzip at level 1, and then only critical responses are compressed (see
+# compression_middleware.governor). None never degrades. This is the default
+# of the "CPU_BUDGET" setting (see compression_middleware.policy).
+CPU_BUDGET = None
+
+# The number of distinct Accept-Encoding headers for which the result of the
+# negotiation is remembered. Real traffic only contains a few dozen.
+NEGOTIATION_CACHE_SIZE = 256
+
+# The dotted path to the object that records metrics of the compression (see
+# compression_middleware.metrics.Metrics), such as
+# "compression_middleware.metrics.default_metrics". Recording them costs a
+# little time for every response, so they are disabled by default.
+METRICS = None
+
+# A directory where a sample of the uncompressed bulk responses is collected,
+# with their routes and content types, to tune the levels for real traffic
+# (see compression_middleware.sampler and compression_middleware.tune). A
+# fraction of CORPUS_SAMPLE_RATE of the responses is sampled until the
+# directory holds CORPUS_MAX_BYTES of them. The samples may contain private
+# data, so only enable this where that is acceptable. None disables sampling.
+# These are the defaults of the "CORPUS_DIR", "CORPUS_SAMPLE_RATE" and
+# "CORPUS_MAX_BYTES" settings (see compression_middleware.policy).
+CORPUS_DIR = None
+CORPUS_SAMPLE_RATE = 0.01
+CORPUS_MAX_BYTES = 256 * 1024 * 1024
+
+# Whether to describe the compression of every response in a Server-Timing
+# header entry, such as 'compress;dur=1.2;desc="br q4 10000>6100 61%"' (the
+# encoding, level, sizes before and after, and the compressed size as a
+# percentage), or the reason it wasn't compressed. Streaming responses only get
+# the encoding and level, since the header is sent before they are compressed,
+# and the full entry is logged at the info level once the stream ends. This
+# reveals the sizes to clients, so it's meant for debugging. This is the
+# default of the "SERVER_TIMING" setting (see compression_middleware.policy).
+SERVER_TIMING = False
+
+# Compression dictionaries (see compression_middleware.dictionary) for clients
+# supporting Compression Dictionary Transport. Each entry is a dict with
+#  - "path": the file containing the dictionary
+#  - "match": the URL path pattern (such as "/api/*") of the responses to use
+#    it for
+#  - "id" (optional): an identifier sent to the client with the dictionary
+#  - "url" (optional): where the dictionary is served, so that clients can be
+#    told where to fetch it (see compression_middleware.views.dictionary)
+DICTIONARIES = ()
+
+# For files served with FileResponse, a precompressed sibling file with one of
+# these extensions (such as "report.csv.br" next to "report.csv") is served
+# instead of compressing the file on the fly. A sibling is only used if it is
+# at least as new as the file and smaller than it. Set to {} to disable.
+PRECOMPRESSED_EXTENSIONS = {
+        "zstd": ".zst",
+        "br": ".br",
+        "gzip": ".gz",
+}
+
+# A directory where compressed versions of files served with FileResponse are
+# kept, so that a file is only compressed once (while it is streamed to the
+# first client). Files with a precompressed sibling don't need it. The
+# directory can be shared by several worker processes. Set to None to disable
+# the cache.
+FILE_CACHE_DIR = None
+
+# The maximum total size (in bytes) of the files in FILE_CACHE_DIR.
+FILE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+logger = logging.getLogger(__name__)
+
+
+# The supported encodings are those in compression_middleware.registry. Their
+# modules are only imported when the encodings are first negotiated.
+
+
+def parse_accept_encoding(accept_encoding):
+    """Obtain {'br': 1.0, 'gzip': 0.5} out of 'br, gzip;q=0.5' or similar."""
+    qualities = {}
+    for element in accept_encoding.split(","):
+        name, _, params = element.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                # An invalid q-value is ignored rather than rejected.
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+                else:
+                    if value == value:  # not NaN
+                        q = min(max(value, 0.0), 1.0)
+                break
+        qualities[name] = q
+    return qualities
 
 
 def encoding_name(s):
-    """Obtain 'br' out of ' br;q=0.5' or similar."""
-    # We won't break if the ordering is specified with q=, but we ignore it.
-    # Only a quality level of 0 is honoured -- in such a case we handle it as
-    # if the encoding wasn't specified at all.
-    if ";" in s:
-        s, q = s.split(";", 1)
-        if "=" in q:
-            _, q = q.split("=", 1)
-            try:
-                q = float(q)
-                if q == 0.0:
-                    return None
-            except ValueError:
-                pass
-    return s.strip()
-
-
-def compressor(accept_encoding):
+    """
+    Obtain 'br' out of ' br;q=0.5' or similar, or None if the quality is 0.
+
+    Deprecated: use parse_accept_encoding() for the whole header.
+    """
+    warnings.warn(
+        "encoding_name() is deprecated, use parse_accept_encoding() instead",
+        DeprecationWarning, stacklevel=2,
+    )
+    for name, q in parse_accept_encoding(s).items():
+        return name if q > 0 else None
+    return ""
+
+
+@lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def acceptable_compressors(accept_encoding, encodings=None):
+    """
+    The compressors acceptable to the client, most preferred first.
+
+    Only the given encodings (in our order of preference) are considered, or
+    all supported encodings if None.
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    # Encodings not mentioned are only acceptable if "*" is.
+    default = qualities.get("*", 0.0)
+    # If the client explicitly prefers uncompressed content, we oblige. (If
+    # identity is disallowed with identity;q=0 or *;q=0, there isn't much we
+    # can do if we can't compress, so we don't disallow it.)
+    identity = qualities.get("identity", 0.0)
+    candidates = registry.compressors()
+    if encodings is not None:
+        by_encoding = {funcs[0]: funcs for funcs in candidates}
+        candidates = [by_encoding[e] for e in encodings if e in by_encoding]
+    ranked = []
+    for preference, funcs in enumerate(candidates):
+        q = qualities.get(funcs[0], default)
+        if q > 0 and q >= identity:
+            ranked.append((-q, preference, funcs))
+    # The client's preference wins. For equal preference, ours wins.
+    ranked.sort()
+    return tuple(funcs for _, _, funcs in ranked)
+
+
+@lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def negotiate(accept_encoding, encodings=None):
+    ranked = acceptable_compressors(accept_encoding, encodings)
+    if not ranked:
+        return (None, None, None, None)
+    return ranked[0]
+
+
+@lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def accepts_dictionary(accept_encoding):
+    """Whether the client prefers dictionary compression (dcz)."""
+    qualities = parse_accept_encoding(accept_encoding)
+    # It has to be mentioned explicitly, not just with "*".
+    q = qualities.get("dcz", 0.0)
+    default = qualities.get("*", 0.0)
+    return q > 0 and all(
+        q >= qualities.get(funcs[0], default) for funcs in registry.compressors()
+    )
+
+
+def clear_negotiation_cache():
+    acceptable_compressors.cache_clear()
+    negotiate.cache_clear()
+    accepts_dictionary.cache_clear()
+
+
+registry.listeners.append(clear_negotiation_cache)
+
+
+def available_encodings():
+    """
+    The encodings that a policy may offer: those of the registry, and "dcz"
+    for dictionary compression (see DICTIONARIES).
+    """
+    encodings = registry.encodings()
+    if "dcz" in encodings:
+        return encodings
+    return encodings + ("dcz",)
+
+
+def default_policy():
+    """The policy given by the constants in this module."""
+    return Policy(
+        min_len=MIN_LEN,
+        min_improvement=MIN_IMPROVEMENT,
+        encodings=available_encodings(),
+        levels=LEVELS,
+        flush=None,
+        critical=False,
+        server_timing=SERVER_TIMING,
+        shared_cache=SHARED_CACHE,
+        shared_cache_max_entry_bytes=SHARED_CACHE_MAX_ENTRY_BYTES,
+        shared_cache_timeout=SHARED_CACHE_TIMEOUT,
+        route_max_failures=ROUTE_MAX_FAILURES,
+        cpu_budget=CPU_BUDGET,
+        corpus_dir=CORPUS_DIR,
+        corpus_sample_rate=CORPUS_SAMPLE_RATE,
+        corpus_max_bytes=CORPUS_MAX_BYTES,
+    )
+
+
+def compressors_for(accept_encoding, dictionary=None, encodings=None):
+    """
+    The (encoding, compress_func, stream_func, async_stream_func) to use for
+    the Accept-Encoding header, all None if no encoding is acceptable.
+    """
     # We don't want to process extremely long headers. It might be an attack:
     accept_encoding = accept_encoding[:200]
-    client_encodings = set(encoding_name(e) for e in accept_encoding.split(","))
-    if "*" in client_encodings:
-        # Our first choice:
-        return compressors[0]
-    for encoding, compress_func, stream_func in compressors:
-        if encoding in client_encodings:
-            return (encoding, compress_func, stream_func)
-    return (None, None, None)
+    if (dictionary is not None and (encodings is None or "dcz" in encodings)
+            and accepts_dictionary(accept_encoding)):
+        return dictionary.compressors
+    return negotiate(accept_encoding, encodings)
+
+
+def compressor(accept_encoding, dictionary=None, encodings=None):
+    """
+    The (encoding, compress_func, stream_func) to use for the Accept-Encoding
+    header. See compressors_for() for the asynchronous stream compressor too.
+    """
+    return compressors_for(accept_encoding, dictionary, encodings)[:3]
 
 
 class CompressionMiddleware(MiddlewareMixin):
@@ -94,39 +404,493 @@ class CompressionMiddleware(MiddlewareMixin):
     This middleware compresses content based on the Accept-Encoding header.
 
     The Vary header is set for the sake of downstream caches.
+
+    The middleware supports both WSGI and ASGI deployments. Under ASGI it runs
+    natively as async middleware, and streaming responses with asynchronous
+    iterators are compressed as they are consumed.
     """
 
-    def process_response(self, request, response):
-        # Test a few things before we even try:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **options):
+        super().__init__(get_response)
+        # The options override the settings, such as for a single view (see
+        # compression_middleware.decorators.compress_page).
+        self.policy = compile_policy(
+            default_policy(),
+            getattr(settings, "COMPRESSION_MIDDLEWARE", None),
+            available_encodings(),
+            **options
+        )
+        self.cache = None
+        if CACHE_MAX_BYTES:
+            self.cache = CompressedContentCache(CACHE_MAX_BYTES)
+        self.shared_cache = None
+        if self.policy.shared_cache is not None:
+            self.shared_cache = SharedContentCache(
+                self.policy.shared_cache,
+                self.policy.shared_cache_max_entry_bytes,
+                self.policy.shared_cache_timeout,
+            )
+        self.routes = None
+        if self.policy.route_max_failures is not None:
+            self.routes = RouteStats(self.policy.route_max_failures)
+        self.governor = None
+        if self.policy.cpu_budget is not None:
+            self.governor = process_governor(self.policy.cpu_budget)
+        self.level_policy = LevelPolicy(levels=self.policy.levels, governor=self.governor)
+        # the encodings that were prepared for all their levels (see warm())
+        self.warmed = set()
+        self.content_type_filter = ContentTypeFilter(
+            INCLUDE_CONTENT_TYPES, EXCLUDE_CONTENT_TYPES
+        )
+        self.probe = None
+        if PROBE_MIN_LEN is not None:
+            self.probe = CompressibilityProbe(PROBE_MIN_LEN)
+        self.metrics = import_string(METRICS) if METRICS else None
+        self.dictionaries = []
+        if DICTIONARIES:
+            from .dictionary import load_dictionary
+            self.dictionaries = [load_dictionary(**d) for d in DICTIONARIES]
+        self.sampler = None
+        if self.policy.corpus_dir:
+            from .sampler import CorpusSampler
+            self.sampler = CorpusSampler(
+                self.policy.corpus_dir,
+                self.policy.corpus_sample_rate,
+                self.policy.corpus_max_bytes,
+            )
+        self.file_cache = None
+        if FILE_CACHE_DIR:
+            self.file_cache = CompressedFileCache(FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.sampler is not None and self.skip_reason(response) is None:
+            # Don't block the event loop with writing the sample.
+            sample = self.pick_sample(request, response)
+            if sample is not None:
+                await sync_to_async(self.sampler.write, thread_sensitive=False)(*sample)
+        if not response.streaming and content_length(response) >= ASYNC_OFFLOAD_LEN:
+            return await sync_to_async(
+                self.process_response,
+                thread_sensitive=False,
+            )(request, response, is_async=True)
+        return self.process_response(request, response, is_async=True)
+
+    def warm(self, encoding):
+        """
+        Prepare the codec of an encoding for all its levels when it is first
+        negotiated, so that the responses using the other levels don't have a
+        latency spike. Codecs are only imported once they are negotiated.
+        """
+        self.warmed.add(encoding)
+        levels = self.level_policy.levels.get(encoding)
+        if levels is not None:
+            registry.warm(encoding, sorted(set(levels)))
+
+    def compress(self, encoding, compress_func, stream_func, chunks, level=None,
+            dictionary=None, shared_key=None):
+        """
+        Compress the content given as a list of byte strings.
+
+        A single chunk is compressed in one go. Several chunks are fed to the
+        stream compressor one by one, so that they don't have to be joined
+        first.
+
+        The compressed content is looked up in the in-process cache first, and
+        then in the shared cache if a shared_key is given.
+        """
+        if len(chunks) == 1:
+            content = chunks[0]
+            threads = self.parallel_threads(encoding, chunks)
+            if threads > 1:
+                compress_func = partial(
+                    registry.parallel_compressors()[encoding], threads=threads
+                )
+            compress = partial(compress_func, content, level=level)
+        else:
+            compress = lambda: b"".join(stream_func(iter(chunks), level=level))
+        if self.cache is None and shared_key is None:
+            return compress()
+        compressed_content = None
+        if self.cache is not None:
+            key = (content_digest(*chunks), encoding, dictionary and dictionary.hash)
+            compressed_content = self.cache.get(key)
+        if compressed_content is None and shared_key is not None:
+            compressed_content = self.shared_cache.get(shared_key)
+            if compressed_content is not None and self.cache is not None:
+                self.cache.set(key, compressed_content)
+        if compressed_content is None:
+            compressed_content = compress()
+            if self.cache is not None:
+                self.cache.set(key, compressed_content)
+            if shared_key is not None:
+                self.shared_cache.set(shared_key, compressed_content)
+        return compressed_content
+
+    def parallel_threads(self, encoding, chunks):
+        """The number of threads to compress the content with, 1 if not in parallel."""
+        if (len(chunks) == 1 and PARALLEL_MIN_LEN is not None
+                and len(chunks[0]) >= PARALLEL_MIN_LEN and PARALLEL_THREADS > 1
+                and encoding in registry.parallel_compressors()):
+            return PARALLEL_THREADS
+        return 1
+
+    def shared_cache_key(self, request, response, chunks, encoding, dictionary=None):
+        """
+        The key of the response in the shared cache, or None if it shouldn't
+        be shared.
+        """
+        if self.shared_cache is None or not is_cacheable(response):
+            return None
+        return self.shared_cache.key(
+            chunks, encoding, response.get("ETag"), request.get_full_path(),
+            dictionary and dictionary.hash,
+        )
+
+    def skip(self, response, reason, seconds=0.0):
+        if self.metrics is not None:
+            self.metrics.skipped(reason, seconds)
+        self.add_server_timing(response, seconds, reason=reason)
+        return response
+
+    def add_server_timing(self, response, seconds, **details):
+        """Add a Server-Timing entry for the compression, if enabled."""
+        if not self.policy.server_timing:
+            return
+        entry = server_timing(seconds, **details)
+        if response.has_header("Server-Timing"):
+            entry = response["Server-Timing"] + ", " + entry
+        response["Server-Timing"] = entry
+
+    def compress_stream(self, response, encoding, stream_func, async_stream_func, length=None,
+            predicted=None):
+        """
+        Compress the content of a streaming response.
+
+        If predicted is not None, it is the probe's prediction for the content,
+        recorded against the outcome once the stream is consumed.
+        """
+        level = self.level_policy.level(encoding, length)
+        logger.debug("Compressing streaming response: %s level %s", encoding, level)
+        kwargs = {"level": level}
+        # Not passed otherwise, for codecs that don't support flushing.
+        # (Dictionary compression does.)
+        if self.policy.flush is not None and (
+                encoding == "dcz" or registry.supports_flush(encoding)):
+            kwargs["flush"] = self.policy.flush
+        is_async = getattr(response, "is_async", False)
+        self.add_server_timing(response, None, encoding=encoding, level=level)
+        if (self.metrics is None and self.governor is None and not self.policy.server_timing
+                and predicted is None):
+            stream_func = async_stream_func if is_async else stream_func
+            return stream_func(response.streaming_content, **kwargs)
+
+        def done(bytes_in, bytes_out, seconds):
+            self.level_policy.record(seconds)
+            if predicted is not None:
+                self.probe.record(predicted, bytes_out < bytes_in - self.policy.min_improvement)
+            if self.metrics is not None:
+                self.metrics.compressed(encoding, level, bytes_in, bytes_out, seconds)
+            if self.policy.server_timing:
+                logger.info(
+                    "Compressed streaming response: %s",
+                    server_timing(seconds, encoding, level, bytes_in, bytes_out),
+                )
+
+        if is_async:
+            return metered_stream_async(
+                async_stream_func, response.streaming_content, done, **kwargs
+            )
+        return metered_stream(stream_func, response.streaming_content, done, **kwargs)
+
+    def stream_bulk(self, response, encoding, stream_func, async_stream_func, is_async=False):
+        """
+        Turn a big bulk response into a streaming response that is compressed
+        chunk by chunk.
+
+        If is_async is true (when serving asynchronously), the streaming
+        response has an asynchronous iterator, since Django would otherwise
+        consume a synchronous one into a list in a thread. The content is
+        still compressed chunk by chunk in worker threads, so that the
+        compression doesn't block the event loop.
+
+        Returns None if the probe predicts that compression isn't worthwhile.
+        Otherwise the prediction is recorded once the content is streamed.
+        """
+        length = content_length(response)
+        predicted = None
+        if self.probe is not None:
+            # Probe the start of the content only, to avoid joining all of it.
+            sample = content_prefix(response, STREAM_CHUNK_SIZE)
+            predicted = self.probe.predict(sample, self.policy.min_improvement, length)
+            if predicted is False and not self.probe.audit():
+                return None
+        streaming = streaming_response(response, content_chunks(response, STREAM_CHUNK_SIZE))
+        compressed = self.compress_stream(
+            streaming, encoding, stream_func, async_stream_func, length, predicted
+        )
+        if is_async and django.VERSION >= (4, 2):
+            # Django supports asynchronous iterators since 4.2.
+            compressed = iterate_in_threads(compressed)
+        streaming.streaming_content = compressed
+        del streaming["Content-Length"]
+        return streaming
+
+    def fastest_compressor(self, accept_encoding):
+        """The gzip compressor if the client accepts gzip, otherwise None."""
+        for funcs in acceptable_compressors(accept_encoding[:200], self.policy.encodings):
+            if funcs[0] == "gzip":
+                return funcs
+        return None
+
+    def serve_file(self, response, accept_encoding, encoding, stream_func, async_stream_func,
+            compress=True):
+        """
+        Serve the file of a FileResponse without compressing it on the fly, if
+        possible. If compress is false, only what is already compressed is
+        used.
+
+        Returns the encoding, or None if the response should be compressed as
+        usual.
+        """
+        if file_path(response) is None:
+            return None
+        if PRECOMPRESSED_EXTENSIONS:
+            precompressed = self.use_precompressed(response, accept_encoding)
+            if precompressed:
+                return precompressed
+        if self.file_cache is not None and self.use_file_cache(
+                response, encoding, stream_func, async_stream_func, compress):
+            return encoding
+        return None
+
+    def use_precompressed(self, response, accept_encoding):
+        """
+        Serve a precompressed sibling of the file of a FileResponse, if there
+        is one for an encoding that the client accepts.
+
+        Returns the encoding, or None if there is no usable sibling.
+        """
+        path = file_path(response)
+        if path is None:
+            return None
+        acceptable = acceptable_compressors(accept_encoding[:200], self.policy.encodings)
+        encodings = [funcs[0] for funcs in acceptable]
+        found = find_precompressed(path, encodings, PRECOMPRESSED_EXTENSIONS)
+        if found is None:
+            return None
+        encoding, sibling, size = found
+        length = int(response.get("Content-Length") or 0)
+        swap_file(response, open(sibling, "rb"), size)
+        logger.debug("Serving precompressed file: %s", sibling)
+        if self.metrics is not None:
+            self.metrics.compressed(encoding, "precompressed", length, size, 0.0)
+        self.add_server_timing(
+            response, 0.0, encoding=encoding, level="precompressed",
+            bytes_in=length, bytes_out=size,
+        )
+        return encoding
+
+    def use_file_cache(self, response, encoding, stream_func, async_stream_func, fill=True):
+        """
+        Serve the file of a FileResponse from the file cache, or compress it
+        while filling the cache (if fill is true).
+
+        Returns False if the response isn't for a file that can be cached.
+        """
+        path = file_path(response)
+        if path is None:
+            return False
+        key = self.file_cache.key(path, encoding)
+        if key is None:
+            return False
+        cached = self.file_cache.get(key)
+        if cached is not None:
+            f, size = cached
+            length = int(response.get("Content-Length") or 0)
+            swap_file(response, f, size)
+            logger.debug("Serving cached compressed file: %s", key)
+            if self.metrics is not None:
+                self.metrics.compressed(encoding, "cached", length, size, 0.0)
+            self.add_server_timing(
+                response, 0.0, encoding=encoding, level="cached",
+                bytes_in=length, bytes_out=size,
+            )
+            return True
+        if not fill:
+            return False
+        response.streaming_content = self.file_cache.fill(
+            key, path, encoding,
+            self.compress_stream(response, encoding, stream_func, async_stream_func),
+        )
+        del response["Content-Length"]
+        return True
+
+    def use_dictionary(self, request, response, accept_encoding):
+        """
+        Obtain the dictionary that the client has for this response, if any.
+
+        If the client doesn't have a dictionary for this response, it is told
+        where to fetch one.
+        """
+        matching = [d for d in self.dictionaries if d.matches(request.path)]
+        if not matching:
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return None
+        patch_vary_headers(response, ("Accept-Encoding", "Available-Dictionary"))
+        available = request.META.get("HTTP_AVAILABLE_DICTIONARY", "").strip()
+        for dictionary in matching:
+            if dictionary.available_dictionary == available:
+                return dictionary
+        if "dcz" in parse_accept_encoding(accept_encoding[:200]):
+            links = [
+                '<%s>; rel="compression-dictionary"' % d.url for d in matching if d.url
+            ]
+            if links:
+                if response.has_header("Link"):
+                    links.insert(0, response["Link"])
+                response["Link"] = ", ".join(links)
+        return None
+
+    def skip_reason(self, response):
+        """The reason not to even try compressing the response, or None."""
         #  - content is already encoded
+        if response.has_header("Content-Encoding"):
+            return SKIP_ENCODED
+        #  - the content type is not worth compressing
+        if not self.content_type_filter(response.get("Content-Type")):
+            return SKIP_CONTENT_TYPE
         #  - really short responses are not worth it
-        if response.has_header("Content-Encoding") or (
-            not response.streaming and len(response.content) < MIN_LEN
-        ):
-            return response
+        if not response.streaming and content_length(response) < self.policy.min_len:
+            return SKIP_MIN_LEN
+        return None
+
+    def pick_sample(self, request, response):
+        """
+        The arguments for CorpusSampler.write() if the response is picked for
+        the corpus, or None.
+        """
+        if response.streaming or not self.sampler.pick():
+            return None
+        return content_list(response), response.get("Content-Type"), route_key(request)
+
+    def process_response(self, request, response, is_async=False):
+        # Test a few things before we even try:
+        reason = self.skip_reason(response)
+        if reason is not None:
+            return self.skip(response, reason)
+        if self.sampler is not None and not is_async:
+            # (On the async path, this was done in __acall__.)
+            sample = self.pick_sample(request, response)
+            if sample is not None:
+                self.sampler.write(*sample)
 
-        patch_vary_headers(response, ("Accept-Encoding",))
         ae = request.META.get("HTTP_ACCEPT_ENCODING", "")
-        encoding, compress_func, stream_func = compressor(ae)
+        dictionary = None
+        if self.dictionaries:
+            dictionary = self.use_dictionary(request, response, ae)
+        else:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        encoding, compress_func, stream_func, async_stream_func = compressors_for(
+            ae, dictionary, self.policy.encodings
+        )
         if not encoding:
             # No compression in common with client (the client probably didn't
             # indicate support for anything).
-            return response
+            return self.skip(response, SKIP_NO_ENCODING)
+        if encoding not in self.warmed:
+            self.warm(encoding)
+
+        shed = False
+        if self.governor is not None:
+            # Under overload, compression is degraded (see CPU_BUDGET).
+            stage = self.governor.stage()
+            if stage >= STAGE_FASTEST:
+                fastest = self.fastest_compressor(ae)
+                if fastest is not None:
+                    encoding, compress_func, stream_func, async_stream_func = fastest
+                    dictionary = None
+            shed = stage >= STAGE_SHED and not self.policy.critical
 
-        if response.streaming:
+        served = None
+        if response.streaming and dictionary is None:
+            served = self.serve_file(
+                response, ae, encoding, stream_func, async_stream_func, not shed
+            )
+        if served:
+            encoding = served
+        elif shed:
+            return self.skip(response, SKIP_OVERLOAD)
+        elif response.streaming:
+            response.streaming_content = self.compress_stream(
+                response, encoding, stream_func, async_stream_func
+            )
             # Delete the `Content-Length` header for streaming content, because
             # we won't know the compressed size until we stream it.
-            response.streaming_content = stream_func(response.streaming_content)
             del response["Content-Length"]
+        elif STREAM_MIN_LEN is not None and content_length(response) >= STREAM_MIN_LEN:
+            # Excessively big responses are streamed to bound memory use.
+            streaming = self.stream_bulk(
+                response, encoding, stream_func, async_stream_func, is_async
+            )
+            if streaming is None:
+                return self.skip(response, SKIP_PROBE)
+            response = streaming
         else:
-            #TODO: protect against excessive response size
-            compressed_content = compress_func(response.content)
+            # The content isn't joined (as response.content does), since that
+            # would copy all of it.
+            route = None
+            if self.routes is not None:
+                # Responses of other content types may compress differently.
+                route = (route_key(request), mime_type(response.get("Content-Type", "")))
+                if self.routes.skip(route):
+                    return self.skip(response, SKIP_ROUTE)
+            chunks = content_list(response)
+            length = content_length(response)
+            predicted = None
+            if self.probe is not None:
+                sample = chunks[0] if len(chunks) == 1 else content_prefix(
+                    response, 2 * PROBE_SAMPLE_SIZE
+                )
+                predicted = self.probe.predict(sample, self.policy.min_improvement, length)
+                if predicted is False and not self.probe.audit():
+                    return self.skip(response, SKIP_PROBE)
+            level = self.level_policy.level(encoding, length, is_cacheable(response))
+            shared_key = self.shared_cache_key(request, response, chunks, encoding, dictionary)
+            start = time.perf_counter()
+            compressed_content = self.compress(
+                encoding, compress_func, stream_func, chunks, level, dictionary, shared_key
+            )
+            seconds = time.perf_counter() - start
+            # The governor budgets CPU time, which parallel compression spends
+            # on several threads at once.
+            self.level_policy.record(seconds * self.parallel_threads(encoding, chunks))
+            logger.debug(
+                "Compressed response: %s level %s, %d -> %d bytes",
+                encoding, level, length, len(compressed_content),
+            )
             # Return the compressed content only if compression is worth it
-            if len(compressed_content) >= len(response.content) - MIN_IMPROVEMENT:
-                return response
+            worthwhile = len(compressed_content) < length - self.policy.min_improvement
+            if predicted is not None:
+                self.probe.record(predicted, worthwhile)
+            if route is not None:
+                self.routes.record(route, length, worthwhile)
+            if not worthwhile:
+                return self.skip(response, SKIP_IMPROVEMENT, seconds)
+            if self.metrics is not None:
+                self.metrics.compressed(
+                    encoding, level, length, len(compressed_content), seconds
+                )
+            self.add_server_timing(
+                response, seconds, encoding=encoding, level=level,
+                bytes_in=length, bytes_out=len(compressed_content),
+            )
 
             response.content = compressed_content
-            response["Content-Length"] = str(len(response.content))
+            response["Content-Length"] = str(len(compressed_content))
 
         # If there is a strong ETag, make it weak to fulfill the requirements
         # of RFC 7232 section-2.1 while also allowing conditional request
@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+The compression policy: which encodings are offered, at which levels, and
+which responses are worth compressing.
+
+The policy is configured in the Django settings, for example:
+
+    COMPRESSION_MIDDLEWARE = {
+        "MIN_LEN": 1000,
+        "ENCODINGS": ["br", "gzip"],
+        "LEVELS": {"br": 5},
+        "FLUSH": {"interval": 0.1},
+        "SERVER_TIMING": True,
+    }
+
+and can be overridden per view with arguments to
+compression_middleware.decorators.compress_page().
+"""
+
+__all__ = ["Policy", "compile_policy"]
+
+
+from collections import namedtuple
+import os
+from types import MappingProxyType
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .flush import FlushPolicy
+
+
+# - min_len: the minimum length of a response to consider compressing it
+# - min_improvement: how much smaller the compressed response has to be
+# - encodings: the encodings offered, in order of preference
+# - levels: encoding -> (small and cacheable, normal, large, lowest) levels
+#   (see compression_middleware.levels)
+# - flush: when to flush streaming responses, a FlushPolicy or None (see
+#   compression_middleware.flush)
+# - critical: whether responses are still compressed when compression is shed
+#   under overload (see compression_middleware.governor)
+# - server_timing: whether to describe the compression in a Server-Timing
+#   header entry (see compression_middleware.metrics.server_timing)
+# - shared_cache: the alias of the Django cache where compressed content is
+#   shared between processes, or None (see compression_middleware.cache)
+# - shared_cache_max_entry_bytes: the maximum length of an entry in it
+# - shared_cache_timeout: how long its entries are kept, in seconds
+# - route_max_failures: after how many failures in a row the responses of a
+#   route aren't compressed for a while, or None (see
+#   compression_middleware.routes)
+# - cpu_budget: the seconds per second of compression in this process before
+#   it is degraded, or None (see compression_middleware.governor)
+# - corpus_dir: where a sample of the responses is collected, or None (see
+#   compression_middleware.sampler)
+# - corpus_sample_rate: the fraction of the responses that is sampled
+# - corpus_max_bytes: the maximum size of the samples in corpus_dir
+Policy = namedtuple(
+    "Policy",
+    (
+        "min_len", "min_improvement", "encodings", "levels", "flush", "critical",
+        "server_timing", "shared_cache", "shared_cache_max_entry_bytes",
+        "shared_cache_timeout", "route_max_failures", "cpu_budget", "corpus_dir",
+        "corpus_sample_rate", "corpus_max_bytes",
+    ),
+)
+
+
+def _levels(value, default):
+    # A single level is used for responses of all sizes, but it can still be
+    # lowered to the default lowest level under CPU pressure.
+    if isinstance(value, int):
+        lowest = value if default is None else min(value, default[3])
+        return (value, value, value, lowest)
+    value = tuple(value)
+    if len(value) != 4 or not all(isinstance(level, int) for level in value):
+        raise ValueError("expected a level or four levels, got %r" % (value,))
+    return value
+
+
+def _flush(value):
+    if value is None or isinstance(value, FlushPolicy):
+        return value
+    options = {key.lower(): value for key, value in value.items()}
+    unknown = set(options) - {"size", "interval"}
+    if unknown:
+        raise ValueError("unknown flush options: %s" % ", ".join(sorted(unknown)))
+    return FlushPolicy(**options)
+
+
+def _compile(policy, options, available):
+    if "min_len" in options:
+        policy = policy._replace(min_len=int(options["min_len"]))
+    if "min_improvement" in options:
+        policy = policy._replace(min_improvement=int(options["min_improvement"]))
+    if "encodings" in options:
+        encodings = tuple(encoding.lower() for encoding in options["encodings"])
+        unknown = set(encodings) - set(available)
+        if unknown:
+            raise ValueError("unknown encodings: %s" % ", ".join(sorted(unknown)))
+        policy = policy._replace(encodings=encodings)
+    if "levels" in options:
+        levels = dict(policy.levels)
+        for encoding, value in options["levels"].items():
+            encoding = encoding.lower()
+            if encoding not in levels and encoding not in available:
+                raise ValueError("unknown encoding: %s" % encoding)
+            levels[encoding] = _levels(value, levels.get(encoding))
+        policy = policy._replace(levels=MappingProxyType(levels))
+    if "flush" in options:
+        policy = policy._replace(flush=_flush(options["flush"]))
+    if "critical" in options:
+        policy = policy._replace(critical=bool(options["critical"]))
+    if "server_timing" in options:
+        policy = policy._replace(server_timing=bool(options["server_timing"]))
+    if "shared_cache" in options:
+        alias = options["shared_cache"]
+        if alias is not None and not isinstance(alias, str):
+            raise ValueError("expected the alias of a cache, got %r" % (alias,))
+        policy = policy._replace(shared_cache=alias)
+    if "shared_cache_max_entry_bytes" in options:
+        policy = policy._replace(
+            shared_cache_max_entry_bytes=int(options["shared_cache_max_entry_bytes"])
+        )
+    if "shared_cache_timeout" in options:
+        # None means that entries don't expire, as for Django's caches.
+        timeout = options["shared_cache_timeout"]
+        policy = policy._replace(shared_cache_timeout=None if timeout is None else int(timeout))
+    if "route_max_failures" in options:
+        failures = options["route_max_failures"]
+        if failures is not None:
+            failures = int(failures)
+            if failures < 1:
+                raise ValueError("expected at least one failure, got %r" % (failures,))
+        policy = policy._replace(route_max_failures=failures)
+    if "cpu_budget" in options:
+        budget = options["cpu_budget"]
+        if budget is not None:
+            budget = float(budget)
+            if not budget > 0:
+                raise ValueError("expected a positive CPU budget, got %r" % (budget,))
+        policy = policy._replace(cpu_budget=budget)
+    if "corpus_dir" in options:
+        directory = options["corpus_dir"]
+        policy = policy._replace(corpus_dir=None if directory is None else os.fspath(directory))
+    if "corpus_sample_rate" in options:
+        rate = float(options["corpus_sample_rate"])
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("expected a sample rate from 0 to 1, got %r" % (rate,))
+        policy = policy._replace(corpus_sample_rate=rate)
+    if "corpus_max_bytes" in options:
+        policy = policy._replace(corpus_max_bytes=int(options["corpus_max_bytes"]))
+    return policy
+
+
+def compile_policy(defaults, settings=None, available=None, **overrides):
+    """
+    Compile the COMPRESSION_MIDDLEWARE settings and the per-view overrides
+    into a policy, starting from the defaults.
+
+    The settings use upper case names (such as "MIN_LEN") and the overrides
+    lower case names (such as min_len). The available encodings are those that
+    may be listed in "ENCODINGS" (by default those of the defaults).
+    """
+    if available is None:
+        available = defaults.encodings
+    policy = defaults._replace(levels=MappingProxyType(dict(defaults.levels)))
+
+    options = {}
+    for key, value in (settings or {}).items():
+        if key.lower() not in Policy._fields or key != key.upper():
+            raise ImproperlyConfigured("Unknown COMPRESSION_MIDDLEWARE setting: %s" % key)
+        options[key.lower()] = value
+    try:
+        policy = _compile(policy, options, available)
+    except (TypeError, ValueError) as e:
+        raise ImproperlyConfigured("Invalid COMPRESSION_MIDDLEWARE setting: %s" % e)
+
+    for name in overrides:
+        if name not in Policy._fields:
+            raise TypeError("unexpected compression option: %s" % name)
+    return _compile(policy, overrides, available)
@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["ContextPool"]
+
+
+from contextlib import contextmanager
+import threading
+
+
+class ContextPool(object):
+    """
+    A pool of reusable compression contexts.
+
+    Creating a compression context allocates big internal tables, so it is
+    cheaper to reuse contexts than to create one for every response. Contexts
+    are created with factory(key), for example with the compression level as
+    the key. Each context is only used by one response at a time, so the pool
+    is safe to use from multiple threads and from async code. At most max_idle
+    unused contexts are kept per key.
+    """
+
+    def __init__(self, factory, max_idle):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.created = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+            self.created += 1
+        return self.factory(key)
+
+    def release(self, key, context):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(context)
+
+    @contextmanager
+    def context(self, key):
+        context = self.acquire(key)
+        yield context
+        # If an exception was raised (also when a stream was closed before it
+        # was finished), the context might be in an unknown state, so it isn't
+        # returned to the pool.
+        self.release(key, context)
+
+    def idle(self, key):
+        """The number of unused contexts for the key."""
+        with self._lock:
+            return len(self._idle.get(key, ()))
+
+    def warm(self, keys, prepare=None):
+        """Create a context for each key in advance, optionally preparing it."""
+        for key in keys:
+            context = self.acquire(key)
+            if prepare is not None:
+                prepare(context)
+            self.release(key, context)
@@ -0,0 +1,111 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["CompressibilityProbe"]
+
+
+import threading
+import zlib
+
+
+# The number of bytes sampled from the start and from the middle of the
+# content.
+SAMPLE_SIZE = 4 * 1024
+
+# If a fast compression of the sample isn't smaller than this fraction of its
+# size, the content is predicted to be incompressible. The real compressors
+# do better than zlib at level 1, so this leaves some margin.
+MAX_RATIO = 0.95
+
+# One out of this many skipped responses is compressed anyway to check whether
+# skipping it was correct.
+AUDIT_INTERVAL = 100
+
+
+class CompressibilityProbe(object):
+    """
+    Predicts whether content is worth compressing by compressing a sample.
+
+    The probe compresses a few kilobytes from the start and the middle of the
+    content with zlib at level 1. This is cheap compared to a full compression
+    of a big response that might turn out to be incompressible.
+
+    Counters are kept of the probes, the negative predictions, the responses
+    skipped and audited because of them, and the wrong predictions (found
+    when compressing after all, or when auditing).
+    """
+
+    def __init__(self, min_len):
+        self.min_len = min_len
+        self.probes = 0
+        # predicted incompressible: either skipped or audited
+        self.negatives = 0
+        self.skips = 0
+        self.audits = 0
+        # predicted compressible, but wasn't
+        self.false_positives = 0
+        # predicted incompressible, but was compressible (found by auditing)
+        self.false_negatives = 0
+        self._lock = threading.Lock()
+
+    def predict(self, content, min_improvement, length=None):
+        """
+        Predict whether compressing the content will save at least
+        min_improvement bytes.
+
+        If only the start of the content is given, length is the length of all
+        of it. None is returned if the content is too short to be worth
+        probing.
+        """
+        if length is None:
+            length = len(content)
+        if length < self.min_len:
+            return None
+        if len(content) <= 2 * SAMPLE_SIZE:
+            sample = content
+        else:
+            view = memoryview(content)
+            middle = len(content) // 2
+            sample = b"".join((view[:SAMPLE_SIZE], view[middle:middle + SAMPLE_SIZE]))
+        ratio = len(zlib.compress(sample, 1)) / len(sample)
+        predicted = ratio < MAX_RATIO and length * (1 - ratio) >= min_improvement
+        with self._lock:
+            self.probes += 1
+            if not predicted:
+                self.negatives += 1
+        return predicted
+
+    def audit(self):
+        """
+        Whether a response predicted incompressible should be compressed anyway
+        to audit the probe. If not, it is counted as skipped.
+        """
+        with self._lock:
+            if self.negatives % AUDIT_INTERVAL:
+                self.skips += 1
+                return False
+            self.audits += 1
+            return True
+
+    def record(self, predicted, worthwhile):
+        """Record the outcome of a full compression after a prediction."""
+        if predicted == worthwhile:
+            return
+        with self._lock:
+            if predicted:
+                self.false_positives += 1
+            else:
+                self.false_negatives += 1
+
+    def stats(self):
+        return {
+            "probes": self.probes,
+            "negatives": self.negatives,
+            "skips": self.skips,
+            "audits": self.audits,
+            "false_positives": self.false_positives,
+            "false_negatives": self.false_negatives,
+        }
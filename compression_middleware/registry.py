@@ -0,0 +1,217 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+The registry of codecs (content encodings) that the middleware can offer.
+
+Codecs are registered with the dotted paths of their functions, so that their
+modules (and the compression libraries they need) are only imported when the
+codecs are first needed. A codec whose module can't be imported (for example,
+because Brotli isn't installed) is left out.
+
+Other packages can register codecs with an entry point in the group
+"compression_middleware.codecs". The entry point refers to a function that is
+called with the registry, for example:
+
+    def register(registry):
+        registry.register(
+            "gzip",
+            "fastgzip.compress",
+            "fastgzip.compress_stream",
+            "fastgzip.compress_stream_async",
+            flush=True,
+        )
+
+The functions have the same signatures as those in
+compression_middleware.gzip. Without flush=True, the stream compressors don't
+need to accept a flush argument, and streams are only flushed at the end.
+"""
+
+__all__ = ["CodecRegistry", "registry"]
+
+
+from collections import OrderedDict
+import logging
+import threading
+
+from django.utils.module_loading import import_string
+
+
+ENTRY_POINT_GROUP = "compression_middleware.codecs"
+
+
+logger = logging.getLogger(__name__)
+
+
+def _entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError: # pragma: no cover
+        # Python < 3.8
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return ()
+    entry_points = entry_points()
+    if hasattr(entry_points, "select"):
+        return entry_points.select(group=group)
+    # Python < 3.10
+    return entry_points.get(group, ())
+
+
+def _resolve(func):
+    if isinstance(func, str):
+        return import_string(func)
+    return func
+
+
+class CodecRegistry(object):
+    """
+    The codecs in order of preference.
+
+    The functions of a codec are given as callables or dotted paths:
+     - bulk(content, level=None)
+     - stream(sequence, level=None)
+     - async_stream(async_sequence, level=None)
+     - parallel(content, threads, level=None) (optional)
+     - warm(levels) (optional): prepares for compressing at the levels, such
+       as by creating compression contexts in advance
+
+    If a codec is registered with flush=True, its stream compressors also take
+    a flush argument: a FlushPolicy or None (see compression_middleware.flush).
+    Otherwise it is never passed to them.
+
+    The listeners are called without arguments when the codecs change.
+    """
+
+    def __init__(self, entry_point_group=None):
+        self.entry_point_group = entry_point_group
+        self.listeners = []
+        self._codecs = OrderedDict()
+        self._flushable = set()
+        self._loaded = None
+        self._discovered = entry_point_group is None
+        self._lock = threading.RLock()
+
+    def register(self, encoding, bulk, stream, async_stream, parallel=None, flush=False,
+            warm=None):
+        """
+        Register the codec for an encoding, replacing an existing one. A new
+        encoding is preferred the least.
+        """
+        with self._lock:
+            self._codecs[encoding] = (bulk, stream, async_stream, parallel, warm)
+            if flush:
+                self._flushable.add(encoding)
+            else:
+                self._flushable.discard(encoding)
+            self._loaded = None
+        self._changed()
+
+    def unregister(self, encoding):
+        with self._lock:
+            self._codecs.pop(encoding, None)
+            self._flushable.discard(encoding)
+            self._loaded = None
+        self._changed()
+
+    def _changed(self):
+        for listener in self.listeners:
+            listener()
+
+    def _discover(self):
+        with self._lock:
+            if self._discovered:
+                return
+            self._discovered = True
+            for entry_point in _entry_points(self.entry_point_group):
+                try:
+                    entry_point.load()(self)
+                except Exception:
+                    logger.warning(
+                        "Can't register compression codecs from %s", entry_point.name,
+                        exc_info=True,
+                    )
+
+    def encodings(self):
+        """The registered encodings, including those that aren't available."""
+        self._discover()
+        return tuple(self._codecs)
+
+    def _load(self):
+        loaded = self._loaded
+        if loaded is not None:
+            return loaded
+        self._discover()
+        with self._lock:
+            compressors = []
+            parallel_compressors = {}
+            warmers = {}
+            for encoding, funcs in self._codecs.items():
+                try:
+                    bulk, stream, async_stream, parallel, warm = [_resolve(f) for f in funcs]
+                except ImportError as e:
+                    logger.debug("The %s encoding isn't available: %s", encoding, e)
+                    continue
+                compressors.append((encoding, bulk, stream, async_stream))
+                if parallel is not None:
+                    parallel_compressors[encoding] = parallel
+                if warm is not None:
+                    warmers[encoding] = warm
+            loaded = self._loaded = (tuple(compressors), parallel_compressors, warmers)
+        return loaded
+
+    def compressors(self):
+        """
+        The available codecs as (encoding, bulk, stream, async_stream), in
+        order of preference.
+        """
+        return self._load()[0]
+
+    def parallel_compressors(self):
+        """The parallel bulk compressors of the available codecs by encoding."""
+        return self._load()[1]
+
+    def warm(self, encoding, levels):
+        """Prepare the codec for the levels, if it is available and can be."""
+        warm = self._load()[2].get(encoding)
+        if warm is not None:
+            warm(levels)
+
+    def supports_flush(self, encoding):
+        """Whether the stream compressors of the encoding take a flush argument."""
+        self._discover()
+        return encoding in self._flushable
+
+
+registry = CodecRegistry(ENTRY_POINT_GROUP)
+
+# built-in codecs in order of preference
+registry.register(
+        "zstd",
+        "compression_middleware.zstd.zstd_compress",
+        "compression_middleware.zstd.zstd_compress_stream",
+        "compression_middleware.zstd.zstd_compress_stream_async",
+        parallel="compression_middleware.zstd.zstd_compress_parallel",
+        flush=True,
+        warm="compression_middleware.zstd.warm_pool",
+)
+# Brotli has no multi-threaded mode, so big responses use the normal compressor.
+registry.register(
+        "br",
+        "compression_middleware.br.brotli_compress",
+        "compression_middleware.br.brotli_compress_stream",
+        "compression_middleware.br.brotli_compress_stream_async",
+        flush=True,
+)
+registry.register(
+        "gzip",
+        "compression_middleware.gzip.gzip_compress",
+        "compression_middleware.gzip.gzip_compress_stream",
+        "compression_middleware.gzip.gzip_compress_stream_async",
+        parallel="compression_middleware.gzip.gzip_compress_parallel",
+        flush=True,
+)
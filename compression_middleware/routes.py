@@ -0,0 +1,110 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["RouteStats", "route_key"]
+
+
+from collections import OrderedDict
+import threading
+import time
+
+
+# A route that failed this many times is skipped for BACKOFF seconds. Every
+# time it fails again after that, the period is doubled, up to MAX_BACKOFF.
+BACKOFF = 10.0
+MAX_BACKOFF = 600.0
+
+# The maximum number of routes to keep statistics for. The least recently
+# used routes are forgotten first.
+MAX_ROUTES = 1024
+
+# Responses shorter than this don't count as failures. Close to MIN_LEN, even
+# content that compresses well may not save MIN_IMPROVEMENT bytes, so such
+# failures say little about the bigger responses of the route.
+FAILURE_MIN_LEN = 4 * 1024
+
+
+def route_key(request):
+    """
+    The route of a request: the name of the URL pattern if it has one, or else
+    the pattern itself, or else the path.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is not None:
+        route = match.view_name or getattr(match, "route", None)
+        if route:
+            return route
+    return getattr(request, "path", "")
+
+
+class _Route(object):
+
+    __slots__ = ("failures", "backoff", "skip_until", "skips")
+
+    def __init__(self):
+        self.failures = 0
+        self.backoff = 0.0
+        self.skip_until = 0.0
+        self.skips = 0
+
+
+class RouteStats(object):
+    """
+    Learns which routes keep returning responses that don't compress well.
+
+    A route is identified by the caller, such as by the route of the request
+    and the MIME type of the response. Once a route failed to compress by
+    enough max_failures times in a row, its responses are skipped for a
+    while. After that a response is compressed again to find out whether it
+    still fails, in which case the route is skipped for twice as long. A
+    single success resets the route. Failures of responses shorter than
+    FAILURE_MIN_LEN are ignored.
+    """
+
+    def __init__(self, max_failures):
+        self.max_failures = max_failures
+        self._routes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def skip(self, route):
+        """Whether responses of the route shouldn't be compressed now."""
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None or time.monotonic() >= stats.skip_until:
+                return False
+            stats.skips += 1
+            return True
+
+    def record(self, route, length, worthwhile):
+        """Record the outcome of compressing a response of the route."""
+        if not worthwhile and length < FAILURE_MIN_LEN:
+            return
+        with self._lock:
+            stats = self._routes.pop(route, None) or _Route()
+            self._routes[route] = stats
+            while len(self._routes) > MAX_ROUTES:
+                self._routes.popitem(last=False)
+            if worthwhile:
+                stats.failures = 0
+                stats.backoff = 0.0
+                stats.skip_until = 0.0
+                return
+            stats.failures += 1
+            if stats.failures >= self.max_failures:
+                stats.backoff = min(stats.backoff * 2 or BACKOFF, MAX_BACKOFF)
+                stats.skip_until = time.monotonic() + stats.backoff
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                route: {
+                    "failures": stats.failures,
+                    "skips": stats.skips,
+                    "skipping_for": max(stats.skip_until - now, 0.0),
+                }
+                for route, stats in self._routes.items()
+            }
@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Sampling of real response bodies into a corpus, for tuning the compression
+levels offline (see compression_middleware.tune).
+
+Every sample is stored as two files named after the digest of the body: the
+body itself ("<digest>.body") and its metadata ("<digest>.json") with the
+route, the content type and the length. Identical bodies are stored once.
+"""
+
+__all__ = ["CorpusSampler", "read_corpus"]
+
+
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+
+from .cache import content_digest
+
+
+BODY_EXTENSION = ".body"
+META_EXTENSION = ".json"
+TEMP_PREFIX = ".tmp-"
+
+
+logger = logging.getLogger(__name__)
+
+
+def _write(directory, name, chunks):
+    fd, temp = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class CorpusSampler(object):
+    """
+    Writes a fraction (rate) of the response bodies it is given to a corpus
+    directory, until the corpus holds max_bytes of bodies.
+
+    The size of the corpus is counted when the sampler is created and then
+    tracked in-process, so with several worker processes the limit is
+    approximate. Errors while writing are logged and don't affect the
+    response.
+    """
+
+    def __init__(self, directory, rate, max_bytes):
+        self.directory = directory
+        self.rate = rate
+        self.max_bytes = max_bytes
+        self.samples = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(
+            entry.stat().st_size for entry in os.scandir(directory)
+            if entry.name.endswith(BODY_EXTENSION)
+        )
+        self._lock = threading.Lock()
+
+    def pick(self):
+        """Whether to sample the next response (cheaply, without writing)."""
+        return random.random() < self.rate and self.size < self.max_bytes
+
+    def write(self, chunks, content_type, route):
+        """
+        Add the body given as a list of byte strings to the corpus.
+
+        Returns whether it was added.
+        """
+        length = sum(len(chunk) for chunk in chunks)
+        digest = content_digest(*chunks).hex()
+        meta = {"route": route, "content_type": content_type, "length": length}
+        reserved = 0
+        try:
+            if not os.path.exists(os.path.join(self.directory, digest + BODY_EXTENSION)):
+                with self._lock:
+                    if self.size + length > self.max_bytes:
+                        return False
+                    self.size += length
+                reserved = length
+                _write(self.directory, digest + BODY_EXTENSION, chunks)
+                reserved = 0
+            _write(self.directory, digest + META_EXTENSION, [json.dumps(meta).encode("utf-8")])
+        except OSError:
+            logger.warning("Can't write to the corpus in %s", self.directory, exc_info=True)
+            if reserved:
+                with self._lock:
+                    self.size -= reserved
+            return False
+        with self._lock:
+            self.samples += 1
+        return True
+
+    def sample(self, chunks, content_type, route):
+        """
+        Maybe add the body given as a list of byte strings to the corpus.
+
+        Returns whether it was added.
+        """
+        return self.pick() and self.write(chunks, content_type, route)
+
+
+def read_corpus(directory):
+    """Yield (metadata, path of the body) for the samples in the corpus."""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(META_EXTENSION) or name.startswith(TEMP_PREFIX):
+            continue
+        path = os.path.join(directory, name[:-len(META_EXTENSION)] + BODY_EXTENSION)
+        if not os.path.exists(path):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            yield json.load(f), path
@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Helpers for handling the content of big (non-streaming) responses without
+copying it around.
+"""
+
+__all__ = [
+        "content_chunks",
+        "content_length",
+        "content_list",
+        "content_prefix",
+        "iterate_in_threads",
+        "streaming_response",
+]
+
+
+from functools import partial
+
+from django.http import StreamingHttpResponse
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError: # pragma: no cover
+    # Django < 3.0 doesn't support async responses anyway.
+    sync_to_async = None
+
+
+_DONE = object()
+
+
+def content_list(response):
+    """
+    The content of a non-streaming response as a list of byte strings.
+
+    HttpResponse keeps its content like this. Joining them (as
+    response.content does) copies all of it.
+    """
+    container = getattr(response, "_container", None)
+    if container is None:
+        return [response.content]
+    return container
+
+
+def content_length(response):
+    """The length of the content of a non-streaming response."""
+    return sum(len(chunk) for chunk in content_list(response))
+
+
+def content_prefix(response, size):
+    """The first size bytes of the content of a non-streaming response."""
+    parts = []
+    for chunk in content_list(response):
+        if size <= 0:
+            break
+        parts.append(chunk[:size])
+        size -= len(parts[-1])
+    return b"".join(parts)
+
+
+def content_chunks(response, size):
+    """
+    Yield the content of a non-streaming response in memoryviews of at most
+    size bytes.
+
+    The response gives up the chunks as they are yielded, so that their memory
+    can be released as soon as they are compressed.
+    """
+    container = content_list(response)
+    for i in range(len(container)):
+        chunk, container[i] = container[i], b""
+        view = memoryview(chunk)
+        del chunk
+        for start in range(0, len(view), size):
+            yield view[start:start + size]
+
+
+async def iterate_in_threads(iterator):
+    """
+    An asynchronous iterator over the items of a synchronous iterator, which
+    are produced in worker threads so that the event loop isn't blocked.
+    """
+    next_item = sync_to_async(partial(next, iterator, _DONE), thread_sensitive=False)
+    try:
+        while True:
+            item = await next_item()
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def streaming_response(response, streaming_content):
+    """A StreamingHttpResponse with the status and headers of the response."""
+    streaming = StreamingHttpResponse(
+        streaming_content,
+        status=response.status_code,
+        reason=response.reason_phrase,
+    )
+    for header, value in response.items():
+        streaming[header] = value
+    streaming.cookies = response.cookies
+    # Resources to close when the response is closed
+    for attr in ("_resource_closers", "_closable_objects"):
+        if hasattr(response, attr):
+            getattr(streaming, attr).extend(getattr(response, attr))
+    return streaming
@@ -0,0 +1,163 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Recommend compression levels from a corpus of real responses.
+
+Collect a corpus with the "CORPUS_DIR" setting of the middleware, copy it
+to a quiet machine with the same kind of CPU, and run:
+
+    python -m compression_middleware.tune /path/to/corpus
+    python -m compression_middleware.tune /path/to/corpus --by content_type --cpu-second-bytes 200000
+
+Every sample is compressed with every codec in compression_middleware.registry
+at several levels. The level with the lowest cost is chosen per encoding for
+all samples together and for every route (or content type), where the cost is
+the compressed size plus the CPU time converted to bytes: --cpu-second-bytes
+says how many bytes of traffic a second of CPU time is worth to you.
+"""
+
+__all__ = ["evaluate", "recommend", "main"]
+
+
+import argparse
+from collections import defaultdict
+import json
+import sys
+import time
+
+from .content_types import mime_type
+from .registry import registry
+from .sampler import read_corpus
+
+
+# The levels tried per encoding. Other encodings are only tried at their
+# default level.
+LEVELS = {
+        "zstd": (1, 3, 5, 7, 9, 12, 15, 19),
+        "br": (0, 1, 2, 3, 4, 5, 6, 7, 9, 11),
+        "gzip": (1, 3, 4, 6, 9),
+}
+
+
+def measure(func, runs):
+    """The shortest time of a few runs of func, and its result."""
+    best = None
+    for i in range(runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def evaluate(corpus, encodings, runs):
+    """
+    Compress every sample at every level, and return the totals as
+    {group: {(encoding, level): [bytes_in, bytes_out, seconds]}} for the
+    groups "route:<route>", "content_type:<type>" and "all".
+    """
+    totals = defaultdict(lambda: defaultdict(lambda: [0, 0, 0.0]))
+    for meta, path in corpus:
+        with open(path, "rb") as f:
+            body = f.read()
+        groups = (
+            "all",
+            "route:%s" % meta.get("route"),
+            "content_type:%s" % mime_type(meta.get("content_type") or ""),
+        )
+        for encoding, compress_func, _, _ in registry.compressors():
+            if encoding not in encodings:
+                continue
+            for level in LEVELS.get(encoding, (None,)):
+                seconds, compressed = measure(
+                    lambda: compress_func(body, level=level), runs
+                )
+                for group in groups:
+                    total = totals[group][(encoding, level)]
+                    total[0] += len(body)
+                    total[1] += len(compressed)
+                    total[2] += seconds
+    return totals
+
+
+def recommend(totals, cpu_second_bytes):
+    """
+    The cheapest level per encoding for every group, as
+    {group: {encoding: result}}.
+    """
+    recommendations = {}
+    for group, results in totals.items():
+        best = {}
+        for (encoding, level), (bytes_in, bytes_out, seconds) in results.items():
+            cost = bytes_out + seconds * cpu_second_bytes
+            if encoding not in best or cost < best[encoding]["cost"]:
+                best[encoding] = {
+                    "level": level,
+                    "cost": cost,
+                    "ratio": bytes_out / bytes_in if bytes_in else 1.0,
+                    "ms_per_mb": seconds * 1e3 / (bytes_in / 1e6) if bytes_in else 0.0,
+                    "bytes_in": bytes_in,
+                }
+        recommendations[group] = best
+    return recommendations
+
+
+def report(recommendations, by):
+    groups = ["all"] + sorted(g for g in recommendations if g.startswith(by + ":"))
+    for group in groups:
+        for encoding, best in sorted(recommendations[group].items(), key=lambda i: i[1]["cost"]):
+            print(
+                "%-40s %-5s level %4s  ratio %6.3f  %9.2f ms/MB  %10d bytes in" % (
+                    group, encoding, best["level"], best["ratio"], best["ms_per_mb"],
+                    best["bytes_in"],
+                )
+            )
+
+    overall = recommendations["all"]
+    levels = {e: best["level"] for e, best in overall.items() if best["level"] is not None}
+    print()
+    print("Suggested settings:")
+    print("    COMPRESSION_MIDDLEWARE = {\"LEVELS\": %s}" % json.dumps(levels))
+    if by == "route":
+        for group in groups[1:]:
+            different = {
+                e: best["level"] for e, best in recommendations[group].items()
+                if best["level"] is not None and best["level"] != levels.get(e)
+            }
+            if different:
+                route = group[len("route:"):]
+                print("    %s: @compress_page(levels=%s)" % (route, json.dumps(different)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", help="the directory with the samples")
+    parser.add_argument("--by", choices=["route", "content_type"], default="route",
+                        help="how to group the samples")
+    parser.add_argument("--encodings", nargs="+", default=[c[0] for c in registry.compressors()])
+    parser.add_argument("--cpu-second-bytes", type=float, default=1e6,
+                        help="how many bytes of traffic a second of CPU time is worth")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="runs per sample and level (the fastest counts)")
+    parser.add_argument("--save", metavar="FILE", help="save the recommendations as JSON")
+    args = parser.parse_args(argv)
+
+    totals = evaluate(read_corpus(args.corpus), args.encodings, args.runs)
+    if not totals:
+        print("The corpus is empty.", file=sys.stderr)
+        return 1
+    recommendations = recommend(totals, args.cpu_second_bytes)
+    report(recommendations, args.by)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(recommendations, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
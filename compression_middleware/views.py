@@ -0,0 +1,37 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+__all__ = ["dictionary"]
+
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+
+from . import middleware
+from .dictionary import load_dictionary
+
+
+# How long clients may keep using a dictionary (in seconds)
+DICTIONARY_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def dictionary(request):
+    """
+    Serve the compression dictionary configured with this URL.
+
+    Add the view to your URLconf at the "url" of each dictionary in
+    compression_middleware.middleware.DICTIONARIES.
+    """
+    for config in middleware.DICTIONARIES:
+        if config.get("url") == request.path:
+            break
+    else:
+        raise Http404("No compression dictionary at this URL")
+    d = load_dictionary(**config)
+    response = HttpResponse(d.data, content_type="application/octet-stream")
+    response["Use-As-Dictionary"] = d.use_as_dictionary()
+    patch_cache_control(response, public=True, max_age=DICTIONARY_MAX_AGE)
+    return response
@@ -0,0 +1,368 @@
+# -*- encoding: utf-8 -*-
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Compression for ASGI and WSGI applications, outside of Django's middleware.
+
+The wrappers use the same codecs, negotiation and policy as the middleware,
+but work on the messages or iterables of the server interface directly. They
+can wrap any application, such as a service combining Django and Starlette:
+
+    application = ASGICompressionWrapper(get_asgi_application())
+    application = WSGICompressionWrapper(get_wsgi_application(), min_len=1000)
+
+The options are the same as those of compress_page(), and override the
+COMPRESSION_MIDDLEWARE settings if Django is configured.
+"""
+
+__all__ = ["ASGICompressionWrapper", "WSGICompressionWrapper"]
+
+
+import asyncio
+from functools import partial
+from itertools import chain
+
+from django.conf import settings
+
+from . import middleware
+from .content_types import ContentTypeFilter
+from .levels import LevelPolicy
+from .middleware import available_encodings, compressors_for, default_policy
+from .policy import compile_policy
+from .registry import registry
+
+
+def _get(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _patch_vary(headers):
+    vary = _get(headers, "vary")
+    if vary is None:
+        return headers + [("Vary", "Accept-Encoding")]
+    fields = [field.strip().lower() for field in vary.split(",")]
+    if "*" in fields or "accept-encoding" in fields:
+        return headers
+    headers = [(key, value) for key, value in headers if key.lower() != "vary"]
+    return headers + [("Vary", vary + ", Accept-Encoding")]
+
+
+def _compressed_headers(headers, encoding, length=None):
+    compressed = []
+    for key, value in headers:
+        name = key.lower()
+        if name == "content-length":
+            continue
+        # If there is a strong ETag, make it weak (see the middleware).
+        if name == "etag" and value.startswith('"'):
+            value = "W/" + value
+        compressed.append((key, value))
+    if length is not None:
+        compressed.append(("Content-Length", str(length)))
+    compressed.append(("Content-Encoding", encoding))
+    return compressed
+
+
+class _CompressionWrapper(object):
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.policy = compile_policy(
+            default_policy(),
+            getattr(settings, "COMPRESSION_MIDDLEWARE", None) if settings.configured else None,
+            available_encodings(),
+            **options
+        )
+        self.level_policy = LevelPolicy(levels=self.policy.levels)
+        self.content_type_filter = ContentTypeFilter(
+            middleware.INCLUDE_CONTENT_TYPES, middleware.EXCLUDE_CONTENT_TYPES
+        )
+
+    def negotiate(self, method, status, headers, accept_encoding):
+        """
+        The compressor (encoding, bulk, stream, async_stream) for a response,
+        where the encoding is None if the client doesn't accept any. None is
+        returned if the response shouldn't be compressed at all.
+        """
+        if method == "HEAD" or status < 200 or status in (204, 206, 304):
+            return None
+        if _get(headers, "content-encoding") is not None:
+            return None
+        if not self.content_type_filter(_get(headers, "content-type")):
+            return None
+        length = _get(headers, "content-length")
+        if length is not None and length.isdigit() and int(length) < self.policy.min_len:
+            return None
+        return compressors_for(accept_encoding, None, self.policy.encodings)
+
+    def compress_bulk(self, bulk, encoding, content):
+        """The compressed content, or None if compression isn't worth it."""
+        level = self.level_policy.level(encoding, len(content))
+        compressed_content = bulk(content, level=level)
+        if len(compressed_content) < len(content) - self.policy.min_improvement:
+            return compressed_content
+        return None
+
+    def stream_kwargs(self, encoding, length=None):
+        kwargs = {"level": self.level_policy.level(encoding, length)}
+        if self.policy.flush is not None and registry.supports_flush(encoding):
+            kwargs["flush"] = self.policy.flush
+        return kwargs
+
+
+class ASGICompressionWrapper(_CompressionWrapper):
+    """
+    Compresses the responses of an ASGI application.
+
+    A response with a single body message is compressed in one go (in a
+    worker thread if it's big), and gets a Content-Length. A response with
+    several body messages is compressed as a stream.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        responder = _ASGIResponder(self, scope, send)
+        try:
+            await self.app(scope, receive, responder.send)
+        finally:
+            responder.close()
+
+
+# states of an _ASGIResponder
+_START = 0
+_PASS = 1
+_PENDING = 2
+_STREAMING = 3
+
+
+class _ASGIResponder(object):
+
+    def __init__(self, wrapper, scope, send):
+        self.wrapper = wrapper
+        self.method = scope.get("method", "GET")
+        self.accept_encoding = ""
+        for key, value in scope.get("headers", ()):
+            if key.lower() == b"accept-encoding":
+                self.accept_encoding = value.decode("latin-1")
+        self._send = send
+        self.state = _START
+        self.start = None
+        self.headers = None
+        self.funcs = None
+        self.queue = None
+        self.task = None
+
+    async def send_start(self, headers):
+        # ASGI header names are lower case.
+        headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+        await self._send(dict(self.start, headers=headers))
+
+    async def send(self, message):
+        if self.state == _START and message["type"] == "http.response.start":
+            self.start = message
+            headers = [
+                (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", ())
+            ]
+            funcs = self.wrapper.negotiate(
+                self.method, message["status"], headers, self.accept_encoding
+            )
+            if funcs is None:
+                self.state = _PASS
+                await self._send(message)
+                return
+            self.headers = _patch_vary(headers)
+            if funcs[0] is None:
+                self.state = _PASS
+                await self.send_start(self.headers)
+                return
+            # Wait for the body to find out how to compress it.
+            self.funcs = funcs
+            self.state = _PENDING
+            return
+
+        if self.state == _PENDING:
+            if message["type"] != "http.response.body":
+                # Some extension (such as a file to send) that we can't compress.
+                self.state = _PASS
+                await self.send_start(self.headers)
+            elif message.get("more_body", False):
+                await self.start_stream()
+            else:
+                await self.send_bulk(message.get("body", b""))
+                return
+
+        if self.state != _STREAMING or message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        if body:
+            await self.feed(body)
+        if not message.get("more_body", False):
+            await self.feed(None)
+            await self.task
+
+    async def send_bulk(self, body):
+        encoding, bulk = self.funcs[:2]
+        compressed_content = None
+        if len(body) >= self.wrapper.policy.min_len:
+            compress = partial(self.wrapper.compress_bulk, bulk, encoding, body)
+            if len(body) >= middleware.ASYNC_OFFLOAD_LEN:
+                # Don't block the event loop with CPU-bound work.
+                loop = asyncio.get_event_loop()
+                compressed_content = await loop.run_in_executor(None, compress)
+            else:
+                compressed_content = compress()
+        self.state = _PASS
+        if compressed_content is None:
+            await self.send_start(self.headers)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+        await self.send_start(
+            _compressed_headers(self.headers, encoding, len(compressed_content))
+        )
+        await self._send({"type": "http.response.body", "body": compressed_content})
+
+    async def start_stream(self):
+        encoding, _, _, async_stream = self.funcs
+        length = _get(self.headers, "content-length")
+        length = int(length) if length and length.isdigit() else None
+        kwargs = self.wrapper.stream_kwargs(encoding, length)
+        await self.send_start(_compressed_headers(self.headers, encoding))
+        # The body is pushed to us, but the stream compressors pull it, so it
+        # is passed through a queue to a task running the compressor.
+        self.queue = asyncio.Queue(maxsize=1)
+        self.task = asyncio.ensure_future(self.pump(async_stream(self.source(), **kwargs)))
+        self.state = _STREAMING
+
+    async def source(self):
+        while True:
+            chunk = await self.queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def pump(self, compressed):
+        async for data in compressed:
+            if data:
+                await self._send({"type": "http.response.body", "body": data, "more_body": True})
+        await self._send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def feed(self, chunk):
+        put = asyncio.ensure_future(self.queue.put(chunk))
+        await asyncio.wait((put, self.task), return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            # The compressor failed, so nobody will take the chunk.
+            put.cancel()
+            await self.task
+
+    def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class WSGICompressionWrapper(_CompressionWrapper):
+    """
+    Compresses the responses of a WSGI application.
+
+    A response is compressed in one go, and gets a Content-Length, if its
+    length is known: if the application sent a Content-Length (of less than
+    STREAM_MIN_LEN, see the middleware), if the result has a length (such
+    as a list), or if it is a Django HttpResponse that isn't streaming, as
+    returned by Django's WSGI handler. Any other response is compressed as a
+    stream.
+    """
+
+    def __call__(self, environ, start_response):
+        captured = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            if captured and captured[0] is None:
+                # The response was started already, so let the server handle
+                # the error.
+                return start_response(status, headers, exc_info)
+            captured[:] = [status, list(headers), exc_info]
+            return written.append
+
+        result = self.app(environ, capture)
+        try:
+            iterator = iter(result)
+            first = []
+            if not captured:
+                # The application calls start_response() when iterated.
+                first = [next(iterator, b"")]
+        except BaseException:
+            _close(result)
+            raise
+        status, headers, exc_info = captured
+        captured[0] = None
+        body = chain(written, first, iterator)
+
+        funcs = self.negotiate(
+            environ.get("REQUEST_METHOD", "GET"), int(status.split(None, 1)[0]), headers,
+            environ.get("HTTP_ACCEPT_ENCODING", ""),
+        )
+        if funcs is None:
+            start_response(status, headers, exc_info)
+            return _ClosingIterator(body, result)
+        headers = _patch_vary(headers)
+        encoding, bulk, stream, _ = funcs
+        if encoding is None:
+            start_response(status, headers, exc_info)
+            return _ClosingIterator(body, result)
+
+        length = _get(headers, "content-length")
+        length = int(length) if length and length.isdigit() else None
+        if length is not None:
+            in_bulk = middleware.STREAM_MIN_LEN is None or length < middleware.STREAM_MIN_LEN
+        else:
+            # A list, or a Django HttpResponse (which has all its content).
+            in_bulk = hasattr(result, "__len__") or getattr(result, "streaming", None) is False
+        if in_bulk:
+            try:
+                content = b"".join(body)
+            finally:
+                _close(result)
+            compressed_content = None
+            if len(content) >= self.policy.min_len:
+                compressed_content = self.compress_bulk(bulk, encoding, content)
+            if compressed_content is None:
+                start_response(status, headers, exc_info)
+                return [content]
+            start_response(
+                status, _compressed_headers(headers, encoding, len(compressed_content)),
+                exc_info,
+            )
+            return [compressed_content]
+
+        start_response(status, _compressed_headers(headers, encoding), exc_info)
+        return _ClosingIterator(stream(body, **self.stream_kwargs(encoding, length)), result)
+
+
+def _close(result):
+    close = getattr(result, "close", None)
+    if close is not None:
+        close()
+
+
+class _ClosingIterator(object):
+    """Iterates over an iterator, and closes the original result when closed."""
+
+    def __init__(self, iterator, result):
+        self.iterator = iterator
+        self.result = result
+
+    def __iter__(self):
+        return iter(self.iterator)
+
+    def close(self):
+        _close(self.iterator)
+        _close(self.result)
@@ -4,29 +4,90 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-__all__ = ["zstd_compress", "zstd_compress_stream"]
+__all__ = [
+        "pooled_stream",
+        "pooled_stream_async",
+        "warm_pool",
+        "zstd_compress",
+        "zstd_compress_parallel",
+        "zstd_compress_stream",
+        "zstd_compress_stream_async",
+]
 
 
 from django.utils.text import StreamingBuffer
 
 import zstandard as zstd
 
+from .flush import coalesce, coalesce_async
+from .pool import ContextPool
+
 
 DEFAULT_LEVEL = 7
 
+# The maximum number of unused compression contexts kept per level
+POOL_SIZE = 8
+
+pool = ContextPool(lambda level: zstd.ZstdCompressor(level=level), POOL_SIZE)
+
+
+def warm_pool(levels):
+    """Prepare compression contexts for the given levels in advance."""
+    # The context only allocates its tables when it is first used.
+    pool.warm(levels, lambda cctx: cctx.compress(b""))
 
-def zstd_compress(content):
-    cctx = zstd.ZstdCompressor(level=DEFAULT_LEVEL)
+
+def zstd_compress(content, level=None):
+    with pool.context(DEFAULT_LEVEL if level is None else level) as cctx:
+        return cctx.compress(content)
+
+
+def zstd_compress_parallel(content, threads, level=None):
+    # zstd splits the input into jobs which are compressed on its own threads.
+    cctx = zstd.ZstdCompressor(level=DEFAULT_LEVEL if level is None else level, threads=threads)
     return cctx.compress(content)
 
 
-def zstd_compress_stream(sequence):
+def pooled_stream(contexts, sequence, level=None, flush=None, header=b""):
+    """
+    Compress the sequence into a frame with a context from the given pool,
+    after the header. (The dictionary compressors use their own pool.)
+    """
     buf = StreamingBuffer()
-    cctx = zstd.ZstdCompressor(level=DEFAULT_LEVEL)
-    with cctx.stream_writer(buf, write_return_read=False) as compressor:
+    with contexts.context(DEFAULT_LEVEL if level is None else level) as cctx, \
+            cctx.stream_writer(buf, write_return_read=False) as compressor:
+        yield header
+        for data, flush_now in coalesce(sequence, flush):
+            compressor.write(data)
+            if flush_now:
+                compressor.flush(zstd.FLUSH_BLOCK)
+            out = buf.read()
+            if out:
+                yield out
+        compressor.flush(zstd.FLUSH_FRAME)
         yield buf.read()
-        for item in sequence:
-            if compressor.write(item):
-                yield buf.read()
+
+
+async def pooled_stream_async(contexts, sequence, level=None, flush=None, header=b""):
+    """Like pooled_stream(), but for asynchronous iterators."""
+    buf = StreamingBuffer()
+    with contexts.context(DEFAULT_LEVEL if level is None else level) as cctx, \
+            cctx.stream_writer(buf, write_return_read=False) as compressor:
+        yield header
+        async for data, flush_now in coalesce_async(sequence, flush):
+            compressor.write(data)
+            if flush_now:
+                compressor.flush(zstd.FLUSH_BLOCK)
+            out = buf.read()
+            if out:
+                yield out
         compressor.flush(zstd.FLUSH_FRAME)
         yield buf.read()
+
+
+def zstd_compress_stream(sequence, level=None, flush=None):
+    return pooled_stream(pool, sequence, level, flush)
+
+
+def zstd_compress_stream_async(sequence, level=None, flush=None):
+    return pooled_stream_async(pool, sequence, level, flush)
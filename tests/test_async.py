@@ -0,0 +1,106 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+from io import BytesIO
+from unittest import skipIf
+
+import brotli
+import django
+import zstandard as zstd
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware.br import brotli_compress_stream_async
+from compression_middleware.gzip import gzip_compress_stream_async
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.zstd import zstd_compress_stream_async
+
+
+async def aiterate(sequence):
+    for item in sequence:
+        yield item
+
+
+async def ajoin(aiterator):
+    return b"".join([chunk async for chunk in aiterator])
+
+
+def gzip_decompress(gzipped_string):
+    with gzip.GzipFile(mode="rb", fileobj=BytesIO(gzipped_string)) as f:
+        return f.read()
+
+
+@skipIf(django.VERSION < (3, 1), "Async middleware requires Django 3.1")
+class AsyncMiddlewareTest(SimpleTestCase):
+    """
+    Tests the middleware in async mode.
+    """
+
+    compressible_string = b"a" * 500
+    sequence = [b"a" * 500, b"b" * 200, b"a" * 300]
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.req = self.request_factory.get("/")
+        self.req.META["HTTP_ACCEPT_ENCODING"] = "gzip, deflate, br"
+
+    async def test_compress_response(self):
+        async def get_response(request):
+            return HttpResponse(self.compressible_string)
+
+        r = await CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(brotli.decompress(r.content), self.compressible_string)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+        self.assertEqual(r.get("Content-Length"), str(len(r.content)))
+
+    async def test_compress_large_response(self):
+        # Big enough to be offloaded to a thread
+        content = b"abcdefgh" * 20000
+
+        async def get_response(request):
+            return HttpResponse(content)
+
+        r = await CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(brotli.decompress(r.content), content)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+
+    async def test_compress_sync_streaming_response(self):
+        async def get_response(request):
+            return StreamingHttpResponse(self.sequence)
+
+        r = await CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(brotli.decompress(b"".join(r)), b"".join(self.sequence))
+        self.assertEqual(r.get("Content-Encoding"), "br")
+
+    @skipIf(django.VERSION < (4, 2), "Async iterators require Django 4.2")
+    async def test_compress_async_streaming_response(self):
+        async def get_response(request):
+            return StreamingHttpResponse(aiterate(self.sequence))
+
+        r = await CompressionMiddleware(get_response)(self.req)
+        self.assertTrue(r.is_async)
+        content = await ajoin(r)
+        self.assertEqual(brotli.decompress(content), b"".join(self.sequence))
+        self.assertEqual(r.get("Content-Encoding"), "br")
+        self.assertFalse(r.has_header("Content-Length"))
+
+
+@skipIf(django.VERSION < (3, 1), "Async tests require Django 3.1")
+class AsyncStreamCompressorTest(SimpleTestCase):
+    sequence = [b"a" * 500, b"b" * 200, b"a" * 300]
+
+    async def test_brotli(self):
+        content = await ajoin(brotli_compress_stream_async(aiterate(self.sequence)))
+        self.assertEqual(brotli.decompress(content), b"".join(self.sequence))
+
+    async def test_zstd(self):
+        content = await ajoin(zstd_compress_stream_async(aiterate(self.sequence)))
+        dctx = zstd.ZstdDecompressor()
+        self.assertEqual(
+            dctx.decompressobj().decompress(content), b"".join(self.sequence)
+        )
+
+    async def test_gzip(self):
+        content = await ajoin(gzip_compress_stream_async(aiterate(self.sequence)))
+        self.assertEqual(gzip_decompress(content), b"".join(self.sequence))
@@ -0,0 +1,164 @@
+# -*- encoding: utf-8 -*-
+
+from unittest import mock
+
+import brotli
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import middleware
+from compression_middleware.cache import (
+    CompressedContentCache, SharedContentCache, content_digest,
+)
+from compression_middleware.middleware import CompressionMiddleware
+
+
+class CompressedContentCacheTest(SimpleTestCase):
+
+    def test_get_set(self):
+        cache = CompressedContentCache(1000)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", b"x" * 10)
+        self.assertEqual(cache.get("a"), b"x" * 10)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.size, 10)
+
+    def test_lru_eviction(self):
+        cache = CompressedContentCache(800)
+        for key in "abcd":
+            cache.set(key, b"x" * 100)
+        cache.get("a")
+        for key in "efghij":
+            cache.set(key, b"x" * 100)
+        self.assertEqual(cache.evictions, 2)
+        self.assertEqual(cache.size, 800)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNone(cache.get("c"))
+
+    def test_replace_entry(self):
+        cache = CompressedContentCache(1000)
+        cache.set("a", b"x" * 100)
+        cache.set("a", b"x" * 50)
+        self.assertEqual(cache.size, 50)
+        self.assertEqual(len(cache), 1)
+
+    def test_digest_of_chunks(self):
+        self.assertEqual(content_digest(b"ab", b"c"), content_digest(b"abc"))
+        self.assertNotEqual(content_digest(b"abc"), content_digest(b"abd"))
+
+    def test_entry_too_big(self):
+        cache = CompressedContentCache(800)
+        cache.set("a", b"x" * 101)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 0)
+
+
+class MiddlewareCacheTest(SimpleTestCase):
+
+    compressible_string = b"a" * 500
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+    def get_response(self, request):
+        return HttpResponse(self.compressible_string)
+
+    def test_no_cache_by_default(self):
+        self.assertIsNone(CompressionMiddleware(self.get_response).cache)
+
+    @mock.patch.object(middleware, "CACHE_MAX_BYTES", 10000)
+    def test_cache_hit(self):
+        m = CompressionMiddleware(self.get_response)
+        r1 = m(self.req)
+        r2 = m(self.req)
+        self.assertEqual(r1.content, r2.content)
+        self.assertEqual(brotli.decompress(r2.content), self.compressible_string)
+        self.assertEqual(r2.get("Content-Encoding"), "br")
+        self.assertEqual(m.cache.hits, 1)
+        self.assertEqual(m.cache.misses, 1)
+
+    @mock.patch.object(middleware, "CACHE_MAX_BYTES", 10000)
+    def test_cache_keyed_by_encoding(self):
+        m = CompressionMiddleware(self.get_response)
+        m(self.req)
+        req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="gzip")
+        r = m(req)
+        self.assertEqual(r.get("Content-Encoding"), "gzip")
+        self.assertEqual(m.cache.hits, 0)
+        self.assertEqual(len(m.cache), 2)
+
+
+class SharedContentCacheTest(SimpleTestCase):
+
+    compressible_string = b"a" * 500
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        self.req = self.request_factory.get("/page", HTTP_ACCEPT_ENCODING="br")
+
+    def get_response(self, request):
+        response = HttpResponse(self.compressible_string)
+        response["Cache-Control"] = "max-age=60"
+        return response
+
+    def test_key(self):
+        cache = SharedContentCache("default", 1000)
+        by_content = cache.key([b"abc"], "br")
+        self.assertEqual(by_content, cache.key([b"ab", b"c"], "br"))
+        self.assertNotEqual(by_content, cache.key([b"abc"], "gzip"))
+        by_etag = cache.key([b"abc"], "br", '"1"', "/a")
+        self.assertEqual(by_etag, cache.key([b"xyz"], "br", '"1"', "/a"))
+        self.assertNotEqual(by_etag, cache.key([b"abc"], "br", '"1"', "/b"))
+        # weak ETags don't guarantee identical content
+        self.assertEqual(cache.key([b"abc"], "br", 'W/"1"', "/a"), by_content)
+
+    @mock.patch.object(middleware, "SHARED_CACHE", "default")
+    def test_shared_between_instances(self):
+        r1 = CompressionMiddleware(self.get_response)(self.req)
+        m = CompressionMiddleware(self.get_response)
+        with mock.patch("compression_middleware.br.compress") as compress:
+            r2 = m(self.req)
+        compress.assert_not_called()
+        self.assertEqual(r2.content, r1.content)
+        self.assertEqual(brotli.decompress(r2.content), self.compressible_string)
+        self.assertEqual(m.shared_cache.stats(), {"hits": 1, "misses": 0})
+
+    @override_settings(COMPRESSION_MIDDLEWARE={
+        "SHARED_CACHE": "default", "SHARED_CACHE_TIMEOUT": 60,
+    })
+    def test_setting(self):
+        m = CompressionMiddleware(self.get_response)
+        self.assertEqual(m.shared_cache.alias, "default")
+        self.assertEqual(m.shared_cache.timeout, 60)
+        m(self.req)
+        m(self.req)
+        self.assertEqual(m.shared_cache.stats(), {"hits": 1, "misses": 1})
+
+    @mock.patch.object(middleware, "SHARED_CACHE", "default")
+    def test_not_cacheable(self):
+        m = CompressionMiddleware(lambda request: HttpResponse(self.compressible_string))
+        m(self.req)
+        m(self.req)
+        self.assertEqual(m.shared_cache.stats(), {"hits": 0, "misses": 0})
+
+    @mock.patch.object(middleware, "SHARED_CACHE", "default")
+    @mock.patch.object(middleware, "SHARED_CACHE_MAX_ENTRY_BYTES", 5)
+    def test_entry_too_big(self):
+        m = CompressionMiddleware(self.get_response)
+        m(self.req)
+        m(self.req)
+        self.assertEqual(m.shared_cache.stats(), {"hits": 0, "misses": 2})
+
+    def test_backend_error(self):
+        cache = SharedContentCache("default", 1000)
+        with mock.patch.object(caches["default"], "get", side_effect=OSError):
+            self.assertIsNone(cache.get("key"))
+        with mock.patch.object(caches["default"], "set", side_effect=OSError):
+            cache.set("key", b"value")
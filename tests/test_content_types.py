@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+
+import tempfile
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware.content_types import ContentTypeFilter
+from compression_middleware.middleware import CompressionMiddleware
+
+
+class ContentTypeFilterTest(SimpleTestCase):
+
+    def test_filter(self):
+        f = ContentTypeFilter(
+            include=("image/svg+xml",),
+            exclude=("image/*", "application/zip"),
+        )
+        self.assertTrue(f("text/html; charset=utf-8"))
+        self.assertTrue(f("image/svg+xml"))
+        self.assertTrue(f("IMAGE/SVG+XML; charset=utf-8"))
+        self.assertTrue(f(""))
+        self.assertTrue(f(None))
+        self.assertFalse(f("image/png"))
+        self.assertFalse(f("application/zip"))
+        self.assertTrue(f("application/json"))
+
+    def test_include_wildcard(self):
+        f = ContentTypeFilter(include=("text/*",), exclude=("text/csv",))
+        self.assertFalse(f("text/csv"))
+        self.assertTrue(f("text/plain"))
+
+
+class MiddlewareContentTypeTest(SimpleTestCase):
+
+    compressible_string = b"a" * 500
+    sequence = [b"a" * 500, b"b" * 200, b"a" * 300]
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+    def test_skip_bulk(self):
+        def get_response(request):
+            return HttpResponse(self.compressible_string, content_type="image/png")
+
+        r = CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(r.content, self.compressible_string)
+        self.assertIsNone(r.get("Content-Encoding"))
+        self.assertFalse(r.has_header("Vary"))
+
+    def test_compress_included(self):
+        def get_response(request):
+            return HttpResponse(self.compressible_string, content_type="image/svg+xml")
+
+        r = CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+
+    def test_skip_streaming(self):
+        def get_response(request):
+            return StreamingHttpResponse(self.sequence, content_type="video/mp4")
+
+        r = CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(b"".join(r), b"".join(self.sequence))
+        self.assertIsNone(r.get("Content-Encoding"))
+
+    def test_skip_file_response(self):
+        with tempfile.NamedTemporaryFile(suffix=".zip") as f:
+            f.write(self.compressible_string)
+            f.flush()
+            f.seek(0)
+
+            def get_response(request):
+                return FileResponse(open(f.name, "rb"))
+
+            r = CompressionMiddleware(get_response)(self.req)
+            self.assertEqual(r.get("Content-Type"), "application/zip")
+            self.assertEqual(b"".join(r), self.compressible_string)
+            self.assertIsNone(r.get("Content-Encoding"))
+            r.close()
@@ -1,6 +1,8 @@
 # -*- encoding: utf-8 -*-
 from __future__ import unicode_literals
 
+import gzip
+
 import brotli
 
 from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
@@ -63,3 +65,24 @@ class CompressPageDecoratorTest(SimpleTestCase):
             brotli.decompress(b"".join(r)),
             b"".join(x.encode("utf-8") for x in self.sequence_unicode)
         )
+
+    def test_options(self):
+        @compress_page(encodings=["gzip"], levels={"gzip": 1})
+        def a_view(request):
+            return self.resp
+
+        r = a_view(self.req)
+        self.assertEqual(r.get("Content-Encoding"), "gzip")
+        self.assertEqual(gzip.decompress(r.content), self.compressible_string)
+
+    def test_min_len_option(self):
+        @compress_page(min_len=1000)
+        def a_view(request):
+            return self.resp
+
+        r = a_view(self.req)
+        self.assertFalse(r.has_header("Content-Encoding"))
+
+    def test_invalid_option(self):
+        with self.assertRaises(TypeError):
+            compress_page(colour="blue")(lambda request: self.resp)
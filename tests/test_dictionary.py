@@ -0,0 +1,169 @@
+# -*- encoding: utf-8 -*-
+
+import json
+import os
+import tempfile
+from unittest import mock
+
+import zstandard as zstd
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import middleware
+from compression_middleware.dictionary import (
+    Dictionary, load_dictionary, main, train_dictionary,
+)
+from compression_middleware.middleware import CompressionMiddleware, compressor
+from compression_middleware.views import dictionary as dictionary_view
+
+
+SAMPLES = [
+    json.dumps({
+        "id": i,
+        "username": "user%d" % i,
+        "email": "user%d@example.com" % i,
+        "active": i % 3 != 0,
+        "groups": ["editors", "admins", "viewers"][:i % 4],
+    }).encode("utf-8") * 6
+    for i in range(1000)
+]
+
+
+def dcz_decompress(content, dictionary):
+    dict_data = zstd.ZstdCompressionDict(dictionary.data, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+    return zstd.ZstdDecompressor(dict_data=dict_data).decompressobj().decompress(content[40:])
+
+
+class DictionaryTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dictionary = Dictionary(train_dictionary(SAMPLES, 4096), "/api/*", id="api")
+
+    def test_compress(self):
+        content = SAMPLES[42]
+        compressed = self.dictionary.compress(content)
+        self.assertEqual(compressed[:8], b"\x5e\x2a\x4d\x18\x20\x00\x00\x00")
+        self.assertEqual(compressed[8:40], self.dictionary.hash)
+        self.assertEqual(dcz_decompress(compressed, self.dictionary), content)
+        self.assertLess(len(compressed), len(zstd.ZstdCompressor(level=7).compress(content)))
+
+    def test_compress_stream(self):
+        content = SAMPLES[42]
+        compressed = b"".join(self.dictionary.compress_stream([content[:100], content[100:]]))
+        self.assertEqual(dcz_decompress(compressed, self.dictionary), content)
+
+    def test_matches(self):
+        self.assertTrue(self.dictionary.matches("/api/"))
+        self.assertTrue(self.dictionary.matches("/api/users/1"))
+        self.assertFalse(self.dictionary.matches("/apix"))
+        self.assertFalse(self.dictionary.matches("/static/api/"))
+
+    def test_use_as_dictionary(self):
+        self.assertEqual(self.dictionary.use_as_dictionary(), 'match="/api/*", id="api"')
+
+    def test_negotiation(self):
+        d = self.dictionary
+        self.assertEqual(compressor("gzip, br, zstd, dcz", d)[0], "dcz")
+        self.assertEqual(compressor("gzip, br, zstd, dcz")[0], "zstd")
+        self.assertEqual(compressor("gzip, br, zstd", d)[0], "zstd")
+        self.assertEqual(compressor("*", d)[0], "zstd")
+        self.assertEqual(compressor("br, dcz;q=0.5", d)[0], "br")
+        self.assertEqual(compressor("gzip, dcz", d, ("gzip",))[0], "gzip")
+        self.assertEqual(compressor("gzip, dcz", d, ("gzip", "dcz"))[0], "dcz")
+
+    def test_train_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = []
+            for i, sample in enumerate(SAMPLES):
+                names.append(os.path.join(tmp, "%d.json" % i))
+                with open(names[-1], "wb") as f:
+                    f.write(sample)
+            output = os.path.join(tmp, "api.dict")
+            with mock.patch("sys.stdout"):
+                self.assertEqual(main(["--size", "2048", "-o", output] + names), 0)
+            self.assertEqual(os.path.getsize(output), 2048)
+
+
+class MiddlewareDictionaryTest(SimpleTestCase):
+
+    request_factory = RequestFactory()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, "api.dict")
+        with open(path, "wb") as f:
+            f.write(train_dictionary(SAMPLES, 4096))
+        cls.config = {"path": path, "match": "/api/*", "url": "/dictionaries/api"}
+        cls.dictionary = load_dictionary(**cls.config)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        patcher = mock.patch.object(middleware, "DICTIONARIES", [self.config])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_response(self, request):
+        return HttpResponse(SAMPLES[7], content_type="application/json")
+
+    def test_compress_with_dictionary(self):
+        req = self.request_factory.get(
+            "/api/users/7",
+            HTTP_ACCEPT_ENCODING="gzip, br, zstd, dcz",
+            HTTP_AVAILABLE_DICTIONARY=self.dictionary.available_dictionary,
+        )
+        r = CompressionMiddleware(self.get_response)(req)
+        self.assertEqual(r.get("Content-Encoding"), "dcz")
+        self.assertEqual(r.get("Vary"), "Accept-Encoding, Available-Dictionary")
+        self.assertEqual(dcz_decompress(r.content, self.dictionary), SAMPLES[7])
+        self.assertFalse(r.has_header("Link"))
+
+    def test_unknown_dictionary(self):
+        req = self.request_factory.get(
+            "/api/users/7",
+            HTTP_ACCEPT_ENCODING="gzip, br, zstd, dcz",
+            HTTP_AVAILABLE_DICTIONARY=":AAAA:",
+        )
+        r = CompressionMiddleware(self.get_response)(req)
+        self.assertEqual(r.get("Content-Encoding"), "zstd")
+        self.assertEqual(r.get("Link"), '</dictionaries/api>; rel="compression-dictionary"')
+
+    def test_no_dictionary_support(self):
+        req = self.request_factory.get("/api/users/7", HTTP_ACCEPT_ENCODING="gzip, br")
+        r = CompressionMiddleware(self.get_response)(req)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+        self.assertFalse(r.has_header("Link"))
+        self.assertEqual(r.get("Vary"), "Accept-Encoding, Available-Dictionary")
+
+    def test_path_not_matching(self):
+        req = self.request_factory.get(
+            "/other/",
+            HTTP_ACCEPT_ENCODING="gzip, br, zstd, dcz",
+            HTTP_AVAILABLE_DICTIONARY=self.dictionary.available_dictionary,
+        )
+        r = CompressionMiddleware(self.get_response)(req)
+        self.assertEqual(r.get("Content-Encoding"), "zstd")
+        self.assertEqual(r.get("Vary"), "Accept-Encoding")
+
+    def test_view(self):
+        r = dictionary_view(self.request_factory.get("/dictionaries/api"))
+        self.assertEqual(r.content, self.dictionary.data)
+        self.assertEqual(r["Use-As-Dictionary"], 'match="/api/*"')
+        self.assertIn("max-age", r["Cache-Control"])
+
+    def test_not_in_encodings(self):
+        req = self.request_factory.get(
+            "/api/users/7",
+            HTTP_ACCEPT_ENCODING="gzip, br, zstd, dcz",
+            HTTP_AVAILABLE_DICTIONARY=self.dictionary.available_dictionary,
+        )
+        r = CompressionMiddleware(self.get_response, encodings=["gzip"])(req)
+        self.assertEqual(r.get("Content-Encoding"), "gzip")
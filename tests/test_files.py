@@ -0,0 +1,156 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import brotli
+import zstandard as zstd
+
+from django.http import FileResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import middleware
+from compression_middleware.middleware import CompressionMiddleware
+
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+CONTENT = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8") * 20
+
+
+class PrecompressedTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "report.csv")
+        with open(self.path, "wb") as f:
+            f.write(CONTENT)
+        self.middleware = CompressionMiddleware(lambda request: None)
+
+    def write_sibling(self, extension, data):
+        with open(self.path + extension, "wb") as f:
+            f.write(data)
+
+    def get(self, accept_encoding):
+        request = RequestFactory().get("/report.csv", HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = FileResponse(open(self.path, "rb"), as_attachment=True)
+        response = self.middleware.process_response(request, response)
+        self.addCleanup(response.close)
+        return response
+
+    def test_sibling_is_served(self):
+        self.write_sibling(".br", brotli.compress(CONTENT))
+        self.write_sibling(".gz", gzip.compress(CONTENT))
+        response = self.get("gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="report.csv"', response["Content-Disposition"])
+        self.assertEqual(response.file_to_stream.name, self.path + ".br")
+        body = b"".join(response.streaming_content)
+        self.assertEqual(response["Content-Length"], str(len(body)))
+        self.assertEqual(brotli.decompress(body), CONTENT)
+
+    def test_client_preference(self):
+        self.write_sibling(".zst", zstd.ZstdCompressor().compress(CONTENT))
+        self.write_sibling(".gz", gzip.compress(CONTENT))
+        response = self.get("zstd;q=0.5, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), CONTENT)
+
+    def test_stale_sibling_is_ignored(self):
+        self.write_sibling(".br", brotli.compress(CONTENT))
+        stat = os.stat(self.path)
+        os.utime(self.path + ".br", (stat.st_atime, stat.st_mtime - 60))
+        response = self.get("br")
+        # compressed on the fly instead
+        self.assertIsNone(response.file_to_stream)
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), CONTENT)
+
+    def test_sibling_not_accepted(self):
+        self.write_sibling(".zst", zstd.ZstdCompressor().compress(CONTENT))
+        response = self.get("gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIsNone(response.file_to_stream)
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), CONTENT)
+
+    def test_disabled(self):
+        self.write_sibling(".br", brotli.compress(CONTENT))
+        with mock.patch.object(middleware, "PRECOMPRESSED_EXTENSIONS", {}):
+            response = self.get("br")
+        self.assertIsNone(response.file_to_stream)
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), CONTENT)
+
+
+class FileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache_dir = os.path.join(self.dir, "cache")
+        self.path = os.path.join(self.dir, "report.csv")
+        with open(self.path, "wb") as f:
+            f.write(CONTENT)
+        patcher = mock.patch.object(middleware, "FILE_CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.middleware = CompressionMiddleware(lambda request: None)
+
+    def get(self, accept_encoding="br"):
+        request = RequestFactory().get("/report.csv", HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = FileResponse(open(self.path, "rb"))
+        response = self.middleware.process_response(request, response)
+        self.addCleanup(response.close)
+        return response
+
+    def cached_files(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_write_through(self):
+        response = self.get()
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(self.cached_files(), [])
+        body = b"".join(response.streaming_content)
+        self.assertEqual(brotli.decompress(body), CONTENT)
+        [name] = self.cached_files()
+        self.assertTrue(name.endswith(".br"))
+
+        response = self.get()
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response.file_to_stream.name, os.path.join(self.cache_dir, name))
+        self.assertEqual(response["Content-Length"], str(len(body)))
+        self.assertEqual(b"".join(response.streaming_content), body)
+
+    def test_per_encoding(self):
+        b"".join(self.get("br").streaming_content)
+        response = self.get("gzip")
+        self.assertIsNone(response.file_to_stream)
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), CONTENT)
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_modified_file(self):
+        b"".join(self.get().streaming_content)
+        with open(self.path, "ab") as f:
+            f.write(b"more")
+        response = self.get()
+        self.assertIsNone(response.file_to_stream)
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), CONTENT + b"more")
+
+    def test_incomplete_stream_not_cached(self):
+        cache = self.middleware.file_cache
+        key = cache.key(self.path, "br")
+        stream = cache.fill(key, self.path, "br", iter([b"a", b"b"]))
+        self.assertEqual(next(stream), b"a")
+        stream.close()
+        self.assertEqual(self.cached_files(), [])
+
+    def test_eviction(self):
+        cache = self.middleware.file_cache
+        cache.max_bytes = 1
+        b"".join(self.get("br").streaming_content)
+        self.assertEqual(self.cached_files(), [])
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+
+import asyncio
+from unittest import mock, skipIf
+
+import brotli
+import django
+import zstandard as zstd
+
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import flush
+from compression_middleware.br import brotli_compress_stream
+from compression_middleware.flush import EVERY_CHUNK, FlushPolicy, coalesce, coalesce_async
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.zstd import zstd_compress_stream, zstd_compress_stream_async
+
+
+EVENTS = [b"data: event %d\n\n" % i for i in range(3)]
+
+
+def brotli_partial(chunks):
+    return brotli.Decompressor().process(b"".join(chunks))
+
+
+def zstd_partial(chunks):
+    return zstd.ZstdDecompressor().decompressobj().decompress(b"".join(chunks))
+
+
+async def aiterate(sequence, delay=0):
+    for item in sequence:
+        yield item
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CoalesceTest(SimpleTestCase):
+
+    def test_no_flush(self):
+        self.assertEqual(list(coalesce([b"a", b"", b"b"])), [(b"ab", False)])
+
+    def test_every_chunk(self):
+        self.assertEqual(
+            list(coalesce([b"a", b"", b"b"], EVERY_CHUNK)),
+            [(b"a", True), (b"b", True)],
+        )
+
+    def test_size(self):
+        self.assertEqual(
+            list(coalesce([b"aa", b"bb", b"cc"], FlushPolicy(size=3))),
+            [(b"aabb", True), (b"cc", False)],
+        )
+
+    def test_interval(self):
+        times = iter([0.0, 0.01, 0.2, 0.21])
+        with mock.patch.object(flush.time, "monotonic", lambda: next(times)):
+            self.assertEqual(
+                list(coalesce([b"a", b"b"], FlushPolicy(interval=0.1))),
+                [(b"ab", True)],
+            )
+
+    @skipIf(django.VERSION < (3, 1), "Async tests require Django 3.1")
+    async def test_interval_async(self):
+        # The first event is flushed before the (slow) second one arrives.
+        sequence = aiterate([b"a", b"b"], delay=0.5)
+        stream = coalesce_async(sequence, FlushPolicy(interval=0.02)).__aiter__()
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        self.assertEqual(await stream.__anext__(), (b"a", True))
+        self.assertLess(loop.time() - start, 0.4)
+        self.assertEqual([out async for out in stream], [(b"b", True)])
+
+    @skipIf(django.VERSION < (3, 1), "Async tests require Django 3.1")
+    async def test_no_interval_async(self):
+        result = [out async for out in coalesce_async(aiterate([b"a", b"b"]), EVERY_CHUNK)]
+        self.assertEqual(result, [(b"a", True), (b"b", True)])
+
+
+def compile_flush(value):
+    return CompressionMiddleware(lambda request: None, flush=value).policy.flush
+
+
+class StreamFlushTest(SimpleTestCase):
+
+    def check_every_chunk(self, stream_func, partial):
+        stream = stream_func(iter(EVENTS), flush=EVERY_CHUNK)
+        chunks = [next(stream), next(stream)]
+        self.assertEqual(partial(chunks), EVENTS[0])
+        chunks.append(next(stream))
+        self.assertEqual(partial(chunks), EVENTS[0] + EVENTS[1])
+        chunks.extend(stream)
+        self.assertEqual(partial(chunks), b"".join(EVENTS))
+
+    def test_brotli(self):
+        self.check_every_chunk(brotli_compress_stream, brotli_partial)
+
+    def test_zstd(self):
+        self.check_every_chunk(zstd_compress_stream, zstd_partial)
+
+    @skipIf(django.VERSION < (3, 1), "Async tests require Django 3.1")
+    async def test_zstd_async(self):
+        stream = zstd_compress_stream_async(aiterate(EVENTS), flush=EVERY_CHUNK).__aiter__()
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        self.assertEqual(zstd_partial(chunks), EVENTS[0])
+
+
+class MiddlewareFlushTest(SimpleTestCase):
+
+    @override_settings(COMPRESSION_MIDDLEWARE={"FLUSH": {"size": 0}})
+    def test_setting(self):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br")
+        response = StreamingHttpResponse(iter(EVENTS), content_type="text/event-stream")
+        response = CompressionMiddleware(lambda request: None).process_response(
+            request, response
+        )
+        stream = iter(response.streaming_content)
+        chunks = [next(stream), next(stream)]
+        self.assertEqual(brotli_partial(chunks), EVENTS[0])
+
+    def test_option(self):
+        self.assertEqual(compile_flush({"SIZE": 10}).size, 10)
+        self.assertEqual(compile_flush(EVERY_CHUNK).size, 0)
+        self.assertIsNone(compile_flush(None))
+        with self.assertRaises(ValueError):
+            compile_flush({"often": True})
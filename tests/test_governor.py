@@ -0,0 +1,143 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+from unittest import mock
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import governor as governor_module, middleware
+from compression_middleware.decorators import compress_page
+from compression_middleware.governor import (
+    STAGE_FASTEST, STAGE_LOW, STAGE_NORMAL, STAGE_SHED, Governor, process_governor,
+)
+from compression_middleware.levels import LevelPolicy
+from compression_middleware.metrics import Metrics
+from compression_middleware.middleware import CompressionMiddleware
+
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class GovernorTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(governor_module.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.governor = Governor(0.5)
+
+    def run_seconds(self, seconds, load):
+        """Simulate the given load (seconds per second) for a while."""
+        for i in range(seconds):
+            self.clock.now += 1
+            self.governor.record(load)
+
+    def test_degrade_and_recover(self):
+        self.run_seconds(3, 0.1)
+        self.assertEqual(self.governor.stage(), STAGE_NORMAL)
+        # It degrades one stage per second while over budget.
+        self.run_seconds(1, 2.0)
+        self.assertEqual(self.governor.stage(), STAGE_LOW)
+        self.run_seconds(1, 1.0)
+        self.assertEqual(self.governor.stage(), STAGE_FASTEST)
+        self.run_seconds(1, 1.0)
+        self.assertEqual(self.governor.stage(), STAGE_SHED)
+        self.run_seconds(3, 1.0)
+        self.assertEqual(self.governor.stage(), STAGE_SHED)
+        state = self.governor.state()
+        self.assertEqual(state["stage"], "shed")
+        self.assertEqual(state["budget"], 0.5)
+        self.assertGreater(state["load"], 0.5)
+        # Nothing is compressed while shedding, but it still recovers.
+        self.clock.now += 5
+        self.assertEqual(self.governor.stage(), STAGE_FASTEST)
+        # It stays at a stage for a while before recovering further.
+        self.run_seconds(2, 0.1)
+        self.assertEqual(self.governor.stage(), STAGE_FASTEST)
+        self.run_seconds(20, 0.1)
+        self.assertEqual(self.governor.stage(), STAGE_NORMAL)
+
+    def test_hysteresis(self):
+        self.run_seconds(2, 1.0)
+        self.assertEqual(self.governor.stage(), STAGE_FASTEST)
+        # under budget, but not by enough to recover
+        self.run_seconds(20, 0.4)
+        self.assertEqual(self.governor.stage(), STAGE_FASTEST)
+
+    def test_lowest_levels(self):
+        policy = LevelPolicy(governor=self.governor)
+        self.assertEqual(policy.level("br", 1000), 4)
+        self.run_seconds(1, 1.0)
+        self.assertEqual(policy.level("br", 1000), 0)
+        self.assertEqual(policy.level("zstd", 1000), 1)
+
+    def test_process_governor(self):
+        self.assertIs(process_governor(0.5), process_governor(0.5))
+        self.assertEqual(process_governor(0.25).budget, 0.25)
+
+
+class MiddlewareGovernorTest(SimpleTestCase):
+
+    content = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8")
+
+    def setUp(self):
+        settings = override_settings(COMPRESSION_MIDDLEWARE={"CPU_BUDGET": 0.5})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br, gzip")
+
+    def process(self, stage, middleware_=None):
+        middleware_ = middleware_ or CompressionMiddleware(lambda request: None)
+        middleware_.metrics = Metrics()
+        with mock.patch.object(Governor, "stage", return_value=stage):
+            response = middleware_.process_response(self.request, HttpResponse(self.content))
+        return middleware_, response
+
+    def test_fastest(self):
+        _, response = self.process(STAGE_FASTEST)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.content)
+
+    def test_shed(self):
+        m, response = self.process(STAGE_SHED)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(m.metrics.skips["overload"], 1)
+
+    def test_shed_critical(self):
+        view = compress_page(critical=True)(lambda request: HttpResponse(self.content))
+        with mock.patch.object(Governor, "stage", return_value=STAGE_SHED):
+            response = view(self.request)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_streaming_recorded(self):
+        m = CompressionMiddleware(lambda request: None)
+        self.assertIsNone(m.metrics)
+        response = StreamingHttpResponse([self.content] * 3)
+        with mock.patch.object(Governor, "record") as record:
+            response = m.process_response(self.request, response)
+            b"".join(response.streaming_content)
+        self.assertEqual(response["Content-Encoding"], "br")
+        record.assert_called_once()
+
+    @mock.patch.object(middleware, "PARALLEL_MIN_LEN", 1000)
+    @mock.patch.object(middleware, "PARALLEL_THREADS", 4)
+    def test_parallel_recorded_per_thread(self):
+        m = CompressionMiddleware(lambda request: None)
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        clock = mock.Mock(**{"perf_counter.side_effect": [0.0, 1.0]})
+        with mock.patch.object(Governor, "record") as record, \
+                mock.patch.object(middleware, "time", clock):
+            response = m.process_response(request, HttpResponse(self.content))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        record.assert_called_once_with(4.0)
@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+import zlib
+from io import BytesIO
+from unittest import skipIf
+
+import django
+from django.test import SimpleTestCase
+
+from compression_middleware.gzip import (
+    gzip_compress, gzip_compress_stream, gzip_compress_stream_async,
+)
+from compression_middleware.flush import EVERY_CHUNK, FlushPolicy
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+CONTENT = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8")
+
+
+def gzip_decompress(gzipped_string):
+    with gzip.GzipFile(mode="rb", fileobj=BytesIO(gzipped_string)) as f:
+        return f.read()
+
+
+def partial_decompress(chunks):
+    """Decompress whatever can be decompressed from the chunks so far."""
+    return zlib.decompressobj(31).decompress(b"".join(chunks))
+
+
+class GzipTest(SimpleTestCase):
+
+    def test_bulk(self):
+        compressed = gzip_compress(CONTENT)
+        self.assertEqual(gzip_decompress(compressed), CONTENT)
+        self.assertEqual(compressed, gzip_compress(CONTENT))
+        with gzip.GzipFile(mode="rb", fileobj=BytesIO(compressed)) as f:
+            f.read()
+            self.assertEqual(f.mtime, 0)
+
+    def test_levels(self):
+        content = CONTENT * 10
+        self.assertLess(
+            len(gzip_compress(content, level=9, mem_level=9)),
+            len(gzip_compress(content, level=1, mem_level=1)),
+        )
+        self.assertEqual(gzip_decompress(gzip_compress(content, level=0)), content)
+
+    def test_stream(self):
+        sequence = [CONTENT[i:i + 100] for i in range(0, len(CONTENT), 100)]
+        compressed = b"".join(gzip_compress_stream(sequence))
+        self.assertEqual(gzip_decompress(compressed), CONTENT)
+        # no flushes, so just like bulk compression
+        self.assertEqual(compressed, gzip_compress(CONTENT))
+
+    def test_stream_coalesces_small_chunks(self):
+        sequence = [b"a"] * 100000
+        chunks = [c for c in gzip_compress_stream(sequence) if c]
+        self.assertEqual(gzip_decompress(b"".join(chunks)), b"a" * 100000)
+        self.assertLess(len(chunks), 5)
+
+    def test_stream_flush_every_chunk(self):
+        sequence = [b"first chunk", b"second chunk"]
+        stream = gzip_compress_stream(iter(sequence), flush=EVERY_CHUNK)
+        chunks = [next(stream), next(stream)]
+        self.assertEqual(partial_decompress(chunks), b"first chunk")
+        chunks.append(next(stream))
+        self.assertEqual(partial_decompress(chunks), b"first chunksecond chunk")
+        chunks.extend(stream)
+        self.assertEqual(gzip_decompress(b"".join(chunks)), b"".join(sequence))
+
+    def test_stream_flush_size(self):
+        sequence = [b"x" * 10] * 10
+        stream = gzip_compress_stream(iter(sequence), flush=FlushPolicy(size=50))
+        chunks = [next(stream), next(stream)]
+        self.assertEqual(partial_decompress(chunks), b"x" * 50)
+        chunks.extend(stream)
+        self.assertEqual(gzip_decompress(b"".join(chunks)), b"x" * 100)
+
+    @skipIf(django.VERSION < (3, 1), "Async tests require Django 3.1")
+    async def test_stream_async(self):
+        async def aiterate(sequence):
+            for item in sequence:
+                yield item
+
+        sequence = [b"first chunk", b"second chunk"]
+        chunks = [c async for c in gzip_compress_stream_async(aiterate(sequence), flush=EVERY_CHUNK)]
+        self.assertEqual(partial_decompress(chunks[:2]), b"first chunk")
+        self.assertEqual(gzip_decompress(b"".join(chunks)), b"".join(sequence))
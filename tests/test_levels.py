@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+
+from unittest import mock
+
+import brotli
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import levels
+from compression_middleware.levels import LevelPolicy, is_cacheable
+from compression_middleware.middleware import CompressionMiddleware
+
+
+class IsCacheableTest(SimpleTestCase):
+
+    def test_is_cacheable(self):
+        def response(cache_control=None):
+            r = HttpResponse()
+            if cache_control:
+                r["Cache-Control"] = cache_control
+            return r
+
+        self.assertFalse(is_cacheable(response()))
+        self.assertTrue(is_cacheable(response("max-age=3600")))
+        self.assertTrue(is_cacheable(response("public, s-maxage=60")))
+        self.assertFalse(is_cacheable(response("max-age=0")))
+        self.assertFalse(is_cacheable(response("private, max-age=3600")))
+        self.assertFalse(is_cacheable(response("no-store")))
+
+
+class LevelPolicyTest(SimpleTestCase):
+
+    def test_size_based_levels(self):
+        policy = LevelPolicy()
+        self.assertEqual(policy.level("br", 1000, cacheable=True), 9)
+        self.assertEqual(policy.level("br", 1000), 4)
+        self.assertEqual(policy.level("br", 100000, cacheable=True), 4)
+        self.assertEqual(policy.level("br", 10 * 1024 * 1024), 2)
+        self.assertEqual(policy.level("zstd"), 7)
+
+    def test_normal_is_default_level(self):
+        from compression_middleware import br, gzip, zstd
+        self.assertEqual(levels.LEVELS["br"][1], br.DEFAULT_LEVEL)
+        self.assertEqual(levels.LEVELS["gzip"][1], gzip.DEFAULT_LEVEL)
+        self.assertEqual(levels.LEVELS["zstd"][1], zstd.DEFAULT_LEVEL)
+        self.assertEqual(levels.LEVELS["dcz"][1], zstd.DEFAULT_LEVEL)
+
+    def test_record_without_governor(self):
+        policy = LevelPolicy()
+        policy.record(100.0)
+        self.assertEqual(policy.level("br", 1000), 4)
+
+
+class MiddlewareLevelTest(SimpleTestCase):
+
+    request_factory = RequestFactory()
+
+    def test_level_used(self):
+        def get_response(request):
+            response = HttpResponse(b"a" * 1000)
+            response["Cache-Control"] = "max-age=600"
+            return response
+
+        req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="br")
+        with mock.patch.object(levels.LevelPolicy, "level", return_value=9) as level:
+            r = CompressionMiddleware(get_response)(req)
+        level.assert_called_once_with("br", 1000, True)
+        self.assertEqual(brotli.decompress(r.content), b"a" * 1000)
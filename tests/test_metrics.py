@@ -0,0 +1,165 @@
+# -*- encoding: utf-8 -*-
+
+import os
+from unittest import mock
+
+import brotli
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import middleware
+from compression_middleware.br import brotli_compress_stream
+from compression_middleware.metrics import Metrics, metered_stream, server_timing
+from compression_middleware.middleware import CompressionMiddleware
+
+
+class MetricsTest(SimpleTestCase):
+
+    def test_counters(self):
+        metrics = Metrics()
+        metrics.compressed("br", 4, 1000, 100, 0.5)
+        metrics.compressed("br", 5, 1000, 200, 0.25)
+        metrics.skipped("min_len")
+        metrics.skipped("improvement", 0.125)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot[("responses", (("encoding", "br"), ("level", "4")))], 1)
+        self.assertEqual(snapshot[("bytes_in", (("encoding", "br"),))], 2000)
+        self.assertEqual(snapshot[("bytes_out", (("encoding", "br"),))], 300)
+        self.assertEqual(snapshot[("seconds", (("encoding", "br"),))], 0.75)
+        self.assertEqual(snapshot[("skipped", (("reason", "min_len"),))], 1)
+        self.assertEqual(snapshot[("wasted_seconds", (("reason", "improvement"),))], 0.125)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.compressed("br", 4, 1000, 100, 0.5)
+        metrics.skipped("min_len")
+        text = metrics.prometheus()
+        self.assertIn("# TYPE compression_bytes_in_total counter\n", text)
+        self.assertIn('compression_responses_total{encoding="br",level="4"} 1\n', text)
+        self.assertIn('compression_skipped_total{reason="min_len"} 1\n', text)
+
+    def test_metered_stream(self):
+        sequence = [b"a" * 500, b"b" * 200, b"a" * 300]
+        done = mock.Mock()
+        compressed = b"".join(metered_stream(brotli_compress_stream, sequence, done, level=4))
+        self.assertEqual(brotli.decompress(compressed), b"".join(sequence))
+        done.assert_called_once()
+        bytes_in, bytes_out, seconds = done.call_args[0]
+        self.assertEqual(bytes_in, 1000)
+        self.assertEqual(bytes_out, len(compressed))
+        self.assertGreaterEqual(seconds, 0)
+
+
+class MiddlewareMetricsTest(SimpleTestCase):
+
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.metrics = Metrics()
+        for patcher in (
+                mock.patch.object(middleware, "METRICS", "metrics"),
+                mock.patch.object(middleware, "import_string", return_value=self.metrics)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="br")
+
+    def run_middleware(self, response, req=None):
+        return CompressionMiddleware(lambda request: response)(req or self.req)
+
+    def skips(self):
+        return dict(self.metrics.skips)
+
+    def test_compressed(self):
+        r = self.run_middleware(HttpResponse(b"a" * 1000))
+        self.assertEqual(self.metrics.bytes_in["br"], 1000)
+        self.assertEqual(self.metrics.bytes_out["br"], len(r.content))
+        self.assertEqual(sum(self.metrics.responses.values()), 1)
+
+    def test_streaming(self):
+        r = self.run_middleware(StreamingHttpResponse([b"a" * 500, b"b" * 500]))
+        self.assertEqual(self.metrics.bytes_in, {})
+        content = b"".join(r)
+        self.assertEqual(self.metrics.bytes_in["br"], 1000)
+        self.assertEqual(self.metrics.bytes_out["br"], len(content))
+
+    def test_skip_reasons(self):
+        self.run_middleware(HttpResponse(b"a"))
+        self.assertEqual(self.skips(), {"min_len": 1})
+        response = HttpResponse(b"a" * 1000)
+        response["Content-Encoding"] = "gzip"
+        self.run_middleware(response)
+        self.run_middleware(HttpResponse(b"a" * 1000, content_type="image/png"))
+        self.run_middleware(HttpResponse(b"a" * 1000), self.request_factory.get("/"))
+        self.run_middleware(HttpResponse(os.urandom(1000)))
+        self.assertEqual(self.skips(), {
+            "min_len": 1,
+            "encoded": 1,
+            "content_type": 1,
+            "no_encoding": 1,
+            "improvement": 1,
+        })
+        self.assertIn("improvement", self.metrics.wasted_seconds)
+
+    @mock.patch.object(middleware, "METRICS", None)
+    def test_disabled(self):
+        m = CompressionMiddleware(lambda request: HttpResponse(b"a" * 1000))
+        self.assertIsNone(m.metrics)
+        r = m(self.req)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+
+
+class ServerTimingTest(SimpleTestCase):
+
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        patcher = mock.patch.object(middleware, "SERVER_TIMING", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="br")
+
+    def run_middleware(self, response):
+        return CompressionMiddleware(lambda request: response)(self.req)
+
+    def test_entry(self):
+        self.assertEqual(
+            server_timing(0.0012, "br", 4, 10000, 6100),
+            'compress;dur=1.2;desc="br q4 10000>6100 61%"',
+        )
+        self.assertEqual(server_timing(0, reason="min_len"), 'compress;dur=0.0;desc="skip min_len"')
+        self.assertEqual(server_timing(None, "gzip", "cached"), 'compress;desc="gzip cached"')
+
+    def test_compressed(self):
+        r = self.run_middleware(HttpResponse(b"a" * 1000))
+        self.assertRegex(
+            r["Server-Timing"],
+            r'^compress;dur=[\d.]+;desc="br q\d+ 1000>%d \d+%%"$' % len(r.content),
+        )
+
+    def test_skipped(self):
+        response = HttpResponse(b"a")
+        response["Server-Timing"] = "db;dur=53"
+        r = self.run_middleware(response)
+        self.assertEqual(r["Server-Timing"], 'db;dur=53, compress;dur=0.0;desc="skip min_len"')
+
+    @mock.patch.object(middleware, "METRICS", None)
+    def test_streaming(self):
+        r = self.run_middleware(StreamingHttpResponse([b"a" * 500, b"b" * 500]))
+        self.assertRegex(r["Server-Timing"], r'^compress;desc="br q\d+"$')
+        with self.assertLogs("compression_middleware.middleware", "INFO") as logs:
+            b"".join(r)
+        self.assertRegex(logs.output[-1], r'compress;dur=[\d.]+;desc="br q\d+ 1000>\d+ \d+%"')
+
+    @mock.patch.object(middleware, "SERVER_TIMING", False)
+    def test_disabled(self):
+        r = self.run_middleware(HttpResponse(b"a" * 1000))
+        self.assertFalse(r.has_header("Server-Timing"))
+
+    @mock.patch.object(middleware, "SERVER_TIMING", False)
+    @override_settings(COMPRESSION_MIDDLEWARE={"SERVER_TIMING": True})
+    def test_setting(self):
+        r = self.run_middleware(HttpResponse(b"a" * 1000))
+        self.assertTrue(r.has_header("Server-Timing"))
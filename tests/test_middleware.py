@@ -26,7 +26,9 @@ except NameError:
     import struct
     int2byte = struct.Struct(">B").pack
 
-from compression_middleware.middleware import CompressionMiddleware, compressor
+from compression_middleware.middleware import (
+    CompressionMiddleware, compressor, compressors_for, encoding_name, negotiate,
+)
 from .utils import UTF8_LOREM_IPSUM_IN_CZECH
 
 
@@ -241,9 +243,43 @@ class MiddlewareTestCase(TestCase):
         self.assertEqual(compressor("text/plain,*/*; charset=utf-8")[0], None)  # PR #12
         self.assertEqual(compressor("gzip;q==1")[0], "gzip")  # questionable
         self.assertEqual(compressor("br;gzip")[0], "br")  # questionable
-#         self.assertEqual(compressor("br;q=0, gzip;q=0.8, *;q=0.1")[0], "gzip")
+        self.assertEqual(compressor("br;q=0, gzip;q=0.8, *;q=0.1")[0], "gzip")
         self.assertEqual(compressor("*")[0], "zstd")
 
+    def test_content_encoding_quality(self):
+        self.assertEqual(compressor("gzip;q=0.9, br;q=0.5")[0], "gzip")
+        self.assertEqual(compressor("gzip;q=0.5, br;q=0.5")[0], "br")
+        self.assertEqual(compressor("GZIP;Q=0.5, br;q=0.4")[0], "gzip")
+        self.assertEqual(compressor("gzip;q=0, br;q=0")[0], None)
+        self.assertEqual(compressor("*;q=0")[0], None)
+        self.assertEqual(compressor("gzip, *;q=0")[0], "gzip")
+        self.assertEqual(compressor("*, zstd;q=0")[0], "br")
+        self.assertEqual(compressor("gzip, identity;q=0")[0], "gzip")
+        self.assertEqual(compressor("gzip;q=0.5, identity")[0], None)
+        self.assertEqual(compressor("gzip, identity")[0], "gzip")
+        self.assertEqual(compressor("gzip;q=nan")[0], "gzip")
+        self.assertEqual(compressor("gzip;q=-1, br;q=2")[0], "br")
+
+    def test_content_encoding_parsing_cached(self):
+        compressor("gzip, deflate, br, cached")
+        hits = negotiate.cache_info().hits
+        self.assertEqual(compressor("gzip, deflate, br, cached")[0], "br")
+        self.assertEqual(negotiate.cache_info().hits, hits + 1)
+
+    def test_encoding_name_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(encoding_name(" br;q=0.5"), "br")
+        with self.assertWarns(DeprecationWarning):
+            self.assertIsNone(encoding_name("gzip;q=0"))
+
+    def test_compressor_tuples(self):
+        self.assertEqual(len(compressor("br")), 3)
+        self.assertEqual(compressor("br"), compressors_for("br")[:3])
+        self.assertEqual(compressor(""), (None, None, None))
+        encoding, _, _, async_stream_func = compressors_for("br")
+        self.assertEqual(encoding, "br")
+        self.assertIsNotNone(async_stream_func)
+
 
 class StreamingTest(SimpleTestCase):
     """
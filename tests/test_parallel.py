@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+import os
+from io import BytesIO
+from unittest import mock
+
+import zstandard as zstd
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import gzip as gzip_module, middleware
+from compression_middleware.gzip import gzip_compress_parallel
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.registry import registry
+from compression_middleware.zstd import zstd_compress_parallel
+
+
+def gzip_decompress(gzipped_string):
+    with gzip.GzipFile(mode="rb", fileobj=BytesIO(gzipped_string)) as f:
+        return f.read()
+
+
+class ParallelCompressionTest(SimpleTestCase):
+
+    content = b"".join(b"line %d, some text\n" % i for i in range(50000))
+
+    def test_gzip(self):
+        compressed = gzip_compress_parallel(self.content, threads=3)
+        self.assertEqual(gzip_decompress(compressed), self.content)
+        # The ratio should be close to serial compression
+        self.assertLess(len(compressed), len(gzip.compress(self.content)) * 1.05)
+
+    def test_gzip_single_member(self):
+        compressed = gzip_compress_parallel(self.content, threads=3)
+        dobj = gzip_module.zlib.decompressobj(31)
+        self.assertEqual(dobj.decompress(compressed), self.content)
+        self.assertTrue(dobj.eof)
+        self.assertEqual(dobj.unused_data, b"")
+
+    def test_gzip_edge_cases(self):
+        for content in (b"", b"a", os.urandom(gzip_module.PARALLEL_BLOCK_SIZE * 2)):
+            self.assertEqual(gzip_decompress(gzip_compress_parallel(content, 2)), content)
+
+    def test_gzip_deterministic(self):
+        self.assertEqual(
+            gzip_compress_parallel(self.content, 2),
+            gzip_compress_parallel(self.content, 4),
+        )
+
+    def test_zstd(self):
+        compressed = zstd_compress_parallel(self.content, threads=3)
+        self.assertEqual(zstd.ZstdDecompressor().decompress(compressed), self.content)
+
+
+@mock.patch.object(middleware, "PARALLEL_THREADS", 2)
+@mock.patch.object(middleware, "PARALLEL_MIN_LEN", 100000)
+class MiddlewareParallelTest(SimpleTestCase):
+
+    content = ParallelCompressionTest.content
+    request_factory = RequestFactory()
+
+    def get_response(self, request):
+        return HttpResponse(self.content)
+
+    def test_gzip(self):
+        req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="gzip")
+        parallel = mock.Mock(wraps=gzip_compress_parallel)
+        with mock.patch.dict(registry.parallel_compressors(), {"gzip": parallel}):
+            r = CompressionMiddleware(self.get_response)(req)
+        parallel.assert_called_once()
+        self.assertEqual(parallel.call_args[1]["threads"], 2)
+        self.assertEqual(gzip_decompress(r.content), self.content)
+        self.assertEqual(r.get("Content-Encoding"), "gzip")
+
+    def test_zstd(self):
+        req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="zstd")
+        r = CompressionMiddleware(self.get_response)(req)
+        self.assertEqual(zstd.ZstdDecompressor().decompress(r.content), self.content)
+        self.assertEqual(r.get("Content-Encoding"), "zstd")
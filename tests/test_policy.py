@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware.levels import LEVELS
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.policy import Policy, compile_policy
+
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+DEFAULTS = Policy(
+    min_len=500,
+    min_improvement=100,
+    encodings=("zstd", "br", "gzip"),
+    levels=LEVELS,
+    flush=None,
+    critical=False,
+    server_timing=False,
+    shared_cache=None,
+    shared_cache_max_entry_bytes=1024,
+    shared_cache_timeout=None,
+    route_max_failures=None,
+    cpu_budget=None,
+    corpus_dir=None,
+    corpus_sample_rate=0.01,
+    corpus_max_bytes=1024,
+)
+
+
+class CompilePolicyTest(SimpleTestCase):
+
+    def test_defaults(self):
+        policy = compile_policy(DEFAULTS)
+        self.assertEqual(policy.min_len, 500)
+        self.assertEqual(policy.encodings, ("zstd", "br", "gzip"))
+        self.assertEqual(dict(policy.levels), LEVELS)
+
+    def test_settings(self):
+        policy = compile_policy(DEFAULTS, {
+            "MIN_LEN": 1000,
+            "MIN_IMPROVEMENT": 50,
+            "ENCODINGS": ["BR", "gzip"],
+            "LEVELS": {"br": 5, "gzip": [9, 5, 3, 1]},
+            "SERVER_TIMING": True,
+            "SHARED_CACHE": "default",
+            "SHARED_CACHE_TIMEOUT": 60,
+            "ROUTE_MAX_FAILURES": 3,
+            "CPU_BUDGET": 0.5,
+            "CORPUS_DIR": "/tmp/corpus",
+            "CORPUS_SAMPLE_RATE": 1,
+        })
+        self.assertEqual(policy.min_len, 1000)
+        self.assertEqual(policy.min_improvement, 50)
+        self.assertEqual(policy.encodings, ("br", "gzip"))
+        self.assertEqual(policy.levels["br"], (5, 5, 5, 0))
+        self.assertEqual(policy.levels["gzip"], (9, 5, 3, 1))
+        self.assertEqual(policy.levels["zstd"], LEVELS["zstd"])
+        self.assertTrue(policy.server_timing)
+        self.assertEqual(policy.shared_cache, "default")
+        self.assertEqual(policy.shared_cache_max_entry_bytes, 1024)
+        self.assertEqual(policy.shared_cache_timeout, 60)
+        self.assertEqual(policy.route_max_failures, 3)
+        self.assertEqual(policy.cpu_budget, 0.5)
+        self.assertEqual(policy.corpus_dir, "/tmp/corpus")
+        self.assertEqual(policy.corpus_sample_rate, 1.0)
+        self.assertEqual(policy.corpus_max_bytes, 1024)
+
+    def test_overrides(self):
+        policy = compile_policy(DEFAULTS, {"LEVELS": {"br": 5}}, levels={"br": 11}, min_len=0)
+        self.assertEqual(policy.levels["br"], (11, 11, 11, 0))
+        self.assertEqual(policy.min_len, 0)
+
+    def test_immutable(self):
+        policy = compile_policy(DEFAULTS)
+        with self.assertRaises(AttributeError):
+            policy.min_len = 0
+        with self.assertRaises(TypeError):
+            policy.levels["br"] = (1, 1, 1, 1)
+
+    def test_invalid_settings(self):
+        for settings in (
+                {"MIN_LENGTH": 1},
+                {"min_len": 1},
+                {"ENCODINGS": ["deflate"]},
+                {"LEVELS": {"deflate": 1}},
+                {"LEVELS": {"br": (1, 2)}},
+                {"SHARED_CACHE": ["default"]},
+                {"ROUTE_MAX_FAILURES": 0},
+                {"CPU_BUDGET": 0},
+                {"CORPUS_SAMPLE_RATE": 2},
+                {"MIN_LEN": "short"}):
+            with self.assertRaises(ImproperlyConfigured):
+                compile_policy(DEFAULTS, settings)
+
+
+class MiddlewarePolicyTest(SimpleTestCase):
+
+    def process(self, accept_encoding="gzip, br, zstd", **options):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = HttpResponse(UTF8_LOREM_IPSUM_IN_CZECH)
+        middleware = CompressionMiddleware(lambda request: response, **options)
+        return middleware.process_response(request, response)
+
+    @override_settings(COMPRESSION_MIDDLEWARE={"ENCODINGS": ["gzip", "br"]})
+    def test_encodings_setting(self):
+        self.assertEqual(self.process()["Content-Encoding"], "gzip")
+        self.assertEqual(self.process("br, zstd")["Content-Encoding"], "br")
+        self.assertFalse(self.process("zstd").has_header("Content-Encoding"))
+
+    @override_settings(COMPRESSION_MIDDLEWARE={"MIN_LEN": 100000})
+    def test_min_len_setting(self):
+        self.assertFalse(self.process().has_header("Content-Encoding"))
+
+    @override_settings(COMPRESSION_MIDDLEWARE={"MIN_LEN": 100000})
+    def test_override(self):
+        response = self.process(min_len=0, encodings=["gzip"])
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(response.content).decode("utf-8"), UTF8_LOREM_IPSUM_IN_CZECH
+        )
+
+    def test_levels(self):
+        middleware = CompressionMiddleware(lambda request: None, levels={"zstd": 19})
+        self.assertEqual(middleware.level_policy.level("zstd", 5000), 19)
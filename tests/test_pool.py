@@ -0,0 +1,90 @@
+# -*- encoding: utf-8 -*-
+
+import threading
+
+import zstandard as zstd
+
+from django.test import SimpleTestCase
+
+from compression_middleware import zstd as zstd_module
+from compression_middleware.pool import ContextPool
+from compression_middleware.zstd import zstd_compress, zstd_compress_stream
+
+
+class ContextPoolTest(SimpleTestCase):
+
+    def test_reuse(self):
+        pool = ContextPool(lambda key: object(), 2)
+        with pool.context(1) as first:
+            pass
+        with pool.context(1) as second:
+            self.assertIs(first, second)
+        with pool.context(2) as other:
+            self.assertIsNot(first, other)
+        self.assertEqual(pool.created, 2)
+
+    def test_max_idle(self):
+        pool = ContextPool(lambda key: object(), 2)
+        contexts = [pool.acquire(1) for i in range(3)]
+        self.assertEqual(pool.created, 3)
+        for context in contexts:
+            pool.release(1, context)
+        self.assertEqual(pool.idle(1), 2)
+
+    def test_not_released_after_exception(self):
+        pool = ContextPool(lambda key: object(), 2)
+        with self.assertRaises(ValueError):
+            with pool.context(1):
+                raise ValueError
+        self.assertEqual(pool.idle(1), 0)
+
+    def test_warm(self):
+        prepared = []
+        pool = ContextPool(lambda key: object(), 2)
+        pool.warm([1, 2], prepared.append)
+        self.assertEqual(len(prepared), 2)
+        self.assertEqual(pool.idle(1), 1)
+        self.assertEqual(pool.idle(2), 1)
+
+    def test_threads(self):
+        pool = ContextPool(lambda key: [], 4)
+        errors = []
+
+        def work():
+            for i in range(1000):
+                with pool.context(1) as context:
+                    context.append(i)
+                    if len(context) != 1:
+                        errors.append(context)
+                    context.pop()
+
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(pool.idle(1), 4)
+
+
+class ZstdPoolTest(SimpleTestCase):
+
+    def test_contexts_reused(self):
+        content = b"abcdefgh" * 1000
+        dctx = zstd.ZstdDecompressor()
+        zstd_compress(content, level=5)
+        created = zstd_module.pool.created
+        for i in range(3):
+            self.assertEqual(dctx.decompress(zstd_compress(content, level=5)), content)
+            compressed = b"".join(zstd_compress_stream([content, content], level=5))
+            self.assertEqual(dctx.decompressobj().decompress(compressed), content * 2)
+        self.assertEqual(zstd_module.pool.created, created)
+
+    def test_abandoned_stream(self):
+        stream = zstd_compress_stream([b"a" * 1000, b"b" * 1000], level=6)
+        next(stream)
+        stream.close()
+        content = b"abcdefgh" * 1000
+        self.assertEqual(
+            zstd.ZstdDecompressor().decompress(zstd_compress(content, level=6)), content
+        )
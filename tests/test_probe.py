@@ -0,0 +1,116 @@
+# -*- encoding: utf-8 -*-
+
+import os
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import middleware
+from compression_middleware import probe as probe_module
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.probe import CompressibilityProbe
+
+
+class CompressibilityProbeTest(SimpleTestCase):
+
+    def test_short_content_not_probed(self):
+        probe = CompressibilityProbe(1000)
+        self.assertIsNone(probe.predict(b"a" * 999, 100))
+        self.assertEqual(probe.probes, 0)
+
+    def test_predict(self):
+        probe = CompressibilityProbe(1000)
+        self.assertTrue(probe.predict(b"abc" * 10000, 100))
+        self.assertFalse(probe.predict(os.urandom(30000), 100))
+        self.assertEqual(probe.stats()["probes"], 2)
+        self.assertEqual(probe.stats()["negatives"], 1)
+
+    def test_record(self):
+        probe = CompressibilityProbe(1000)
+        probe.record(True, True)
+        probe.record(False, False)
+        self.assertEqual(probe.false_positives, 0)
+        self.assertEqual(probe.false_negatives, 0)
+        probe.record(True, False)
+        probe.record(False, True)
+        self.assertEqual(probe.false_positives, 1)
+        self.assertEqual(probe.false_negatives, 1)
+
+    @mock.patch.object(probe_module, "AUDIT_INTERVAL", 3)
+    def test_audit(self):
+        probe = CompressibilityProbe(1000)
+        audits = []
+        for i in range(6):
+            probe.predict(os.urandom(2000), 100)
+            audits.append(probe.audit())
+        self.assertEqual(audits, [False, False, True, False, False, True])
+        self.assertEqual(probe.audits, 2)
+        self.assertEqual(probe.skips, 4)
+
+
+class MiddlewareProbeTest(SimpleTestCase):
+
+    request_factory = RequestFactory()
+
+    def setUp(self):
+        self.req = self.request_factory.get("/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+    def test_incompressible_skipped(self):
+        content = os.urandom(100 * 1024)
+
+        def get_response(request):
+            return HttpResponse(content)
+
+        m = CompressionMiddleware(get_response)
+        with mock.patch.object(m, "compress") as compress:
+            r = m(self.req)
+        compress.assert_not_called()
+        self.assertEqual(r.content, content)
+        self.assertIsNone(r.get("Content-Encoding"))
+        self.assertEqual(m.probe.skips, 1)
+
+    @mock.patch.object(probe_module, "AUDIT_INTERVAL", 1)
+    def test_audited_not_skipped(self):
+        content = os.urandom(100 * 1024)
+        m = CompressionMiddleware(lambda request: HttpResponse(content))
+        with mock.patch.object(m, "compress", return_value=content) as compress:
+            m(self.req)
+        compress.assert_called_once()
+        self.assertEqual(m.probe.audits, 1)
+        self.assertEqual(m.probe.skips, 0)
+
+    @mock.patch.object(probe_module, "AUDIT_INTERVAL", 1)
+    @mock.patch.object(middleware, "STREAM_MIN_LEN", 64 * 1024)
+    def test_audited_streamed(self):
+        content = os.urandom(100 * 1024)
+        m = CompressionMiddleware(lambda request: HttpResponse(content))
+        with mock.patch.object(m.probe, "record") as record:
+            r = m(self.req)
+            self.assertTrue(r.streaming)
+            self.assertEqual(m.probe.audits, 1)
+            b"".join(r.streaming_content)
+        record.assert_called_once_with(False, False)
+
+    @mock.patch.object(middleware, "STREAM_MIN_LEN", 64 * 1024)
+    def test_streamed_recorded(self):
+        content = b"abcdefgh" * 20000
+        m = CompressionMiddleware(lambda request: HttpResponse(content))
+        with mock.patch.object(m.probe, "record") as record:
+            r = m(self.req)
+            self.assertTrue(r.streaming)
+            record.assert_not_called()
+            b"".join(r.streaming_content)
+        record.assert_called_once_with(True, True)
+
+    def test_compressible(self):
+        content = b"abcdefgh" * 20000
+
+        def get_response(request):
+            return HttpResponse(content)
+
+        m = CompressionMiddleware(get_response)
+        r = m(self.req)
+        self.assertEqual(r.get("Content-Encoding"), "br")
+        self.assertEqual(m.probe.probes, 1)
+        self.assertEqual(m.probe.false_positives, 0)
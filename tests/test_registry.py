@@ -0,0 +1,151 @@
+# -*- encoding: utf-8 -*-
+
+import subprocess
+import sys
+import zlib
+from unittest import mock
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import registry as registry_module
+from compression_middleware.gzip import gzip_compress, gzip_compress_stream
+from compression_middleware.middleware import CompressionMiddleware, compressor
+from compression_middleware.registry import CodecRegistry, registry
+
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+# a third-party codec
+def deflate_compress(content, level=None):
+    return zlib.compress(content)
+
+
+def deflate_compress_stream(sequence, level=None):
+    compressobj = zlib.compressobj()
+    for item in sequence:
+        yield compressobj.compress(item)
+    yield compressobj.flush()
+
+
+class FakeEntryPoint(object):
+    name = "fake"
+
+    def __init__(self, func):
+        self.func = func
+
+    def load(self):
+        return self.func
+
+
+class CodecRegistryTest(SimpleTestCase):
+
+    def test_lazy_import(self):
+        # Importing the middleware doesn't import the compression libraries.
+        code = (
+            "import sys; import compression_middleware.middleware; "
+            "print(sorted(m for m in ('brotli', 'zstandard') if m in sys.modules))"
+        )
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), b"[]")
+
+    def test_lazy_import_middleware(self):
+        # Nor does creating the middleware (such as to warm the zstd pool).
+        code = (
+            "import sys; from django.conf import settings; settings.configure(); "
+            "from compression_middleware.middleware import CompressionMiddleware; "
+            "CompressionMiddleware(lambda request: None); "
+            "print(sorted(m for m in ('brotli', 'zstandard') if m in sys.modules))"
+        )
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), b"[]")
+
+    def test_unavailable_codec(self):
+        codecs = CodecRegistry()
+        codecs.register("gzip", gzip_compress, gzip_compress_stream, None)
+        codecs.register("xz", "no_such_module.compress", "no_such_module.stream", None)
+        self.assertEqual(codecs.encodings(), ("gzip", "xz"))
+        self.assertEqual([c[0] for c in codecs.compressors()], ["gzip"])
+
+    def test_resolve(self):
+        codecs = CodecRegistry()
+        codecs.register(
+            "gzip",
+            "compression_middleware.gzip.gzip_compress",
+            gzip_compress_stream,
+            None,
+            parallel="compression_middleware.gzip.gzip_compress_parallel",
+        )
+        [(encoding, bulk, stream, async_stream)] = codecs.compressors()
+        self.assertIs(bulk, gzip_compress)
+        self.assertIs(stream, gzip_compress_stream)
+        self.assertIn("gzip", codecs.parallel_compressors())
+
+    def test_supports_flush(self):
+        codecs = CodecRegistry()
+        codecs.register("gzip", gzip_compress, gzip_compress_stream, None, flush=True)
+        codecs.register("deflate", deflate_compress, deflate_compress_stream, None)
+        self.assertTrue(codecs.supports_flush("gzip"))
+        self.assertFalse(codecs.supports_flush("deflate"))
+        codecs.register("gzip", gzip_compress, gzip_compress_stream, None)
+        self.assertFalse(codecs.supports_flush("gzip"))
+        self.assertTrue(registry.supports_flush("br"))
+
+    def test_entry_points(self):
+        def register(codecs):
+            codecs.register("deflate", deflate_compress, deflate_compress_stream, None)
+
+        def broken(codecs):
+            raise RuntimeError("broken plugin")
+
+        entry_points = [FakeEntryPoint(broken), FakeEntryPoint(register)]
+        with mock.patch.object(registry_module, "_entry_points", return_value=entry_points):
+            codecs = CodecRegistry("test.codecs")
+            self.assertEqual(codecs.encodings(), ("deflate",))
+
+
+class MiddlewareRegistryTest(SimpleTestCase):
+
+    def setUp(self):
+        registry.register("deflate", deflate_compress, deflate_compress_stream, None)
+        self.addCleanup(registry.unregister, "deflate")
+
+    def test_negotiation(self):
+        self.assertEqual(compressor("deflate")[0], "deflate")
+        self.assertEqual(compressor("deflate, gzip")[0], "gzip")
+        registry.unregister("deflate")
+        self.assertEqual(compressor("deflate")[0], None)
+
+    def test_middleware(self):
+        content = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8")
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="deflate")
+        response = CompressionMiddleware(lambda request: None).process_response(
+            request, HttpResponse(content)
+        )
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(zlib.decompress(response.content), content)
+
+    @override_settings(COMPRESSION_MIDDLEWARE={"FLUSH": {"size": 0}})
+    def test_stream_without_flush(self):
+        content = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8")
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="deflate")
+        response = CompressionMiddleware(lambda request: None).process_response(
+            request, StreamingHttpResponse([content, content])
+        )
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(zlib.decompress(b"".join(response.streaming_content)), content * 2)
+
+    def test_warm_on_negotiation(self):
+        warm = mock.Mock()
+        registry.register(
+            "deflate", deflate_compress, deflate_compress_stream, None, warm=warm
+        )
+        m = CompressionMiddleware(lambda request: None, levels={"deflate": [9, 6, 6, 1]})
+        warm.assert_not_called()
+        content = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8")
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="deflate")
+        with mock.patch("compression_middleware.zstd.warm_pool") as warm_pool:
+            m.process_response(request, HttpResponse(content))
+            m.process_response(request, HttpResponse(content))
+        warm.assert_called_once_with([1, 6, 9])
+        warm_pool.assert_not_called()
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+
+import os
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import routes
+from compression_middleware.metrics import Metrics
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.routes import RouteStats, route_key
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RouteStatsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(routes.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.routes = RouteStats(3)
+
+    def fail(self, times=1):
+        for i in range(times):
+            self.routes.record("blobs", 10000, False)
+
+    def test_backoff(self):
+        self.fail(2)
+        self.assertFalse(self.routes.skip("blobs"))
+        self.fail()
+        self.assertTrue(self.routes.skip("blobs"))
+        self.assertFalse(self.routes.skip("pages"))
+        # re-probed once the period is over
+        self.clock.now += routes.BACKOFF
+        self.assertFalse(self.routes.skip("blobs"))
+        # and skipped for twice as long if it still fails
+        self.fail()
+        self.clock.now += routes.BACKOFF
+        self.assertTrue(self.routes.skip("blobs"))
+        self.clock.now += routes.BACKOFF
+        self.assertFalse(self.routes.skip("blobs"))
+        stats = self.routes.stats()["blobs"]
+        self.assertEqual(stats["failures"], 4)
+        self.assertEqual(stats["skips"], 2)
+
+    def test_short_failures_ignored(self):
+        for i in range(5):
+            self.routes.record("blobs", routes.FAILURE_MIN_LEN - 1, False)
+        self.assertFalse(self.routes.skip("blobs"))
+        self.assertEqual(self.routes.stats(), {})
+
+    def test_success_resets(self):
+        self.fail(3)
+        self.clock.now += routes.BACKOFF
+        self.routes.record("blobs", 10000, True)
+        self.fail(2)
+        self.assertFalse(self.routes.skip("blobs"))
+        self.assertEqual(self.routes.stats()["blobs"]["failures"], 2)
+
+    def test_max_routes(self):
+        with mock.patch.object(routes, "MAX_ROUTES", 2):
+            for route in "abc":
+                self.routes.record(route, 10000, True)
+        self.assertEqual(sorted(self.routes.stats()), ["b", "c"])
+
+    def test_route_key(self):
+        request = RequestFactory().get("/blobs/1")
+        self.assertEqual(route_key(request), "/blobs/1")
+        request.resolver_match = mock.Mock(view_name="blob", route="blobs/<int:pk>")
+        self.assertEqual(route_key(request), "blob")
+        request.resolver_match = mock.Mock(view_name="", route="blobs/<int:pk>")
+        self.assertEqual(route_key(request), "blobs/<int:pk>")
+
+
+@override_settings(COMPRESSION_MIDDLEWARE={"ROUTE_MAX_FAILURES": 3})
+class MiddlewareRouteTest(SimpleTestCase):
+
+    def middleware(self, get_response):
+        m = CompressionMiddleware(get_response)
+        m.metrics = Metrics()
+        return m
+
+    def test_disabled_by_default(self):
+        with override_settings(COMPRESSION_MIDDLEWARE=None):
+            self.assertIsNone(CompressionMiddleware(lambda request: None).routes)
+
+    def test_skip_incompressible_route(self):
+        m = self.middleware(lambda request: HttpResponse(os.urandom(5000)))
+        request = RequestFactory().get("/blobs/1", HTTP_ACCEPT_ENCODING="gzip")
+        for i in range(5):
+            self.assertFalse(m(request).has_header("Content-Encoding"))
+        self.assertEqual(m.metrics.skips["improvement"], 3)
+        self.assertEqual(m.metrics.skips["route"], 2)
+        # other routes are still compressed
+        m.get_response = lambda request: HttpResponse(b"a" * 5000)
+        request = RequestFactory().get("/pages/1", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(m(request)["Content-Encoding"], "gzip")
+
+    def test_content_types_apart(self):
+        m = self.middleware(lambda request: HttpResponse(os.urandom(5000)))
+        request = RequestFactory().get("/items", HTTP_ACCEPT_ENCODING="gzip")
+        for i in range(3):
+            m(request)
+        m.get_response = lambda request: HttpResponse(
+            b'{"a": 1}' * 1000, content_type="application/json"
+        )
+        self.assertEqual(m(request)["Content-Encoding"], "gzip")
+
+    def test_short_failures_ignored(self):
+        m = self.middleware(lambda request: HttpResponse(os.urandom(600)))
+        request = RequestFactory().get("/items", HTTP_ACCEPT_ENCODING="gzip")
+        for i in range(5):
+            m(request)
+        self.assertEqual(m.metrics.skips["improvement"], 5)
+        m.get_response = lambda request: HttpResponse(b"a" * 50000)
+        self.assertEqual(m(request)["Content-Encoding"], "gzip")
@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+import django
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from compression_middleware import middleware, tune
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.sampler import CorpusSampler, read_corpus
+
+
+class CorpusSamplerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_sample(self):
+        sampler = CorpusSampler(self.directory, 1.0, 1000)
+        self.assertTrue(sampler.sample([b"ab", b"c"], "text/html", "home"))
+        [(meta, path)] = list(read_corpus(self.directory))
+        self.assertEqual(meta, {"route": "home", "content_type": "text/html", "length": 3})
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"abc")
+
+    def test_duplicates_stored_once(self):
+        sampler = CorpusSampler(self.directory, 1.0, 1000)
+        sampler.sample([b"abc"], "text/html", "home")
+        sampler.sample([b"abc"], "text/html", "home")
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(sampler.size, 3)
+
+    def test_rate(self):
+        sampler = CorpusSampler(self.directory, 0.5, 1000)
+        with mock.patch("random.random", return_value=0.7):
+            self.assertFalse(sampler.sample([b"abc"], "text/html", "home"))
+        with mock.patch("random.random", return_value=0.2):
+            self.assertTrue(sampler.sample([b"abc"], "text/html", "home"))
+
+    def test_max_bytes(self):
+        sampler = CorpusSampler(self.directory, 1.0, 5)
+        self.assertTrue(sampler.sample([b"abc"], "text/html", "home"))
+        self.assertFalse(sampler.sample([b"def"], "text/html", "home"))
+        # the existing corpus is counted by a new sampler
+        self.assertEqual(CorpusSampler(self.directory, 1.0, 5).size, 3)
+
+
+class MiddlewareSamplerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(COMPRESSION_MIDDLEWARE={
+            "CORPUS_DIR": self.directory, "CORPUS_SAMPLE_RATE": 1.0,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.req = RequestFactory().get("/page", HTTP_ACCEPT_ENCODING="gzip")
+
+    def test_sampled_uncompressed(self):
+        body = b"a" * 1000
+        r = CompressionMiddleware(lambda request: HttpResponse(body))(self.req)
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        [(meta, path)] = list(read_corpus(self.directory))
+        self.assertEqual(meta["route"], "/page")
+        self.assertEqual(meta["content_type"], "text/html; charset=utf-8")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), body)
+
+    def test_not_sampled(self):
+        CompressionMiddleware(lambda request: HttpResponse(b"a"))(self.req)
+        m = CompressionMiddleware(lambda request: StreamingHttpResponse([b"a" * 1000]))
+        b"".join(m(self.req))
+        self.assertEqual(list(read_corpus(self.directory)), [])
+
+    @skipIf(django.VERSION < (3, 1), "Async middleware requires Django 3.1")
+    async def test_sampled_async(self):
+        async def get_response(request):
+            return HttpResponse(b"a" * 1000)
+
+        with mock.patch.object(middleware, "sync_to_async", wraps=middleware.sync_to_async) as s:
+            await CompressionMiddleware(get_response)(self.req)
+        self.assertEqual(s.call_args_list[0][0][0].__name__, "write")
+        self.assertEqual(len(list(read_corpus(self.directory))), 1)
+
+
+class SamplerWriteErrorTest(SimpleTestCase):
+
+    def test_size_rolled_back(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sampler = CorpusSampler(directory, 1.0, 1000)
+        with mock.patch("compression_middleware.sampler._write", side_effect=OSError):
+            self.assertFalse(sampler.sample([b"abc"], "text/html", "home"))
+        self.assertEqual(sampler.size, 0)
+
+
+class TuneTest(SimpleTestCase):
+
+    def test_recommend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sampler = CorpusSampler(directory, 1.0, 100000)
+        sampler.sample([b"<p>hello</p>" * 500], "text/html", "home")
+        sampler.sample([b'{"a": 1}' * 500], "application/json", "api")
+        with mock.patch.dict(tune.LEVELS, {"br": (1, 5), "gzip": (1, 6), "zstd": (1, 3)}):
+            totals = tune.evaluate(read_corpus(directory), ["br", "gzip"], 1)
+        self.assertEqual(
+            sorted(totals), ["all", "content_type:application/json", "content_type:text/html",
+                             "route:api", "route:home"],
+        )
+        self.assertEqual(set(totals["all"]), {("br", 1), ("br", 5), ("gzip", 1), ("gzip", 6)})
+        # When CPU time is free, the best compression wins.
+        recommendations = tune.recommend(totals, 0)
+        self.assertEqual(
+            recommendations["all"]["br"]["ratio"],
+            min(out / in_ for in_, out, _ in (totals["all"][("br", l)] for l in (1, 5))),
+        )
@@ -0,0 +1,141 @@
+# -*- encoding: utf-8 -*-
+
+import gzip
+import os
+import threading
+from unittest import mock, skipIf
+
+import brotli
+import django
+import zstandard as zstd
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from compression_middleware import middleware
+from compression_middleware.middleware import CompressionMiddleware
+from compression_middleware.streaming import (
+    content_chunks, content_length, content_prefix,
+)
+
+from .utils import UTF8_LOREM_IPSUM_IN_CZECH
+
+
+CONTENT = UTF8_LOREM_IPSUM_IN_CZECH.encode("utf-8") * 10
+
+
+@mock.patch.object(middleware, "STREAM_MIN_LEN", 10 * 1024)
+@mock.patch.object(middleware, "STREAM_CHUNK_SIZE", 4 * 1024)
+class BigResponseTest(SimpleTestCase):
+
+    def process(self, response, accept_encoding="br"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response).process_response(
+            request, response
+        )
+
+    def test_streamed(self):
+        response = HttpResponse(CONTENT, status=201, content_type="text/plain")
+        response["ETag"] = '"abc"'
+        response.set_cookie("flavour", "chocolate")
+        response = self.process(response)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+        self.assertEqual(response.cookies["flavour"].value, "chocolate")
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), CONTENT)
+
+    def test_written_chunks(self):
+        response = HttpResponse(content_type="text/plain")
+        for line in CONTENT.splitlines(True):
+            response.write(line)
+        response = self.process(response, "zstd")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(zstd.ZstdDecompressor().decompressobj().decompress(content), CONTENT)
+
+    def test_small_response_not_streamed(self):
+        response = self.process(HttpResponse(CONTENT[:5000]))
+        self.assertFalse(response.streaming)
+        self.assertEqual(brotli.decompress(response.content), CONTENT[:5000])
+
+    @skipIf(django.VERSION < (4, 2), "Async iterators require Django 4.2")
+    async def test_streamed_async(self):
+        async def get_response(request):
+            return HttpResponse(CONTENT, content_type="text/plain")
+
+        threads = set()
+
+        def chunks(response, size):
+            for chunk in content_chunks(response, size):
+                threads.add(threading.get_ident())
+                yield chunk
+
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br")
+        with mock.patch.object(middleware, "content_chunks", chunks):
+            response = await CompressionMiddleware(get_response)(request)
+            self.assertTrue(response.is_async)
+            content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(brotli.decompress(content), CONTENT)
+        # compressed in worker threads, not on the event loop
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    @mock.patch.object(middleware, "PROBE_MIN_LEN", 1024)
+    def test_incompressible(self):
+        content = os.urandom(len(CONTENT))
+        response = self.process(HttpResponse(content))
+        self.assertFalse(response.streaming)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, content)
+
+
+class ChunkedContentTest(SimpleTestCase):
+    """Bulk responses written in parts are compressed without joining them."""
+
+    def process(self, accept_encoding):
+        response = HttpResponse(content_type="text/plain")
+        for line in CONTENT.splitlines(True):
+            response.write(line)
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response).process_response(
+            request, response
+        )
+
+    def test_brotli(self):
+        response = self.process("br")
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(brotli.decompress(response.content), CONTENT)
+
+    def test_zstd(self):
+        response = self.process("zstd")
+        dctx = zstd.ZstdDecompressor().decompressobj()
+        self.assertEqual(dctx.decompress(response.content), CONTENT)
+
+    def test_gzip(self):
+        response = self.process("gzip")
+        self.assertEqual(gzip.decompress(response.content), CONTENT)
+
+
+class ContentTest(SimpleTestCase):
+
+    def setUp(self):
+        self.response = HttpResponse()
+        self.response.write(b"abc")
+        self.response.write(b"defgh")
+
+    def test_length(self):
+        self.assertEqual(content_length(self.response), 8)
+
+    def test_prefix(self):
+        self.assertEqual(content_prefix(self.response, 5), b"abcde")
+        self.assertEqual(content_prefix(self.response, 100), b"abcdefgh")
+
+    def test_chunks(self):
+        chunks = content_chunks(self.response, 2)
+        self.assertEqual(bytes(next(chunks)), b"ab")
+        self.assertEqual([bytes(c) for c in chunks], [b"c", b"de", b"fg", b"h"])
+        # the response gave up its content
+        self.assertEqual(content_length(self.response), 0)
@@ -0,0 +1,245 @@
+# -*- encoding: utf-8 -*-
+
+import asyncio
+import gzip
+import os
+
+import brotli
+
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+
+from compression_middleware.wrappers import ASGICompressionWrapper, WSGICompressionWrapper
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def asgi_app(body_parts, headers=((b"content-type", b"text/html"),), status=200):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": list(headers)})
+        for i, part in enumerate(body_parts):
+            await send({
+                "type": "http.response.body",
+                "body": part,
+                "more_body": i < len(body_parts) - 1,
+            })
+    return app
+
+
+class ASGIWrapperTest(SimpleTestCase):
+
+    compressible = b"a" * 1000
+
+    def call(self, app, accept_encoding=b"br", method="GET", **options):
+        scope = {
+            "type": "http",
+            "method": method,
+            "headers": [(b"accept-encoding", accept_encoding)],
+        }
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        run(ASGICompressionWrapper(app, **options)(scope, None, send))
+        start = messages[0]
+        headers = {k.decode(): v.decode() for k, v in start["headers"]}
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        self.assertFalse(messages[-1].get("more_body", False))
+        return start["status"], headers, body, messages
+
+    def test_bulk(self):
+        status, headers, body, _ = self.call(asgi_app([self.compressible]))
+        self.assertEqual(headers["content-encoding"], "br")
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+        self.assertEqual(headers["content-length"], str(len(body)))
+        self.assertEqual(brotli.decompress(body), self.compressible)
+
+    def test_stream(self):
+        app = asgi_app(
+            [b"a" * 300, b"b" * 300, b"c" * 300],
+            headers=[(b"content-type", b"text/html"), (b"content-length", b"900"),
+                     (b"etag", b'"x"')],
+        )
+        status, headers, body, messages = self.call(app, b"gzip")
+        self.assertEqual(headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", headers)
+        self.assertEqual(headers["etag"], 'W/"x"')
+        self.assertEqual(gzip.decompress(body), b"a" * 300 + b"b" * 300 + b"c" * 300)
+
+    def test_stream_flush(self):
+        app = asgi_app([b"a" * 300, b"b" * 300, b""])
+        _, _, body, messages = self.call(app, b"gzip", flush={"size": 0})
+        chunks = [m["body"] for m in messages[1:] if m["body"]]
+        self.assertEqual(gzip.decompress(b"".join(chunks)), b"a" * 300 + b"b" * 300)
+        self.assertGreaterEqual(len(chunks), 2)
+
+    def test_skipped(self):
+        # too short
+        _, headers, body, _ = self.call(asgi_app([b"a" * 10]))
+        self.assertNotIn("content-encoding", headers)
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+        self.assertEqual(body, b"a" * 10)
+        # no encoding in common
+        _, headers, body, _ = self.call(asgi_app([self.compressible]), b"identity")
+        self.assertNotIn("content-encoding", headers)
+        self.assertEqual(body, self.compressible)
+        # excluded content type
+        app = asgi_app([self.compressible], headers=[(b"content-type", b"image/png")])
+        _, headers, body, _ = self.call(app)
+        self.assertEqual(headers, {"content-type": "image/png"})
+        # no content
+        _, headers, _, _ = self.call(asgi_app([b""], status=304))
+        self.assertNotIn("content-encoding", headers)
+        # HEAD
+        _, headers, _, _ = self.call(asgi_app([self.compressible]), method="HEAD")
+        self.assertNotIn("content-encoding", headers)
+
+    def test_lifespan_passed_through(self):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        run(ASGICompressionWrapper(app)({"type": "lifespan"}, None, None))
+        self.assertEqual(scopes, [{"type": "lifespan"}])
+
+    def test_app_error(self):
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"a" * 1000, "more_body": True})
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            self.call(app)
+
+
+class WSGIWrapperTest(SimpleTestCase):
+
+    compressible = b"a" * 1000
+
+    def call(self, app, accept_encoding="br", **options):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+
+        environ = {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": accept_encoding}
+        result = WSGICompressionWrapper(app, **options)(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        status, headers = started[0]
+        return status, dict(headers), body
+
+    def test_bulk(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "1000")])
+            return [self.compressible]
+
+        status, headers, body = self.call(app)
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(headers["Content-Encoding"], "br")
+        self.assertEqual(headers["Content-Length"], str(len(body)))
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertEqual(brotli.decompress(body), self.compressible)
+
+    def test_stream(self):
+        closed = []
+
+        class Result(object):
+            def __iter__(self):
+                yield b"a" * 500
+                yield b"b" * 500
+
+            def close(self):
+                closed.append(True)
+
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain"), ("Vary", "Cookie")])
+            return Result()
+
+        status, headers, body = self.call(app, "gzip")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(headers["Vary"], "Cookie, Accept-Encoding")
+        self.assertEqual(gzip.decompress(body), b"a" * 500 + b"b" * 500)
+        self.assertEqual(closed, [True])
+
+    def test_lazy_start_response(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            yield self.compressible
+
+        status, headers, body = self.call(app)
+        self.assertEqual(headers["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(body), self.compressible)
+
+    def test_content_length_in_bulk(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "1000")])
+            yield self.compressible[:500]
+            yield self.compressible[500:]
+
+        status, headers, body = self.call(app)
+        self.assertEqual(headers["Content-Length"], str(len(body)))
+        self.assertEqual(brotli.decompress(body), self.compressible)
+
+    def test_skipped(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Encoding", "br")])
+            return [self.compressible]
+
+        status, headers, body = self.call(app)
+        self.assertEqual(headers, {"Content-Type": "text/plain", "Content-Encoding": "br"})
+        self.assertEqual(body, self.compressible)
+
+    def test_not_worthwhile(self):
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [self.compressible]
+
+        status, headers, body = self.call(app, min_improvement=1000)
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertEqual(body, self.compressible)
+
+
+class DjangoWSGIWrapperTest(SimpleTestCase):
+
+    def call(self, response):
+        started = []
+
+        def app(environ, start_response):
+            start_response(
+                "%d %s" % (response.status_code, response.reason_phrase),
+                list(response.items()),
+            )
+            return response
+
+        def start_response(status, headers, exc_info=None):
+            started.append(dict(headers))
+
+        environ = {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip"}
+        result = WSGICompressionWrapper(app)(environ, start_response)
+        body = b"".join(result)
+        return started[0], body
+
+    def test_http_response(self):
+        response = HttpResponse(b"a" * 1000)
+        closed = []
+        response._resource_closers.append(lambda: closed.append(True))
+        headers, body = self.call(response)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(headers["Content-Length"], str(len(body)))
+        self.assertEqual(gzip.decompress(body), b"a" * 1000)
+        self.assertEqual(closed, [True])
+
+    def test_http_response_not_worthwhile(self):
+        content = os.urandom(1000)
+        headers, body = self.call(HttpResponse(content))
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(body, content)